@@ -6,6 +6,32 @@ const byte PIN_MAX = 17;
 
 const unsigned long RESOLUTION = 40; //Microsecond resolution for notes
 
+//Control messages start with this byte (no pin has this number)
+const byte CONTROL = 100;
+
+//Control message to switch the baud rate: CONTROL, CMD_BAUD, index into BAUD_RATES
+const byte CMD_BAUD = 5;
+
+//Sent when ready after power up and after switching the baud rate (at the new rate)
+const byte ACK = 100;
+
+const unsigned long BAUD_RATES[] =
+{
+    9600, 19200, 38400, 57600, 115200, 250000, 500000, 1000000
+};
+
+//Control message asking for fine periods, confirmed with ACK by firmware knowing them
+const byte CMD_FINE = 6;
+
+//Set on the pin of a frame carrying a fine period (half period in ticks as 12.4 fixed
+//point) instead of a period in whole ticks
+const byte FINE = 0x40;
+const byte FRACTION_BITS = 4;
+
+//Periods are counted in 1/16 ticks, so the tick count never overflows below this
+const unsigned int TICK_STEP = 1 << FRACTION_BITS;
+const unsigned int MAX_PERIOD = 0xFFFF - TICK_STEP;
+
 /*NOTE: Many of the arrays below contain unused indexes.  This is
  to prevent the Arduino from having to convert a pin input to an alternate
  array index and save as many cycles as possible.  In other words information
@@ -37,13 +63,14 @@ int currentState[] =
 };
 
 //Current period assigned to each pin.  0 = off.  Each period is of the length specified by the RESOLUTION
-//variable above.  i.e. A period of 10 is (RESOLUTION x 10) microseconds long.
+//variable above in 1/TICK_STEP.  i.e. A period of 160 is (RESOLUTION x 10) microseconds long.
+//The fraction is kept by counting on from the overshoot, so the pitch is right on average.
 unsigned int currentPeriod[] =
 {
     0, 0 , 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
 };
 
-//Current tick
+//Current tick (in 1/TICK_STEP)
 unsigned int currentTick[] =
 {
     0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
@@ -52,6 +79,7 @@ unsigned int currentTick[] =
 void tick();
 void togglePin(byte pin, byte direction_pin);
 void reset();
+void setPeriod(byte pin, unsigned int period);
 
 //Setup pins (Even-odd pairs for step control and direction
 void setup()
@@ -81,6 +109,7 @@ void setup()
     Timer1.attachInterrupt(tick); 	// Attach the tick function
 
     Serial.begin(9600);
+    Serial.write(ACK);
 }
 
 void loop()
@@ -89,7 +118,7 @@ void loop()
     if(Serial.available() > 2)
     {
         // Watch for special 100-message to act on
-        if (Serial.peek() == 100)
+        if (Serial.peek() == CONTROL)
         {
             // Clear the peeked 100 byte so we can get the following data packet
             Serial.read();
@@ -102,6 +131,25 @@ void loop()
             case 3:
             case 4:
                 break;
+            case CMD_BAUD:
+            {
+                byte rate = Serial.read();
+
+                if (rate < sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]))
+                {
+                    // Give the host time to switch too, then confirm at the
+                    // new rate
+                    Serial.flush();
+                    Serial.end();
+                    Serial.begin(BAUD_RATES[rate]);
+                    delay(50);
+                    Serial.write(ACK);
+                }
+                break;
+            }
+            case CMD_FINE:
+                Serial.write(ACK);
+                break;
             default:
                 reset();
                 break;
@@ -114,7 +162,17 @@ void loop()
         }
         else
         {
-            currentPeriod[Serial.read()] = (Serial.read() << 8) | Serial.read();
+            byte pin = Serial.read();
+            unsigned int period = (Serial.read() << 8) | Serial.read();
+
+            if (pin & FINE)
+            {
+                setPeriod(pin & ~FINE, min(period, MAX_PERIOD));
+            }
+            else
+            {
+                setPeriod(pin, min(period, MAX_PERIOD >> FRACTION_BITS) << FRACTION_BITS);
+            }
         }
     }
 }
@@ -130,74 +188,74 @@ void tick()
      */
     if (currentPeriod[2]>0)
     {
-        currentTick[2]++;
+        currentTick[2]+=TICK_STEP;
         if (currentTick[2] >= currentPeriod[2])
         {
             togglePin(2,3);
-            currentTick[2]=0;
+            currentTick[2]-=currentPeriod[2];
         }
     }
     if (currentPeriod[4]>0)
     {
-        currentTick[4]++;
+        currentTick[4]+=TICK_STEP;
         if (currentTick[4] >= currentPeriod[4])
         {
             togglePin(4,5);
-            currentTick[4]=0;
+            currentTick[4]-=currentPeriod[4];
         }
     }
     if (currentPeriod[6]>0)
     {
-        currentTick[6]++;
+        currentTick[6]+=TICK_STEP;
         if (currentTick[6] >= currentPeriod[6])
         {
             togglePin(6,7);
-            currentTick[6]=0;
+            currentTick[6]-=currentPeriod[6];
         }
     }
     if (currentPeriod[8]>0)
     {
-        currentTick[8]++;
+        currentTick[8]+=TICK_STEP;
         if (currentTick[8] >= currentPeriod[8])
         {
             togglePin(8,9);
-            currentTick[8]=0;
+            currentTick[8]-=currentPeriod[8];
         }
     }
     if (currentPeriod[10]>0)
     {
-        currentTick[10]++;
+        currentTick[10]+=TICK_STEP;
         if (currentTick[10] >= currentPeriod[10])
         {
             togglePin(10,11);
-            currentTick[10]=0;
+            currentTick[10]-=currentPeriod[10];
         }
     }
     if (currentPeriod[12]>0)
     {
-        currentTick[12]++;
+        currentTick[12]+=TICK_STEP;
         if (currentTick[12] >= currentPeriod[12])
         {
             togglePin(12,13);
-            currentTick[12]=0;
+            currentTick[12]-=currentPeriod[12];
         }
     }
     if (currentPeriod[14]>0)
     {
-        currentTick[14]++;
+        currentTick[14]+=TICK_STEP;
         if (currentTick[14] >= currentPeriod[14])
         {
             togglePin(14,15);
-            currentTick[14]=0;
+            currentTick[14]-=currentPeriod[14];
         }
     }
     if (currentPeriod[16]>0)
     {
-        currentTick[16]++;
+        currentTick[16]+=TICK_STEP;
         if (currentTick[16] >= currentPeriod[16])
         {
             togglePin(16,17);
-            currentTick[16]=0;
+            currentTick[16]-=currentPeriod[16];
         }
     }
 
@@ -232,6 +290,25 @@ void togglePin(byte pin, byte direction_pin)
     currentState[pin] = ~currentState[pin];
 }
 
+//Sets the period of a pin, safe against the timer interrupt
+void setPeriod(byte pin, unsigned int period)
+{
+    if (pin < FIRST_PIN || pin > PIN_MAX)
+    {
+        return;
+    }
+
+    noInterrupts();
+    currentPeriod[pin] = period;
+
+    // Don't catch up on a longer period played before
+    if (currentTick[pin] >= period)
+    {
+        currentTick[pin] = 0;
+    }
+    interrupts();
+}
+
 //Resets all the pins
 void reset()
 {
@@ -200,4 +200,66 @@ def create_period_table(output, tick_speed=80, null_octaves=None):
 		f.write("\n")
 		f.write("#endif")
 
+def create_python_table(output, tick_us=40, fraction_bits=4, bend_range=2,
+						bend_steps=32):
+
+	# half periods of all 128 notes in timer ticks of the Arduino firmware
+	# as fixed point, so high notes keep their pitch
+	note_periods = []
+
+	for f in midi_note_freq[:128]:
+		note_periods.append(int(round(1000000 / f / 2 / tick_us *
+									  (1 << fraction_bits))))
+
+	# period factors (16.16 fixed point) for pitch bends from -bend_range to
+	# bend_range semitones in 1 / bend_steps semitone steps
+	bend_factors = []
+
+	for k in range(-bend_range * bend_steps, bend_range * bend_steps + 1):
+		bend_factors.append(int(round(2 ** (-k / (12.0 * bend_steps)) *
+									  65536)))
+
+	def write_list(f, name, values, comments=None):
+
+		f.write("%s = [\n" % name)
+
+		for i in range(0, len(values), 8):
+			l = "    " + ", ".join("%5d" % v for v in values[i:i + 8])
+
+			if i + 8 < len(values):
+				l += ","
+
+			if comments is not None:
+				l = "%-52s  # %s" % (l, comments(i))
+
+			f.write(l.rstrip() + "\n")
+
+		f.write("]\n")
+
+	with open(output, "w") as f:
+
+		f.write("# Generated by moppy-kmod/scripts/genmidiperiods.py, "
+				"do not edit.\n")
+		f.write("#\n")
+		f.write("# NOTE_PERIODS - half period of each MIDI note in timer "
+				"ticks of the\n")
+		f.write("#                firmware, fixed point with FRACTION_BITS\n")
+		f.write("# BEND_FACTORS - period factors (16.16 fixed point) for "
+				"pitch bends of\n")
+		f.write("#                -BEND_RANGE to BEND_RANGE semitones in "
+				"BEND_STEPS per\n")
+		f.write("#                semitone, no bend is at "
+				"BEND_RANGE * BEND_STEPS\n")
+		f.write("\n")
+		f.write("TICK_US = %d\n" % tick_us)
+		f.write("FRACTION_BITS = %d\n" % fraction_bits)
+		f.write("BEND_RANGE = %d\n" % bend_range)
+		f.write("BEND_STEPS = %d\n" % bend_steps)
+		f.write("\n")
+		write_list(f, "NOTE_PERIODS", note_periods,
+				   lambda i: "notes %3d - %3d" % (i, i + 7))
+		f.write("\n")
+		write_list(f, "BEND_FACTORS", bend_factors)
+
 create_period_table("src/midi.h", 80, [-5, -4, 1, 2, 3, 4, 5])
+create_python_table("../moppy-python/src/moppy/periods.py")
@@ -20,11 +20,15 @@
 #include <linux/gpio.h>
 #include <linux/delay.h>
 #include <linux/hrtimer.h>
+#include <linux/spinlock.h>
 
 #include "midi.h"
 
 static struct hrtimer hr_timer;
 
+/* protects channel periods against concurrent bulk updates */
+static DEFINE_SPINLOCK(channel_lock);
+
 #define PERIOD              40000       // 25kHZ (40usec)
 #define FREQ_FACT           80          // (PERIOD / 1000) * 2
 #define LOW                 0
@@ -35,6 +39,8 @@ static struct hrtimer hr_timer;
 #define MAX_CHANNEL          7
 #define MAX_DRIVE_POS       158         // for 3.5" floppy
 
+#define MAX_BULK            64          // max. updates per bulk write
+
 /**
  * Definition of a single channel.
  */
@@ -156,15 +162,31 @@ enum hrtimer_restart tick(struct hrtimer *timer_for_restart)
 
     hrtimer_forward(timer_for_restart, currtime, interval);
 
+    spin_lock(&channel_lock);
+
     for(i = 0; i <= MAX_CHANNEL; i++) {
         if(channels[i].period > 0 && ++channels[i].period_current >= channels[i].period) {
             update_channel(i);
         }
     }
 
+    spin_unlock(&channel_lock);
+
     return HRTIMER_RESTART;
 }
 
+/**
+ * Convert a frequency in Hz to a period in timer ticks.
+ */
+static unsigned int freq_to_period(int value)
+{
+    if(value > 0) {
+        return (1000000 / value) / FREQ_FACT;
+    }
+
+    return 0;
+}
+
 /**
  * Handle writes to the sysfs entry 'ticks'.
  *
@@ -234,14 +256,10 @@ static ssize_t sysfs_freq_store(struct kobject *kobj, struct kobj_attribute *att
 {
     int channel = 0;
     int value = 0;
-    int period = 0;
 
     if(sscanf(buf, "%d, %d", &channel, &value) == 2) {
         if(channel >= 0 && channel <= MAX_CHANNEL) {
-          if(value > 0) {
-            period = (1000000 / value) / FREQ_FACT;
-          }
-          channels[channel].period = (int)(period);
+          channels[channel].period = freq_to_period(value);
         } else {
             printk(KERN_ERR "moppy: invalid channel number %d\n", channel);
         }
@@ -267,6 +285,84 @@ static ssize_t sysfs_ctrl_store(struct kobject *kobj, struct kobj_attribute *att
 }
 static struct kobj_attribute ctrl_attribute = __ATTR(ctrl, (S_IWUSR | S_IWGRP), NULL, sysfs_ctrl_store);
 
+/**
+ * Handle writes to the sysfs entry 'bulk'.
+ *
+ * Format is one update per line: <type> <channel>, <value>
+ *
+ * Where type is one of 'n' (MIDI note), 'f' (frequency) or 't' (ticks).
+ * All updates of a single write are applied at once, between two timer
+ * ticks. Invalid lines are skipped like invalid writes to the other
+ * entries, the valid ones are still applied.
+ *
+ * E.g. A4 to channel 0, C5 to channel 1 and stop channel 2
+ *
+ *  printf "n 0, 69\nn 1, 72\nf 2, 0" > /sys/kernel/moppy/bulk
+ */
+static ssize_t sysfs_bulk_store(struct kobject *kobj, struct kobj_attribute *attr, const char *buf, size_t count)
+{
+    int channel[MAX_BULK];
+    unsigned int period[MAX_BULK];
+    int updates = 0;
+    int value = 0;
+    int i = 0;
+    char type = 0;
+    const char *line = buf;
+    const char *end = buf + count;
+    unsigned long flags;
+
+    while(line < end) {
+        if(*line == '\n' || *line == ' ') {
+            line++;
+            continue;
+        }
+
+        if(updates == MAX_BULK) {
+            printk(KERN_ERR "moppy: too many updates in bulk command\n");
+            break;
+        }
+
+        if(sscanf(line, "%c %d, %d", &type, &channel[updates], &value) != 3) {
+            printk(KERN_ERR "moppy: received invalid coammnd\n");
+        } else if(channel[updates] < 0 || channel[updates] > MAX_CHANNEL) {
+            printk(KERN_ERR "moppy: invalid channel number %d\n", channel[updates]);
+        } else {
+            switch(type) {
+            case 'n':
+                if(value < 0 || value > 127) {
+                    printk(KERN_ERR "moppy: invalid note %d\n", value);
+                } else {
+                    period[updates++] = midi_note_period[value];
+                }
+                break;
+            case 'f':
+                period[updates++] = freq_to_period(value);
+                break;
+            case 't':
+                period[updates++] = value;
+                break;
+            default:
+                printk(KERN_ERR "moppy: invalid bulk type '%c'\n", type);
+            }
+        }
+
+        while(line < end && *line != '\n') {
+            line++;
+        }
+    }
+
+    spin_lock_irqsave(&channel_lock, flags);
+
+    for(i = 0; i < updates; i++) {
+        channels[channel[i]].period = period[i];
+    }
+
+    spin_unlock_irqrestore(&channel_lock, flags);
+
+    return count;
+}
+static struct kobj_attribute bulk_attribute = __ATTR(bulk, (S_IWUSR | S_IWGRP), NULL, sysfs_bulk_store);
+
 /**
  * Get some basic information about the setup.
  *
@@ -296,6 +392,7 @@ static struct attribute *attrs[] = {
     &freq_attribute.attr,
     &ctrl_attribute.attr,
 		&info_attribute.attr,
+    &bulk_attribute.attr,
     NULL,
 };
 
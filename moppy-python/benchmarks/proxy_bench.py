@@ -0,0 +1,331 @@
+#!/bin/env python3
+
+import multiprocessing
+import threading
+import argparse
+import platform
+import tempfile
+import logging
+import socket
+import struct
+import json
+import time
+import pty
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+from moppy import proxy, version, mtf  # noqa: E402
+
+
+def make_frame(seq):
+
+    # pins 2..16 like MoppyDesk, the value carries the sequence number
+    return struct.pack("!BH", 2 + (seq % 8) * 2, seq & 0xffff)
+
+
+def frame_seq(frame, base):
+
+    # recover the full sequence number from its lower 16 bit
+    value = struct.unpack("!BH", frame)[1]
+
+    return base + ((value - base) & 0xffff)
+
+
+def pace(count, rate, sent, send):
+
+    start = time.monotonic()
+
+    for i in range(count):
+
+        if rate > 0:
+            delay = start + i / float(rate) - time.monotonic()
+
+            if delay > 0.0005:
+                time.sleep(delay)
+
+        sent[i] = time.monotonic()
+        send(i)
+
+
+def pty_sender(path, count, rate, sent):
+
+    fd = os.open(path, os.O_WRONLY)
+
+    pace(count, rate, sent, lambda i: os.write(fd, make_frame(i)))
+
+    os.close(fd)
+
+
+def udp_sender(host, port, count, rate, sent):
+
+    writer = proxy.UdpWriter(host, port)
+
+    def send(i):
+        writer.write_msg(make_frame(i))
+
+        if hasattr(writer, "flush"):
+            writer.flush()
+
+    pace(count, rate, sent, send)
+
+
+class TimingWriter:
+
+    def __init__(self, inner, count):
+
+        self.inner = inner
+        self.count = count
+        self.proxy = None
+        self.received = [0.0] * count
+        self.seen = 0
+        self.base = 0
+        self.last = None
+
+    def write_msg(self, msg):
+
+        if self.inner is not None:
+            self.inner.write_msg(msg)
+
+        now = time.monotonic()
+
+        for frame in proxy.split_frames(msg):
+
+            seq = frame_seq(frame, self.base)
+
+            if seq < self.count:
+                self.received[seq] = now
+                self.base = max(self.base, seq - 0x7fff)
+
+            self.seen += 1
+
+        self.last = now
+
+        if self.seen >= self.count:
+            self.proxy.stop()
+
+    def __str__(self):
+        return 'timingw'
+
+
+class PtyDrain(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.master, self.slave = pty.openpty()
+        self.devnull = os.open(os.devnull, os.O_WRONLY)
+
+    @property
+    def name(self):
+        return os.ttyname(self.slave)
+
+    def run(self):
+
+        while True:
+            try:
+                os.write(self.devnull, os.read(self.master, 4096))
+            except OSError:
+                break
+
+
+def make_writer(kind, workdir):
+
+    if kind == "memory":
+        return None
+
+    if kind == "sysfs":
+        path = os.path.join(workdir, "sysfs") + "/"
+
+        if not os.path.isdir(path):
+            os.mkdir(path)
+            for attr in ["note", "freq", "ticks", "ctrl"]:
+                os.symlink(os.devnull, os.path.join(path, attr))
+
+        return proxy.SysfsWriter(path)
+
+    if kind == "serial":
+        drain = PtyDrain()
+        drain.start()
+
+        return proxy.SerialWriter(drain.name)
+
+    raise ValueError("Invalid writer: %s" % kind)
+
+
+def write_recording(path, count, rate):
+
+    step = 1.0 / rate if rate else 0.0
+
+    recording = mtf.MtfWriter(path)
+
+    for i in range(count):
+        pin, value = struct.unpack("!BH", make_frame(i))
+        recording.write(pin, value, i * step)
+
+    recording.close()
+
+
+def percentile(samples, p):
+
+    if not len(samples):
+        return 0.0
+
+    samples = sorted(samples)
+
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+
+def run_case(reader_kind, writer_kind, count, rate, workdir):
+
+    sent = multiprocessing.Array('d', count, lock=False)
+    sender = None
+    expected = None
+
+    if reader_kind == "pty":
+        path = os.path.join(workdir, "pty")
+        reader = proxy.PtyReader(path)
+        sender = multiprocessing.Process(target=pty_sender,
+                                         args=(path, count, rate, sent))
+
+    elif reader_kind == "udp":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        reader = proxy.UdpReader("127.0.0.1", port)
+        sender = multiprocessing.Process(target=udp_sender,
+                                         args=("127.0.0.1", port, count,
+                                               rate, sent))
+
+    elif reader_kind == "file":
+        path = os.path.join(workdir, "recording.mtf")
+        write_recording(path, count, rate)
+        reader = proxy.FileReader(path)
+
+        step = 1.0 / rate if rate else 0.0
+        expected = [i * step for i in range(count)]
+
+    else:
+        raise ValueError("Invalid reader: %s" % reader_kind)
+
+    timing = TimingWriter(make_writer(writer_kind, workdir), count)
+    p = proxy.Proxy([reader], [timing])
+    timing.proxy = p
+
+    runner = threading.Thread(target=p.run, daemon=True)
+
+    cpu = time.process_time()
+    start = time.monotonic()
+
+    runner.start()
+
+    if sender is not None:
+        sender.start()
+
+    timeout = 10.0 + (count / float(rate) if rate else 0.0)
+    runner.join(timeout)
+    p.stop()
+    runner.join()
+
+    cpu = time.process_time() - cpu
+
+    if sender is not None:
+        sender.join()
+    elif expected is not None:
+        # file replay starts with its first frame
+        first = timing.received[0]
+        sent = [first + t for t in expected]
+
+    received = [i for i in range(count) if timing.received[i]]
+    latency = [timing.received[i] - sent[i] for i in received]
+
+    if timing.last is not None:
+        elapsed = timing.last - start
+    else:
+        elapsed = time.monotonic() - start
+
+    if hasattr(reader, "close"):
+        reader.close()
+
+    return {
+        "reader": reader_kind,
+        "writer": writer_kind,
+        "rate": rate,
+        "frames": count,
+        "received": len(received),
+        "frames_per_s": len(received) / elapsed if elapsed else 0.0,
+        "latency_p50_ms": percentile(latency, 50) * 1000,
+        "latency_p99_ms": percentile(latency, 99) * 1000,
+        "cpu_per_frame_us": cpu / max(1, len(received)) * 1000000
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='MoppyProxy benchmark %s' %
+                                     version.FULL)
+
+    parser.add_argument("-r", "--readers", default="pty,udp,file",
+                        help="Readers to benchmark (pty, udp, file)")
+
+    parser.add_argument("-w", "--writers", default="memory,sysfs,serial",
+                        help="Writers to benchmark (memory, sysfs, serial)")
+
+    parser.add_argument("--rates", default="1000,0",
+                        help="Frame rates per second, 0 is unthrottled")
+
+    parser.add_argument("-n", "--frames", default=5000, type=int,
+                        help="Frames per run")
+
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write results as JSON to this file")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level="WARNING")
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+
+        for reader in args.readers.split(","):
+            for writer in args.writers.split(","):
+                for rate in [int(r) for r in args.rates.split(",")]:
+
+                    # files are replayed in their recorded time
+                    if reader == "file" and rate == 0:
+                        continue
+
+                    case_dir = tempfile.mkdtemp(dir=workdir)
+                    result = run_case(reader, writer, args.frames, rate,
+                                      case_dir)
+                    results.append(result)
+
+                    print("%-5s -> %-7s rate=%-6d %8.0f frames/s  "
+                          "p50=%7.3fms  p99=%7.3fms  cpu=%6.1fus/frame "
+                          "(%d/%d)" %
+                          (reader, writer, rate, result["frames_per_s"],
+                           result["latency_p50_ms"],
+                           result["latency_p99_ms"],
+                           result["cpu_per_frame_us"], result["received"],
+                           result["frames"]))
+
+    report = {
+        "version": version.FULL,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
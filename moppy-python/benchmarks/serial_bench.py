@@ -0,0 +1,247 @@
+#!/bin/env python3
+
+import threading
+import argparse
+import platform
+import logging
+import struct
+import json
+import time
+import tty
+import pty
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+from moppy import serialout, version  # noqa: E402
+
+
+class FakeFirmware(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+
+        # the output under test writes to the slave end like to an Arduino
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+
+        self.baudrate = serialout.DEFAULT_BAUDRATE
+        self.frames = []
+        self.buffer = bytearray()
+
+    @property
+    def name(self):
+        return os.ttyname(self.slave)
+
+    def ready(self, delay=0.2):
+
+        # like after the reset caused by opening the port
+        threading.Timer(delay, os.write, (self.master,
+                                          serialout.ACK)).start()
+
+    def run(self):
+
+        line = time.monotonic()
+
+        while True:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+
+            line = max(line, time.monotonic())
+            self.buffer += data
+
+            while len(self.buffer) >= serialout.FRAME_SIZE:
+                frame = bytes(self.buffer[:serialout.FRAME_SIZE])
+                del self.buffer[:serialout.FRAME_SIZE]
+
+                # a frame is there no earlier than the line can deliver it
+                line += serialout.FRAME_SIZE * 10.0 / self.baudrate
+                delay = line - time.monotonic()
+
+                if delay > 0:
+                    time.sleep(delay)
+
+                if frame[:2] == bytes([serialout.CONTROL,
+                                       serialout.CMD_BAUD]):
+                    self.baudrate = serialout.BAUD_RATES[frame[2]]
+                    os.write(self.master, serialout.ACK)
+                    continue
+
+                self.frames.append((time.monotonic(), frame))
+
+
+class DirectOutput:
+
+    def __init__(self, port):
+
+        import serial
+
+        self.serial = serial.Serial(port=port, baudrate=9600)
+
+    def write(self, data):
+        self.serial.write(data)
+
+    def close(self):
+        self.serial.close()
+
+
+def percentile(samples, p):
+
+    if not len(samples):
+        return 0.0
+
+    samples = sorted(samples)
+
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+
+def run_case(kind, baudrate, bursts, drives, interval):
+
+    firmware = FakeFirmware()
+    firmware.start()
+
+    if kind == "direct":
+        output = DirectOutput(firmware.name)
+    else:
+        firmware.ready()
+        output = serialout.SerialOutput(firmware.name, baudrate)
+
+    # every burst changes all drives, every fourth one silences them, the
+    # value carries the burst number, the last one always plays
+    sent = []
+    blocked = 0.0
+    start = time.monotonic()
+
+    for burst in range(bursts):
+
+        delay = start + burst * interval - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+
+        sent.append(time.monotonic())
+
+        for drive in range(drives):
+            value = 0 if burst % 4 == 3 and burst < bursts - 1 else 1 + burst
+
+            t = time.monotonic()
+            output.write(struct.pack("!BH", 2 + drive * 2, value))
+            blocked += time.monotonic() - t
+
+    # wait until every drive got the state of the last burst
+    final = {2 + drive * 2: bursts for drive in range(drives)}
+    state = {}
+    seen = 0
+    settled = None
+    deadline = time.monotonic() + 10.0 + bursts * drives * 30.0 / baudrate
+
+    while time.monotonic() < deadline:
+
+        frames = firmware.frames[seen:]
+        seen += len(frames)
+
+        for t, frame in frames:
+            pin, value = struct.unpack("!BH", frame)
+            state[pin] = value
+
+            if state == final:
+                settled = t - sent[-1]
+                break
+
+        if settled is not None:
+            break
+
+        time.sleep(0.01)
+
+    output.close()
+    os.close(firmware.master)
+
+    # how old the newest note of a drive is when it reaches the drive
+    latency = []
+
+    for t, frame in firmware.frames:
+        value = struct.unpack("!BH", frame)[1]
+
+        if value:
+            latency.append(t - sent[value - 1])
+
+    return {
+        "output": kind,
+        "baudrate": baudrate,
+        "bursts": bursts,
+        "drives": drives,
+        "frames_sent": bursts * drives,
+        "frames_on_wire": len(firmware.frames),
+        "blocked_ms": blocked * 1000,
+        "latency_p50_ms": percentile(latency, 50) * 1000,
+        "latency_p99_ms": percentile(latency, 99) * 1000,
+        "settled_ms": settled * 1000 if settled is not None else None
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Moppy serial output '
+                                     'benchmark %s' % version.FULL)
+
+    parser.add_argument("-k", "--kinds", default="direct,engine",
+                        help="Outputs to benchmark (direct, engine)")
+
+    parser.add_argument("-b", "--baudrates", default="9600,115200",
+                        help="Baud rates for the engine, direct is 9600 only")
+
+    parser.add_argument("-n", "--bursts", default=200, type=int,
+                        help="Bursts of drive updates per run")
+
+    parser.add_argument("-d", "--drives", default=8, type=int,
+                        help="Drives updated per burst")
+
+    parser.add_argument("-i", "--interval", default=10.0, type=float,
+                        help="Time between bursts in ms")
+
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write results as JSON to this file")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level="WARNING")
+
+    results = []
+
+    for kind in args.kinds.split(","):
+        for baudrate in [int(b) for b in args.baudrates.split(",")]:
+
+            if kind == "direct" and baudrate != 9600:
+                continue
+
+            result = run_case(kind, baudrate, args.bursts, args.drives,
+                              args.interval / 1000.0)
+            results.append(result)
+
+            print("%-6s %7d baud  wire=%5d/%-5d  blocked=%7.1fms  "
+                  "p50=%8.1fms  p99=%8.1fms  settled=%s" %
+                  (kind, baudrate, result["frames_on_wire"],
+                   result["frames_sent"], result["blocked_ms"],
+                   result["latency_p50_ms"], result["latency_p99_ms"],
+                   "%.1fms" % result["settled_ms"]
+                   if result["settled_ms"] is not None else "never"))
+
+    report = {
+        "version": version.FULL,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
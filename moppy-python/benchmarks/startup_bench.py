@@ -0,0 +1,152 @@
+#!/bin/env python3
+
+import subprocess
+import argparse
+import platform
+import json
+import time
+import sys
+import os
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+sys.path.insert(0, SRC)
+
+from moppy import version  # noqa: E402
+
+# name -> arguments for the interpreter
+CASES = {
+    "moppy-player --help": [os.path.join(SRC, "moppy-player"), "--help"],
+    "moppy-proxy --help": [os.path.join(SRC, "moppy-proxy"), "--help"],
+    "moppy-server --help": [os.path.join(SRC, "moppy-server"), "--help"],
+    "moppy-render --help": [os.path.join(SRC, "moppy-render"), "--help"],
+    "import moppy.player": ["-c", "import moppy.player"],
+    "import moppy.proxy": ["-c", "import moppy.proxy"],
+    "import moppy.server": ["-c", "import moppy.server"],
+    "import moppy.webapp": ["-c", "import moppy.webapp"],
+    "import moppy.aserver": ["-c", "import moppy.aserver"]
+}
+
+
+def environment():
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+
+    return env
+
+
+def parse_importtime(output):
+
+    # "import time: self [us] | cumulative | imported package", nesting is
+    # given by two spaces of indent per level
+    modules = []
+
+    for line in output.splitlines():
+
+        if not line.startswith("import time:"):
+            continue
+
+        fields = line[len("import time:"):].split("|")
+
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+
+        name = fields[2].rstrip()
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+
+        modules.append((name.strip(), level, int(fields[0]),
+                        int(fields[1])))
+
+    return modules
+
+
+def run_case(args, runs):
+
+    env = environment()
+    walls = []
+
+    for _ in range(runs):
+        start = time.monotonic()
+        subprocess.run([sys.executable] + args, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        walls.append(time.monotonic() - start)
+
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                          env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+    modules = parse_importtime(proc.stderr)
+
+    return sorted(walls)[len(walls) // 2], modules
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Moppy startup benchmark %s'
+                                     % version.FULL)
+
+    parser.add_argument("-c", "--cases", default=None,
+                        help="Comma separated cases to run (default: all)")
+
+    parser.add_argument("-n", "--runs", default=5, type=int,
+                        help="Runs per case, the median wall time is taken")
+
+    parser.add_argument("-t", "--top", default=10, type=int,
+                        help="Number of slowest direct imports of the " +
+                        "entry module to report")
+
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write results as JSON to this file")
+
+    args = parser.parse_args()
+
+    if args.cases is None:
+        cases = list(CASES.keys())
+    else:
+        cases = args.cases.split(",")
+
+    results = []
+
+    for case in cases:
+
+        wall, modules = run_case(CASES[case], args.runs)
+
+        top_level = [m for m in modules if m[1] == 0]
+
+        # what the moppy module (level 0) pulls in directly
+        slowest = sorted([m for m in modules if m[1] == 1],
+                         key=lambda m: m[3], reverse=True)
+
+        result = {
+            "case": case,
+            "wall_ms": wall * 1000,
+            "import_ms": sum(m[3] for m in top_level) / 1000.0,
+            "modules": len(modules),
+            "slowest": [{"module": m[0], "cumulative_ms": m[3] / 1000.0}
+                        for m in slowest[:args.top]]
+        }
+
+        results.append(result)
+
+        print("%-24s wall=%7.1fms  imports=%7.1fms  modules=%4d  (%s)" %
+              (case, result["wall_ms"], result["import_ms"],
+               result["modules"],
+               ", ".join("%s %.1fms" % (m["module"], m["cumulative_ms"])
+                         for m in result["slowest"][:3])))
+
+    report = {
+        "version": version.FULL,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+import numpy as np
+
+NOTE_OFF = 0
+NOTE_ON = 1
+
+DEFAULT_TEMPO = 500000
+
+# octaves Player.constraint_octave keeps notes in
+MIN_OCTAVE = 2
+MAX_OCTAVE = 5
+
+
+class NoteArrays:
+
+    def __init__(self, tick, time, channel, note, velocity, type, message,
+                 seq, length):
+
+        self.tick = tick
+        self.time = time
+        self.channel = channel
+        self.note = note
+        self.velocity = velocity
+        self.type = type
+        self.message = message
+        self.seq = seq
+        self.length = length
+
+    def __len__(self):
+        return len(self.tick)
+
+
+def decode(midi):
+
+    if midi.type == 2:
+        raise TypeError("can't merge tracks in type 2 (asynchronous) file")
+
+    ticks = []
+    channels = []
+    notes = []
+    velocities = []
+    types = []
+    messages = []
+
+    tempo_ticks = [0]
+    tempos = [DEFAULT_TEMPO]
+
+    end = 0
+
+    for track in midi.tracks:
+
+        tick = 0
+
+        for msg in track:
+
+            tick += msg.time
+
+            if msg.type == 'note_on':
+                ticks.append(tick)
+                channels.append(msg.channel)
+                notes.append(msg.note)
+                velocities.append(msg.velocity)
+                types.append(NOTE_ON if msg.velocity else NOTE_OFF)
+                messages.append(NOTE_ON)
+            elif msg.type == 'note_off':
+                ticks.append(tick)
+                channels.append(msg.channel)
+                notes.append(msg.note)
+                velocities.append(msg.velocity)
+                types.append(NOTE_OFF)
+                messages.append(NOTE_OFF)
+            elif msg.type == 'set_tempo':
+                tempo_ticks.append(tick)
+                tempos.append(msg.tempo)
+
+        end = max(end, tick)
+
+    tick = np.array(ticks, dtype=np.int64)
+    type = np.array(types, dtype=np.uint8)
+
+    # time order, note offs before note ons on the same tick, otherwise
+    # the order of the tracks (just like mido merges them)
+    order = np.lexsort((type, tick))
+
+    tick = tick[order]
+
+    return NoteArrays(tick,
+                      _tick2second(tick, midi.ticks_per_beat, tempo_ticks,
+                                   tempos),
+                      np.array(channels, dtype=np.uint8)[order],
+                      np.array(notes, dtype=np.uint8)[order],
+                      np.array(velocities, dtype=np.uint8)[order],
+                      type[order],
+                      np.array(messages, dtype=np.uint8)[order],
+                      order,
+                      float(_tick2second(np.array([end], dtype=np.int64),
+                                         midi.ticks_per_beat, tempo_ticks,
+                                         tempos)[0]))
+
+
+def _tick2second(tick, ticks_per_beat, tempo_ticks, tempos):
+
+    tempo_ticks = np.array(tempo_ticks, dtype=np.int64)
+    tempos = np.array(tempos, dtype=np.float64)
+
+    order = np.argsort(tempo_ticks, kind='stable')
+    tempo_ticks = tempo_ticks[order]
+    tempos = tempos[order]
+
+    # seconds per tick and absolute seconds at each tempo change
+    scale = tempos / (ticks_per_beat * 1000000.0)
+    offsets = np.concatenate(([0.0], np.cumsum(np.diff(tempo_ticks) *
+                                               scale[:-1])))
+
+    segment = np.searchsorted(tempo_ticks, tick, side='right') - 1
+
+    return offsets[segment] + (tick - tempo_ticks[segment]) * scale[segment]
+
+
+def _counts(values):
+
+    # keys in the order they are first seen
+    keys, first, counts = np.unique(values, return_index=True,
+                                    return_counts=True)
+
+    return {int(keys[i]): int(counts[i]) for i in np.argsort(first)}
+
+
+def polyphony(notes):
+
+    if not len(notes):
+        return {}
+
+    index = np.arange(len(notes))
+
+    # per (channel, note) a note is either sounding or not, repeated note
+    # ons just retrigger it, stray note offs are ignored
+    order = np.lexsort((index, notes.note, notes.channel))
+    state = notes.type[order].astype(np.int32)
+
+    prev = np.empty_like(state)
+    prev[0] = 0
+    prev[1:] = state[:-1]
+
+    key = notes.channel[order].astype(np.int32) * 128 + notes.note[order]
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    prev[first] = 0
+
+    change = np.empty_like(state)
+    change[order] = state - prev
+
+    # now sum up the changes per channel in time order
+    order = np.lexsort((index, notes.channel))
+    channel = notes.channel[order]
+    active = np.cumsum(change[order])
+
+    starts = np.flatnonzero(np.r_[True, channel[1:] != channel[:-1]])
+    base = np.r_[0, active[starts[1:] - 1]]
+    active -= np.repeat(base, np.diff(np.r_[starts, len(active)]))
+
+    peaks = np.maximum.reduceat(active, starts)
+
+    return {int(c): int(p) for c, p in zip(channel[starts], peaks)}
+
+
+def analyze(midi, notes=None):
+
+    if notes is None:
+        notes = decode(midi)
+
+    on = notes.type == NOTE_ON
+    channel = notes.channel[on]
+    note = notes.note[on]
+    octave = note.astype(np.int16) // 12 - 1
+
+    out_of_range = (octave < MIN_OCTAVE) | (octave > MAX_OCTAVE)
+
+    # the channel mapping goes by the counts of all note_on messages (also
+    # those of velocity 0) in the order mido merges the tracks, as always
+    merged = np.lexsort((notes.seq, notes.tick))
+    merged = merged[notes.message[merged] == NOTE_ON]
+
+    note_range = {}
+    out = {}
+
+    for ch in np.unique(channel):
+        mask = channel == ch
+        note_range[int(ch)] = [int(note[mask].min()), int(note[mask].max())]
+        out[int(ch)] = int(np.count_nonzero(out_of_range[mask]))
+
+    return {
+        "channels": _counts(notes.channel[merged]),
+        "octaves": _counts(notes.note[merged].astype(np.int16) // 12 - 1),
+        "sounding_channels": _counts(channel),
+        "sounding_octaves": _counts(octave),
+        "notes": int(len(note)),
+        "polyphony": polyphony(notes),
+        "range": note_range,
+        "out_of_range": out,
+        "length": notes.length
+    }
+
@@ -0,0 +1,198 @@
+import logging
+import asyncio
+import sys
+import io
+
+from moppy import status, webapp
+
+
+class EventStreamResponse:
+
+    def __init__(self, hub, keepalive=15.0):
+
+        self.hub = hub
+        self.keepalive = keepalive
+
+    async def __call__(self, receive, send):
+
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def watcher():
+            loop.call_soon_threadsafe(changed.set)
+
+        async def disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache")]
+        })
+
+        seen = {}
+        disconnected = asyncio.ensure_future(disconnect())
+        self.hub.watch(watcher)
+
+        try:
+            while not disconnected.done():
+                changed.clear()
+                changes = self.hub.changes(seen)
+
+                for topic, data in changes:
+                    await send({"type": "http.response.body",
+                                "body": status.sse_event(topic, data),
+                                "more_body": True})
+
+                if len(changes):
+                    continue
+
+                waiter = asyncio.ensure_future(changed.wait())
+                done, _ = await asyncio.wait(
+                    [waiter, disconnected], timeout=self.keepalive,
+                    return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+
+                if not len(done):
+                    await send({"type": "http.response.body",
+                                "body": status.SSE_KEEPALIVE,
+                                "more_body": True})
+        finally:
+            self.hub.unwatch(watcher)
+            disconnected.cancel()
+
+
+def wsgi_environ(scope, body):
+
+    # the ASGI request as WSGI environ (PEP 3333)
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+
+        if name in environ:
+            value = environ[name] + "," + value
+
+        environ[name] = value
+
+    return environ
+
+
+def call_wsgi(app, environ):
+
+    # (status, headers, body) of a WSGI app, runs in a worker thread
+    response = []
+    body = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(" ", 1)[0]), headers]
+        return body.append
+
+    result = app(environ, start_response)
+
+    try:
+        for data in result:
+            body.append(data)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    return response[0], response[1], b"".join(body)
+
+
+class AsgiApp:
+
+    def __init__(self, home_dir=None, port=8088, prefetch=2, output=None,
+                 voices=None):
+
+        self.logger = logging.getLogger('asgiapp')
+
+        self.port = port
+
+        # the handlers of the threaded server, called in worker threads,
+        # songs play on its queue thread, so stopping or skipping is a
+        # scheduler.stop() and no request ever waits on the player
+        self.web = webapp.FlaskApp(home_dir, port, prefetch, output,
+                                   voices)
+
+    def run(self):
+
+        import uvicorn
+
+        uvicorn.run(self, host='0.0.0.0', port=self.port, log_level="info")
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                self.web.start()
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.web.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+
+        # the event stream waits on the event loop rather than holding a
+        # worker thread for each client
+        if scope["path"] == "/events":
+            await EventStreamResponse(self.web.hub)(receive, send)
+            return
+
+        body = bytearray()
+
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+
+            if not message.get("more_body", False):
+                break
+
+        loop = asyncio.get_running_loop()
+        code, headers, body = await loop.run_in_executor(
+            None, call_wsgi, self.web.app, wsgi_environ(scope, bytes(body)))
+
+        await send({
+            "type": "http.response.start",
+            "status": code,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                        for k, v in headers]
+        })
+        await send({"type": "http.response.body", "body": body})
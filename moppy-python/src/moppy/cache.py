@@ -0,0 +1,209 @@
+import threading
+import hashlib
+import logging
+import struct
+import json
+import mmap
+import mido
+import os
+
+from moppy import player, index
+
+
+class SongCache:
+
+    VERSION = 4
+
+    HEADER = struct.Struct("<4sI")
+    MAGIC = b"MPC1"
+
+    # time, type (1 = note_on, 0 = note_off), channel, note, velocity, pitch
+    RECORD = struct.Struct("<dBBBBh")
+
+    def __init__(self, cache_dir):
+
+        self.logger = logging.getLogger('cache')
+
+        self.cache_dir = cache_dir
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @staticmethod
+    def file_hash(midi_path):
+
+        h = hashlib.sha1()
+
+        with open(midi_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+    @staticmethod
+    def options_hash(p):
+
+        options = "%d|%s|%s|%s|%s|%s|%s|%s" % (
+            SongCache.VERSION, sorted(p.ch_filter), p.ch_max, p.ch_optimize,
+            p.ch_mirror, p.octave_optimize, p.voices,
+            getattr(p.port, "bends", False))
+
+        return hashlib.sha1(options.encode()).hexdigest()[:16]
+
+    def _info_path(self, file_hash):
+        return os.path.join(self.cache_dir, "%s-v%d.json" %
+                            (file_hash, self.VERSION))
+
+    def _events_path(self, file_hash, p):
+        return os.path.join(self.cache_dir, "%s-%s.bin" %
+                            (file_hash, self.options_hash(p)))
+
+    def info(self, midi_path, midi=None, file_hash=None):
+
+        if file_hash is None:
+            file_hash = self.file_hash(midi_path)
+
+        path = self._info_path(file_hash)
+
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                return json.load(f, object_pairs_hook=index.int_keys)
+
+        if midi is None:
+            midi = mido.MidiFile(midi_path)
+
+        stats = player.Player.analyze(midi)
+
+        info = {
+            "length": stats["length"],
+            "type": midi.type,
+            "tracks": len(midi.tracks),
+            "analysis": stats
+        }
+
+        self._store(path, json.dumps(info).encode())
+
+        return info
+
+    def schedule(self, midi_path, p, midi=None, file_hash=None,
+                 analysis=None):
+
+        if file_hash is None:
+            file_hash = self.file_hash(midi_path)
+
+        path = self._events_path(file_hash, p)
+
+        if os.path.isfile(path):
+            try:
+                return self.load(path, p)
+            except (ValueError, struct.error) as e:
+                self.logger.warning("dropping broken cache entry %s: %s" %
+                                    (path, e))
+                os.unlink(path)
+
+        if midi is None:
+            midi = mido.MidiFile(midi_path)
+
+        if analysis is None:
+            analysis = self.info(midi_path, midi, file_hash)["analysis"]
+
+        schedule = p.compile(midi, analysis)
+
+        self.save(path, schedule)
+
+        return schedule
+
+    def fill(self, midi_path, p, configure=None, analysis=None):
+
+        file_hash = self.file_hash(midi_path)
+
+        if analysis is None:
+            analysis = self.info(midi_path, file_hash=file_hash)["analysis"]
+
+        if configure is not None:
+            configure(p, analysis)
+
+        self.schedule(midi_path, p, file_hash=file_hash, analysis=analysis)
+
+        return analysis
+
+    def invalidate(self, midi_path):
+
+        if not os.path.isfile(midi_path):
+            return
+
+        file_hash = self.file_hash(midi_path)
+
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(file_hash):
+                os.unlink(os.path.join(self.cache_dir, name))
+                self.logger.info("invalidated %s" % name)
+
+    def _store(self, path, data):
+
+        # write to a temp file first, so a concurrent reader never sees a
+        # partial entry, one per thread as the server prefetches while the
+        # queue thread may load the same song
+        tmp = path + ".tmp%d-%d" % (os.getpid(), threading.get_ident())
+
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        os.rename(tmp, path)
+
+    def save(self, path, schedule):
+
+        data = bytearray(self.HEADER.pack(self.MAGIC, len(schedule.events)))
+        data += struct.pack("<d", schedule.length)
+
+        for t, msg, _, _, pitch in schedule.events:
+            data += self.RECORD.pack(t, msg.type == 'note_on', msg.channel,
+                                     msg.note, msg.velocity, pitch)
+
+        self._store(path, bytes(data))
+
+    @staticmethod
+    def make_event(p, encode, on, ch, note, vel, pitch):
+
+        msg = player.Note('note_on' if on else 'note_off', ch, note, vel)
+
+        # plain mido ports send the message itself
+        if encode is None:
+            msg = msg.message()
+
+        return p.make_event(0.0, msg, encode, pitch)
+
+    def load(self, path, p):
+
+        encode = getattr(p.port, "encode", None)
+        events = []
+
+        # songs repeat the same few notes, each distinct record is built and
+        # encoded only once and its events share that
+        built = {}
+
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+
+                magic, count = self.HEADER.unpack_from(m)
+
+                if magic != self.MAGIC:
+                    raise ValueError("invalid magic")
+
+                length, = struct.unpack_from("<d", m, self.HEADER.size)
+                offset = self.HEADER.size + 8
+
+                if len(m) != offset + count * self.RECORD.size:
+                    raise ValueError("truncated")
+
+                for record in self.RECORD.iter_unpack(m[offset:]):
+
+                    t, key = record[0], record[1:]
+                    event = built.get(key)
+
+                    if event is None:
+                        event = built[key] = self.make_event(p, encode, *key)
+
+                    events.append(player.Event(t, *event[1:]))
+
+        return player.Schedule(events, length)
@@ -0,0 +1,280 @@
+import collections
+import threading
+import logging
+import time
+import mido
+
+from moppy import player, metrics
+
+
+def parse_channels(spec, ch_max):
+
+    # "0-3+6" -> [0, 1, 2, 3, 6], None is all channels
+    if spec is None:
+        return list(range(ch_max))
+
+    channels = []
+
+    for part in spec.split("+"):
+        if "-" in part:
+            first, last = part.split("-")
+            channels += range(int(first), int(last) + 1)
+        else:
+            channels.append(int(part))
+
+    return channels
+
+
+def parse_backends(spec, ch_max, open_port):
+
+    # "<port>[=<drives>][@<latency ms>],...", e.g. "sysfs=0-3,serial=4-7@5"
+    backends = []
+
+    for item in spec.split(","):
+        name, _, rest = item.partition("=")
+        channels, _, latency = rest.partition("@")
+
+        if "@" in name:
+            name, _, latency = name.partition("@")
+
+        if latency:
+            latency = float(latency) / 1000.0
+        else:
+            latency = None
+
+        backends.append(Backend(open_port(name),
+                                parse_channels(channels or None, ch_max),
+                                latency, name))
+
+    return backends
+
+
+class Backend(threading.Thread):
+
+    def __init__(self, port, channels, latency=None, name=None):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.logger = logging.getLogger('fanout')
+
+        self.port = port
+        self.name = name or str(port)
+
+        # drive of the player -> channel of this port, several backends
+        # taking the same drive mirror it
+        self.channels = {drive: ch for ch, drive in enumerate(channels)}
+
+        # what is known about the time from sending to sounding (e.g. the
+        # line time of a serial port) plus what sending is measured to take
+        if latency is None:
+            latency = getattr(port, "latency", 0.0)
+
+        self.latency = latency
+        self.took = 0.0
+        self.delay = 0.0
+
+        if hasattr(port, "send_encoded"):
+            self.send = port.send_encoded
+        else:
+            self.send = port.send
+
+        self.encode = getattr(port, "encode", None)
+        self.bends = getattr(port, "bends", False)
+        self.flush = getattr(port, "flush", None)
+
+        self.stats = player.LatencyStats()
+        self.lateness = metrics.histogram(
+            "moppy_fanout_lateness_seconds",
+            "Time bursts were sent after they were due", backend=self.name)
+
+        # (due time, list of data or a callable) sent in order by the thread
+        self.cond = threading.Condition()
+        self.queue = collections.deque()
+        self.pending = []
+        self.stopped = False
+
+        metrics.gauge("moppy_fanout_queue_depth",
+                      "Bursts waiting to be sent", lambda: len(self.queue),
+                      backend=self.name)
+
+    def __str__(self):
+        return self.name
+
+    def make_data(self, msg, pitch=0):
+
+        msg = msg.copy(channel=self.channels[msg.channel])
+
+        if self.encode is None:
+            # a MIDI port takes mido messages only
+            if isinstance(msg, player.Note):
+                return msg.message()
+
+            return msg
+
+        if pitch and self.bends:
+            return self.encode(msg, pitch)
+
+        return self.encode(msg)
+
+    def commit(self, now):
+
+        if not len(self.pending):
+            return
+
+        with self.cond:
+            self.queue.append((now + self.delay, self.pending))
+            self.cond.notify()
+
+        self.pending = []
+
+    def call(self, func):
+
+        # run func on the sender thread after what was queued before
+        done = threading.Event()
+
+        def call():
+            try:
+                func()
+            finally:
+                done.set()
+
+        with self.cond:
+            self.queue.append((0.0, call))
+            self.cond.notify()
+
+        done.wait()
+
+    def clear(self):
+
+        self.pending = []
+
+        with self.cond:
+            self.queue.clear()
+
+    def stop(self):
+
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def run(self):
+
+        while True:
+
+            with self.cond:
+
+                if self.stopped:
+                    break
+
+                if not len(self.queue):
+                    self.cond.wait()
+                    continue
+
+                due, item = self.queue[0]
+                delay = due - time.monotonic()
+
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+
+                self.queue.popleft()
+
+            if callable(item):
+                item()
+                continue
+
+            start = time.monotonic()
+
+            try:
+                for data in item:
+                    self.send(data)
+
+                if self.flush is not None:
+                    self.flush()
+            except Exception as e:
+                self.logger.error("%s: failed to send: %s" % (self, e))
+
+            end = time.monotonic()
+
+            self.stats.add(start - due)
+
+            if self.lateness is not None:
+                self.lateness.observe(start - due)
+            self.took += 0.05 * (end - start - self.took)
+
+
+class FanoutPort(mido.ports.BaseOutput):
+
+    def __init__(self, backends):
+        mido.ports.BaseOutput.__init__(self)
+
+        self.logger = logging.getLogger('fanout')
+
+        self.backends = backends
+        self.bends = any(b.bends for b in backends)
+
+        self.compensate()
+
+        for backend in self.backends:
+            backend.start()
+
+            self.logger.info("%s: drives %s, latency %.1fms" %
+                             (backend, sorted(backend.channels),
+                              backend.latency * 1000))
+
+    def compensate(self):
+
+        # hold back the faster backends, so all of them sound together
+        latency = [b.latency + b.took for b in self.backends]
+        slowest = max(latency + [0.0])
+
+        for backend, lat in zip(self.backends, latency):
+            backend.delay = slowest - lat
+
+    def encode(self, message, pitch=0):
+
+        # encoded for each backend taking the drive, ahead of playback
+        return [(backend, backend.make_data(message, pitch))
+                for backend in self.backends
+                if message.channel in backend.channels]
+
+    def send_encoded(self, data):
+
+        for backend, d in data:
+            if d is not None:
+                backend.pending.append(d)
+
+    def _send(self, message):
+
+        self.send_encoded(self.encode(message))
+
+    def flush(self):
+
+        now = time.monotonic()
+
+        self.compensate()
+
+        for backend in self.backends:
+            backend.commit(now)
+
+    def reset(self):
+
+        # all backends reset in parallel, each on its own thread
+        threads = []
+
+        for backend in self.backends:
+            backend.clear()
+            threads.append(threading.Thread(
+                target=backend.call, args=(backend.port.reset,)))
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def _close(self):
+
+        for backend in self.backends:
+            backend.stop()
+            backend.join()
+            backend.port.close()
@@ -0,0 +1,225 @@
+import concurrent.futures
+import multiprocessing
+import contextlib
+import threading
+import logging
+import sqlite3
+import json
+import mido
+import os
+
+
+def int_keys(pairs):
+
+    # JSON object hook turning the channel numbers back into int keys
+    d = {}
+
+    for k, v in pairs:
+        try:
+            d[int(k)] = v
+        except ValueError:
+            d[k] = v
+
+    return d
+
+
+def analyze_song(path):
+
+    from moppy import analysis
+
+    try:
+        midi = mido.MidiFile(path)
+        stats = analysis.analyze(midi)
+
+        return {
+            "length": stats["length"],
+            "type": midi.type,
+            "tracks": len(midi.tracks),
+            "channels": sorted(stats["channels"].keys()),
+            "analysis": stats
+        }, None
+
+    except Exception as e:
+        return None, "%s: %s" % (type(e).__name__, e)
+
+
+class SongIndex:
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS songs (
+            name TEXT PRIMARY KEY,
+            mtime REAL,
+            size INTEGER,
+            length REAL,
+            type INTEGER,
+            tracks INTEGER,
+            channels TEXT,
+            analysis TEXT,
+            error TEXT
+        )
+    """
+
+    def __init__(self, db_path, songs_dir, extension=".mid"):
+
+        self.logger = logging.getLogger('index')
+
+        self.db_path = db_path
+        self.songs_dir = songs_dir
+        self.extension = extension
+        self.lock = threading.Lock()
+        self.ready = False
+
+        with self._connect() as db:
+            db.execute(self.SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+
+        # commits or rolls back like the connection used as context, and
+        # closes it, which that does not
+        db = sqlite3.connect(self.db_path, timeout=10)
+
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _scan(self):
+
+        files = {}
+
+        for entry in os.scandir(self.songs_dir):
+            if entry.is_file() and entry.name.endswith(self.extension):
+                st = entry.stat()
+                files[entry.name] = (st.st_mtime, st.st_size)
+
+        return files
+
+    def _store(self, db, name, mtime, size, result, error):
+
+        if result is None:
+            db.execute("INSERT OR REPLACE INTO songs (name, mtime, size, " +
+                       "error) VALUES (?, ?, ?, ?)",
+                       (name, mtime, size, error))
+        else:
+            db.execute("INSERT OR REPLACE INTO songs VALUES " +
+                       "(?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                       (name, mtime, size, result["length"],
+                        result["type"], result["tracks"],
+                        json.dumps(result["channels"]),
+                        json.dumps(result["analysis"])))
+
+    def update(self, workers=None):
+
+        files = self._scan()
+
+        with self.lock, self._connect() as db:
+
+            known = {name: (mtime, size) for name, mtime, size in
+                     db.execute("SELECT name, mtime, size FROM songs")}
+
+            removed = [name for name in known if name not in files]
+            changed = [name for name, stat in files.items()
+                       if known.get(name) != stat]
+
+            for name in removed:
+                db.execute("DELETE FROM songs WHERE name = ?", (name,))
+
+        if len(changed):
+            self.logger.info("indexing %d songs" % len(changed))
+
+            paths = [os.path.join(self.songs_dir, name) for name in changed]
+
+            # the server forks from a threaded process, a forked worker could
+            # inherit locks (e.g. the import lock) held by another thread
+            context = multiprocessing.get_context("spawn")
+
+            with concurrent.futures.ProcessPoolExecutor(
+                    workers, mp_context=context) as pool:
+                results = list(pool.map(analyze_song, paths, chunksize=8))
+
+            with self.lock, self._connect() as db:
+                for name, (result, error) in zip(changed, results):
+                    if error is not None:
+                        self.logger.warning("failed to index %s: %s" %
+                                            (name, error))
+                    self._store(db, name, files[name][0], files[name][1],
+                                result, error)
+
+        self.ready = True
+
+        self.logger.info("index updated (%d songs, %d changed, %d removed)" %
+                         (len(files), len(changed), len(removed)))
+
+        return len(changed), len(removed)
+
+    def update_file(self, name):
+
+        path = os.path.join(self.songs_dir, name)
+        st = os.stat(path)
+        result, error = analyze_song(path)
+
+        with self.lock, self._connect() as db:
+            self._store(db, name, st.st_mtime, st.st_size, result, error)
+
+    def remove(self, name):
+
+        with self.lock, self._connect() as db:
+            db.execute("DELETE FROM songs WHERE name = ?", (name,))
+
+    def analysis(self, name):
+
+        # stored analysis of a song, None if it is not indexed (yet) or the
+        # file changed since
+        try:
+            st = os.stat(os.path.join(self.songs_dir, name))
+        except OSError:
+            return None
+
+        with self._connect() as db:
+            row = db.execute("SELECT mtime, size, analysis FROM songs " +
+                             "WHERE name = ?", (name,)).fetchone()
+
+        if row is None or row[2] is None or \
+                (row[0], row[1]) != (st.st_mtime, st.st_size):
+            return None
+
+        analysis = json.loads(row[2], object_pairs_hook=int_keys)
+
+        # indexed with the counts of sounding notes only, sorted by key
+        if "sounding_channels" not in analysis:
+            return None
+
+        return analysis
+
+    def names(self):
+
+        with self._connect() as db:
+            return [name for name, in
+                    db.execute("SELECT name FROM songs ORDER BY name")]
+
+    def songs(self, details=False):
+
+        songs = []
+
+        with self._connect() as db:
+            for row in db.execute("SELECT name, length, type, tracks, " +
+                                  "channels, analysis, error FROM songs " +
+                                  "ORDER BY name"):
+
+                song = {
+                    "name": row[0],
+                    "length": row[1],
+                    "type": row[2],
+                    "tracks": row[3],
+                    "channels": json.loads(row[4]) if row[4] else None,
+                    "error": row[6]
+                }
+
+                if details:
+                    song["analysis"] = json.loads(row[5]) if row[5] else None
+
+                songs.append(song)
+
+        return songs
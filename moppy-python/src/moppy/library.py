@@ -0,0 +1,201 @@
+import logging
+import math
+import os
+
+from moppy import player, cache, index
+
+
+ALLOWED_EXTENSIONS = {'mid'}
+
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def parse_time(value):
+
+    # seconds or minutes:seconds, e.g. "90" or "1:30"
+    minutes, _, seconds = value.rpartition(":")
+    t = float(seconds) + 60.0 * int(minutes or 0)
+
+    if not math.isfinite(t) or t < 0.0:
+        raise ValueError("Invalid time: %s" % value)
+
+    return t
+
+
+def parse_tempo(value):
+
+    # factor of the song's tempo, e.g. "0.8"
+    tempo = float(value)
+
+    if not math.isfinite(tempo) or tempo <= 0.0:
+        raise ValueError("Invalid tempo: %s" % value)
+
+    return tempo
+
+
+def configure_player(p, info, voices=None):
+
+    # no percussion
+    p.ch_filter = [0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13, 14, 15]
+
+    # chords within a channel need single notes spread over the drives,
+    # only when asked for, as it changes which drive plays what
+    if voices is not None and any(info.get("polyphony", {}).get(ch, 1) > 1
+                                  for ch in p.ch_filter):
+        p.voices = voices
+
+    # mirror if possible
+    if len(set(info["channels"].keys()).intersection(
+            p.ch_filter)) <= (p.ch_max // 2) and p.voices is None:
+        p.ch_mirror = True
+        p.ch_max = p.ch_max // 2
+        return True
+
+    return False
+
+
+def make_port(logger):
+
+    if os.path.isdir('/sys/kernel/moppy'):
+        port = player.MoppySysfsPort()
+        logger.info("Using sysfs port for output")
+    else:
+        port = player.NullPort()
+        logger.info("Using null port for output")
+
+    return port
+
+
+def make_player(port, update_hook=None):
+
+    # TODO: read max. channels from kernel module via sysfs
+    return player.Player(port, ch_max=8, update_hook=update_hook)
+
+
+def drives(p):
+
+    if p.ch_mirror:
+        return p.ch_max * 2
+
+    return p.ch_max
+
+
+class SongLibrary:
+
+    def __init__(self, home_dir=None, voices=None):
+
+        self.logger = logging.getLogger('library')
+
+        self.voices = voices
+
+        if home_dir is None:
+            home_dir = os.getenv("HOME")
+
+        self.base_path = os.path.join(os.path.join(home_dir,
+                                                   ".moppy"))
+
+        self.logger.info('Base dir is: %s' % self.base_path)
+
+        self.midi_base_path = os.path.join(self.base_path, "songs")
+
+        if not os.path.isdir(self.midi_base_path):
+            if not os.path.isdir(self.base_path):
+                os.mkdir(self.base_path)
+            os.mkdir(self.midi_base_path)
+
+        self.cache = cache.SongCache(os.path.join(self.base_path, "cache"))
+        self.index = index.SongIndex(os.path.join(self.base_path,
+                                                  "index.db"),
+                                     self.midi_base_path)
+
+    def path(self, file):
+        return os.path.join(self.midi_base_path, file)
+
+    def configure(self, p, info):
+        return configure_player(p, info, self.voices)
+
+    def update_index(self, workers=None):
+
+        try:
+            return self.index.update(workers)
+        except Exception as e:
+            self.logger.error("Failed to update index: %s" % e)
+
+    def names(self):
+
+        if self.index.ready:
+            return self.index.names()
+
+        # still building the index for the first time
+        midi_files = []
+
+        for file in sorted(os.listdir(self.midi_base_path)):
+            fqn = os.path.join(self.midi_base_path, file)
+            if os.path.isfile(fqn) and fqn.endswith(".mid"):
+                midi_files.append(file)
+
+        return midi_files
+
+    def add(self, filename, file):
+
+        fqn = self.path(filename)
+
+        # a song uploaded over another one would leave its entries behind
+        self.cache.invalidate(fqn)
+        file.save(fqn)
+
+        self.index.update_file(filename)
+        self.prerender(filename)
+
+    def prerender(self, file):
+
+        fqn = self.path(file)
+
+        try:
+            # TODO: read max. channels from kernel module via sysfs
+            p = player.Player(player.NullPort(), ch_max=8)
+            self.cache.fill(fqn, p, self.configure,
+                            self.index.analysis(file))
+            self.logger.info("Cached: %s" % file)
+        except Exception as e:
+            self.logger.warning("Failed to cache %s: %s" % (fqn, e))
+
+    def delete(self, file):
+
+        fqn = self.path(file)
+
+        if os.path.isfile(fqn):
+            self.cache.invalidate(fqn)
+            os.unlink(fqn)
+
+        self.index.remove(file)
+
+        self.logger.info("Deleted: %s" % file)
+
+    def load(self, p, file):
+
+        # returns the compiled schedule and whether mirroring was enabled
+        path = self.path(file)
+
+        file_hash = self.cache.file_hash(path)
+        analysis = self.analysis(file, file_hash)
+
+        mirror = self.configure(p, analysis)
+
+        return self.cache.schedule(path, p, file_hash=file_hash,
+                                   analysis=analysis), mirror
+
+    def analysis(self, file, file_hash=None):
+
+        # the index analysed the song already, the cache only analyses songs
+        # the index does not know (yet)
+        analysis = self.index.analysis(file)
+
+        if analysis is None:
+            analysis = self.cache.info(self.path(file),
+                                       file_hash=file_hash)["analysis"]
+
+        return analysis
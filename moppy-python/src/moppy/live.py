@@ -0,0 +1,198 @@
+import logging
+import queue
+import time
+import mido
+
+from moppy import player, metrics
+from moppy.voices import VoiceAllocator
+
+# control changes silencing everything (all sound off, all notes off)
+ALL_OFF = (120, 123)
+
+
+class LivePlayer(player.Player):
+
+    def __init__(self, port, ch_max=4, ch_filter=None, ch_mirror=False,
+                 octave_optimize=True, voices="oldest", update_hook=None):
+
+        player.Player.__init__(self, port, None, ch_max, ch_filter, False,
+                               ch_mirror, octave_optimize, update_hook,
+                               voices=voices)
+
+        self.logger = logging.getLogger('live')
+
+        # time from a message arriving at the input to the port having it,
+        # including the time it waited for earlier ones
+        self.latency = player.LatencyStats()
+
+        # (arrival time, message) taken from the input's callback, None stops
+        self.inbox = queue.Queue()
+
+        self.encode = getattr(port, "encode", None)
+        self.bends = getattr(port, "bends", False)
+        self.flush = getattr(port, "flush", None)
+
+        if hasattr(port, "send_encoded"):
+            self.send = port.send_encoded
+        else:
+            self.send = port.send
+
+        self.meter = metrics.SendMeter.create(type(port).__name__)
+        self.input_latency = metrics.histogram(
+            "moppy_live_latency_seconds",
+            "Time from a message arriving at the input until the port has it")
+
+        self.reset_voices()
+
+    @property
+    def stats(self):
+        return self.latency
+
+    def reset_voices(self):
+
+        # without voice allocation a channel always plays on the same drive,
+        # there is no song to find the most used channels in
+        self.ch_map = self.channel_map(None)
+
+        if self.voices is not None:
+            self.allocator = VoiceAllocator(self.ch_max, self.voices)
+        else:
+            self.allocator = None
+
+        # source channel -> pitch wheel, drive -> (channel, note, message)
+        self.pitch = {}
+        self.sounding = {}
+
+    def output(self, msg, pitch=0):
+
+        event = self.make_event(0.0, msg, self.encode, pitch)
+
+        if self.update_hook is not None:
+            self.update_hook(*event.update)
+
+        if self.meter is None:
+            self.send(event.data)
+        else:
+            self.meter.send(self.send, event.data, msg.channel)
+
+        if self.ch_mirror:
+            self.output(msg.copy(channel=msg.channel + self.ch_max), pitch)
+
+    def note_on(self, msg):
+
+        if self.allocator is not None:
+            drive = self.allocator.note_on(msg.channel, msg.note)
+        else:
+            drive = self.ch_map.get(msg.channel)
+
+        if drive is None or drive >= self.ch_max:
+            return
+
+        out = mido.Message('note_on', channel=drive, note=msg.note,
+                           velocity=msg.velocity)
+
+        if self.octave_optimize:
+            out = self.constraint_octave(out)
+
+        self.sounding[drive] = (msg.channel, msg.note, out)
+        self.output(out, self.pitch.get(msg.channel, 0))
+
+    def note_off(self, msg):
+
+        if self.allocator is not None:
+            drive = self.allocator.note_off(msg.channel, msg.note)
+        else:
+            drive = self.ch_map.get(msg.channel)
+
+            # legato on a keyboard, the drive plays another note already
+            sounding = self.sounding.get(drive)
+
+            if sounding is None or sounding[:2] != (msg.channel, msg.note):
+                return
+
+        if drive is None or drive >= self.ch_max:
+            return
+
+        _, _, out = self.sounding.pop(drive)
+
+        self.output(mido.Message('note_off', channel=drive, note=out.note))
+
+    def all_off(self):
+
+        for drive, (_, _, out) in self.sounding.items():
+            self.output(mido.Message('note_off', channel=drive,
+                                     note=out.note))
+
+        self.reset_voices()
+
+    def handle(self, msg):
+
+        if getattr(msg, "channel", None) not in self.ch_filter:
+            return
+
+        if msg.type == 'note_on' and msg.velocity > 0:
+            self.note_on(msg)
+
+        elif msg.type in ('note_on', 'note_off'):
+            self.note_off(msg)
+
+        elif msg.type == 'pitchwheel' and self.bends:
+            self.pitch[msg.channel] = msg.pitch
+
+            for channel, _, out in self.sounding.values():
+                if channel == msg.channel:
+                    self.output(out, msg.pitch)
+
+        elif msg.type == 'control_change' and msg.control in ALL_OFF:
+            self.all_off()
+
+    def receive(self, msg):
+
+        # the input port's callback, called on its thread as soon as the
+        # message arrived
+        self.inbox.put((time.monotonic(), msg))
+
+    def take(self):
+
+        # everything arrived, waiting for the first message
+        received = [self.inbox.get()]
+
+        while True:
+            try:
+                received.append(self.inbox.get_nowait())
+            except queue.Empty:
+                return received
+
+    def run(self):
+
+        self.playing = True
+
+        try:
+            while self.playing:
+
+                received = self.take()
+
+                # a chord arrives as several messages, they go out together
+                for item in received:
+                    if item is not None:
+                        self.handle(item[1])
+
+                if self.flush is not None:
+                    self.flush()
+
+                now = time.monotonic()
+
+                for item in received:
+                    if item is not None:
+                        self.latency.add(now - item[0])
+
+                        if self.input_latency is not None:
+                            self.input_latency.observe(now - item[0])
+        finally:
+            self.playing = False
+            self.silence()
+
+    def stop(self):
+
+        self.playing = False
+        self.inbox.put(None)
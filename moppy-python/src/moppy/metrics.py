@@ -0,0 +1,244 @@
+import threading
+import bisect
+import time
+
+# upper bounds of latency histograms in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter:
+
+    KIND = "counter"
+
+    def __init__(self, func=None):
+
+        # with func the value is read from the instrumented object, so
+        # counting costs nothing there
+        self.func = func
+        self.count = 0
+
+    def inc(self, n=1):
+        self.count += n
+
+    @property
+    def value(self):
+
+        if self.func is not None:
+            return self.func()
+
+        return self.count
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+    def summary(self):
+        return "%d" % self.value
+
+
+class Gauge(Counter):
+
+    KIND = "gauge"
+
+    def set(self, value):
+        self.count = value
+
+
+class Histogram:
+
+    KIND = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+
+        samples = []
+        total = 0
+
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            samples.append((name + "_bucket", labels + (("le", str(bound)),),
+                            total))
+
+        samples.append((name + "_sum", labels, self.sum))
+        samples.append((name + "_count", labels, self.count))
+
+        return samples
+
+    def summary(self):
+
+        if not self.count:
+            return "0"
+
+        return "%d/%.3fms" % (self.count, self.sum / self.count * 1000)
+
+
+def format_labels(labels):
+
+    if not len(labels):
+        return ""
+
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                             for k, v in labels)
+
+
+def format_value(value):
+
+    if isinstance(value, int):
+        return "%d" % value
+
+    return repr(float(value))
+
+
+class Registry:
+
+    def __init__(self):
+
+        self.enabled = False
+        self.lock = threading.Lock()
+
+        # name -> (kind, help, labels -> metric), labels a sorted tuple
+        self.families = {}
+
+    def get(self, cls, name, help, labels, *args):
+
+        # None while disabled, instrumented code skips its metrics then
+        if not self.enabled:
+            return None
+
+        key = tuple(sorted(labels.items()))
+
+        with self.lock:
+            family = self.families.get(name)
+
+            if family is None:
+                family = self.families[name] = (cls.KIND, help, {})
+
+            metric = family[2].get(key)
+
+            if metric is None:
+                metric = family[2][key] = cls(*args)
+            elif cls is not Histogram and args[0] is not None:
+                # a new object took over, e.g. a reopened port
+                metric.func = args[0]
+
+        return metric
+
+    def counter(self, name, help, func=None, **labels):
+        return self.get(Counter, name, help, labels, func)
+
+    def gauge(self, name, help, func=None, **labels):
+        return self.get(Gauge, name, help, labels, func)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self.get(Histogram, name, help, labels, buckets)
+
+    def families_sorted(self):
+
+        with self.lock:
+            return [(name, kind, help, sorted(metrics.items()))
+                    for name, (kind, help, metrics) in
+                    sorted(self.families.items())]
+
+    def expose(self):
+
+        # Prometheus text format
+        lines = []
+
+        for name, kind, help, metrics in self.families_sorted():
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+
+            for labels, metric in metrics:
+                for sample, sample_labels, value in metric.samples(name,
+                                                                   labels):
+                    lines.append("%s%s %s" % (sample,
+                                              format_labels(sample_labels),
+                                              format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+
+        # a single line for logs, histograms as count/mean
+        items = []
+
+        for name, _, _, metrics in self.families_sorted():
+            if name.startswith("moppy_"):
+                name = name[len("moppy_"):]
+
+            for labels, metric in metrics:
+                items.append("%s%s=%s" % (name, format_labels(labels),
+                                          metric.summary()))
+
+        return " ".join(items)
+
+
+REGISTRY = Registry()
+
+
+def enable(enabled=True):
+    REGISTRY.enabled = enabled
+
+
+def enabled():
+    return REGISTRY.enabled
+
+
+def counter(name, help, func=None, **labels):
+    return REGISTRY.counter(name, help, func, **labels)
+
+
+def gauge(name, help, func=None, **labels):
+    return REGISTRY.gauge(name, help, func, **labels)
+
+
+def histogram(name, help, buckets=LATENCY_BUCKETS, **labels):
+    return REGISTRY.histogram(name, help, buckets, **labels)
+
+
+class SendMeter:
+
+    def __init__(self, port, clock=time.perf_counter):
+
+        # counts what is sent to a port per channel and times sending
+        self.port = port
+        self.clock = clock
+        self.sent = {}
+        self.latency = histogram("moppy_send_latency_seconds",
+                                 "Time taken to hand an event to the port",
+                                 port=self.port)
+
+    @classmethod
+    def create(cls, port):
+
+        if not enabled():
+            return None
+
+        return cls(port)
+
+    def send(self, send, data, channel=None, count=1):
+
+        start = self.clock()
+        send(data)
+        self.latency.observe(self.clock() - start)
+
+        sent = self.sent.get(channel)
+
+        if sent is None:
+            sent = self.sent[channel] = counter(
+                "moppy_events_sent_total", "Events sent to a port",
+                port=self.port, channel="all" if channel is None else channel)
+
+        sent.inc(count)
@@ -0,0 +1,159 @@
+import struct
+import mmap
+import time
+import os
+
+# Binary Moppy recording:
+#
+#   header  - magic, version, record size, index interval, record count,
+#             offset of the seek index (0 while still recording)
+#   records - time (seconds since start of the recording), pin, value
+#   index   - (time, record number) of every index interval'th record
+HEADER = struct.Struct("<4sHHIQQ")
+RECORD = struct.Struct("<dBxH")
+INDEX = struct.Struct("<dQ")
+
+MAGIC = b"MTFB"
+VERSION = 1
+
+
+def is_mtf(file_path):
+
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class MtfWriter:
+
+    def __init__(self, file_path, interval=1024, clock=time.monotonic):
+
+        self.interval = interval
+        self.clock = clock
+        self.start = None
+        self.count = 0
+        self.index = []
+
+        self.file = open(file_path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, interval,
+                                    0, 0))
+
+    def __del__(self):
+
+        self.close()
+
+    def write(self, pin, value, t=None):
+
+        if t is None:
+            now = self.clock()
+
+            if self.start is None:
+                self.start = now
+
+            t = now - self.start
+
+        if self.count % self.interval == 0:
+            self.index.append((t, self.count))
+
+        self.file.write(RECORD.pack(t, pin, value))
+        self.count += 1
+
+    def close(self):
+
+        if self.file is None:
+            return
+
+        offset = HEADER.size + self.count * RECORD.size
+
+        for t, n in self.index:
+            self.file.write(INDEX.pack(t, n))
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size,
+                                    self.interval, self.count, offset))
+        self.file.close()
+        self.file = None
+
+
+class MtfReader:
+
+    def __init__(self, file_path):
+
+        self.file = open(file_path, "rb")
+
+        if os.fstat(self.file.fileno()).st_size < HEADER.size:
+            raise RuntimeError("Not a Moppy recording: %s" % file_path)
+
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, size, self.interval, self.count, offset = \
+            HEADER.unpack_from(self.map)
+
+        if magic != MAGIC or version != VERSION or size != RECORD.size:
+            raise RuntimeError("Not a Moppy recording: %s" % file_path)
+
+        if offset:
+            self.index = [INDEX.unpack_from(self.map, offset + i * INDEX.size)
+                          for i in range((len(self.map) - offset) //
+                                         INDEX.size)]
+        else:
+            # recording was not closed properly, rebuild what close() writes
+            self.count = (len(self.map) - HEADER.size) // RECORD.size
+            self.index = [(self.time(n), n)
+                          for n in range(0, self.count, self.interval)]
+
+        self.index_times = [t for t, _ in self.index]
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+
+        self.map.close()
+        self.file.close()
+
+    def time(self, n):
+
+        return RECORD.unpack_from(self.map, HEADER.size +
+                                  n * RECORD.size)[0]
+
+    def record(self, n):
+
+        return RECORD.unpack_from(self.map, HEADER.size + n * RECORD.size)
+
+    @property
+    def length(self):
+
+        if not self.count:
+            return 0.0
+
+        return self.time(self.count - 1)
+
+    def find(self, t):
+
+        # first record at or after t
+        lo = 0
+        hi = self.count
+
+        i = 0
+        j = len(self.index_times)
+
+        while i < j:
+            m = (i + j) // 2
+            if self.index_times[m] < t:
+                i = m + 1
+            else:
+                j = m
+
+        if i > 0:
+            lo = self.index[i - 1][1]
+        if i < len(self.index):
+            hi = self.index[i][1]
+
+        while lo < hi:
+            m = (lo + hi) // 2
+            if self.time(m) < t:
+                lo = m + 1
+            else:
+                hi = m
+
+        return lo
@@ -0,0 +1,51 @@
+# Generated by moppy-kmod/scripts/genmidiperiods.py, do not edit.
+#
+# NOTE_PERIODS - half period of each MIDI note in timer ticks of the
+#                firmware, fixed point with FRACTION_BITS
+# BEND_FACTORS - period factors (16.16 fixed point) for pitch bends of
+#                -BEND_RANGE to BEND_RANGE semitones in BEND_STEPS per
+#                semitone, no bend is at BEND_RANGE * BEND_STEPS
+
+TICK_US = 40
+FRACTION_BITS = 4
+BEND_RANGE = 2
+BEND_STEPS = 32
+
+NOTE_PERIODS = [
+    24462, 23089, 21794, 20570, 19416, 18326, 17298, 16327,  # notes   0 -   7
+    15410, 14545, 13729, 12959, 12231, 11545, 10897, 10285,  # notes   8 -  15
+     9708,  9163,  8649,  8163,  7705,  7273,  6865,  6479,  # notes  16 -  23
+     6116,  5772,  5448,  5143,  4854,  4582,  4324,  4082,  # notes  24 -  31
+     3853,  3636,  3432,  3240,  3058,  2886,  2724,  2571,  # notes  32 -  39
+     2427,  2291,  2162,  2041,  1926,  1818,  1716,  1620,  # notes  40 -  47
+     1529,  1443,  1362,  1286,  1213,  1145,  1081,  1020,  # notes  48 -  55
+      963,   909,   858,   810,   764,   722,   681,   643,  # notes  56 -  63
+      607,   573,   541,   510,   482,   455,   429,   405,  # notes  64 -  71
+      382,   361,   341,   321,   303,   286,   270,   255,  # notes  72 -  79
+      241,   227,   215,   202,   191,   180,   170,   161,  # notes  80 -  87
+      152,   143,   135,   128,   120,   114,   107,   101,  # notes  88 -  95
+       96,    90,    85,    80,    76,    72,    68,    64,  # notes  96 - 103
+       60,    57,    54,    51,    48,    45,    43,    40,  # notes 104 - 111
+       38,    36,    34,    32,    30,    28,    27,    25,  # notes 112 - 119
+       24,    23,    21,    20,    19,    18,    17,    16  # notes 120 - 127
+]
+
+BEND_FACTORS = [
+    73562, 73429, 73297, 73164, 73032, 72901, 72769, 72638,
+    72507, 72376, 72246, 72115, 71985, 71856, 71726, 71597,
+    71468, 71339, 71210, 71082, 70953, 70825, 70698, 70570,
+    70443, 70316, 70189, 70062, 69936, 69810, 69684, 69558,
+    69433, 69308, 69183, 69058, 68933, 68809, 68685, 68561,
+    68438, 68314, 68191, 68068, 67945, 67823, 67700, 67578,
+    67456, 67335, 67213, 67092, 66971, 66850, 66730, 66609,
+    66489, 66369, 66250, 66130, 66011, 65892, 65773, 65654,
+    65536, 65418, 65300, 65182, 65065, 64947, 64830, 64713,
+    64596, 64480, 64364, 64248, 64132, 64016, 63901, 63785,
+    63670, 63555, 63441, 63326, 63212, 63098, 62984, 62871,
+    62757, 62644, 62531, 62419, 62306, 62194, 62081, 61970,
+    61858, 61746, 61635, 61524, 61413, 61302, 61191, 61081,
+    60971, 60861, 60751, 60642, 60532, 60423, 60314, 60205,
+    60097, 59988, 59880, 59772, 59664, 59557, 59449, 59342,
+    59235, 59128, 59022, 58915, 58809, 58703, 58597, 58491,
+    58386
+]
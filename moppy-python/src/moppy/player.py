@@ -1,17 +1,464 @@
+import collections
+import threading
+import bisect
+import math
 import argparse
+import logging
+import random
+import array
 import operator
 import struct
-import curses
-import serial
 import time
 import mido
 import os
 
-from moppy import version
+from moppy import version, sysfs, voices, metrics
+
+
+# A single, already transformed output event of a compiled schedule:
+#
+#   time   - absolute time in seconds from the start of the song
+#   msg    - the mapped mido message (or a Note when loaded from the cache)
+#   data   - msg pre-encoded by the port (or msg itself for plain mido ports)
+#   update - arguments for the player's update hook (channel, octave, note)
+#   pitch  - pitch wheel value the note is bent by (see SerialPort)
+Event = collections.namedtuple('Event', ['time', 'msg', 'data', 'update',
+                                         'pitch'])
+
+
+class Note(collections.namedtuple('Note', ['type', 'channel', 'note',
+                                           'velocity'])):
+
+    # what ports encoding ahead need of a note message, much cheaper to build
+    # than a mido message, which checks every value
+    __slots__ = ()
+
+    def copy(self, **overrides):
+        return self._replace(**overrides)
+
+    def message(self):
+        return mido.Message(self.type, channel=self.channel, note=self.note,
+                            velocity=self.velocity)
+
+
+class Schedule:
+
+    CHECKPOINT = 1.0
+
+    def __init__(self, events=None, length=0.0):
+
+        if events is None:
+            self.events = []
+        else:
+            self.events = events
+
+        self.length = length
+
+        # (time, position, drive -> sounding note event) at the start of
+        # every CHECKPOINT seconds, built on the first seek
+        self.checkpoints = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def build_index(self):
+
+        checkpoints = []
+        active = {}
+        t = 0.0
+
+        for i, event in enumerate(self.events):
+
+            while event.time >= t:
+                checkpoints.append((t, i, dict(active)))
+                t += self.CHECKPOINT
+
+            if event.msg.type == 'note_on':
+                active[event.msg.channel] = event
+            else:
+                active.pop(event.msg.channel, None)
+
+        checkpoints.append((t, len(self.events), dict(active)))
+
+        self.checkpoints = checkpoints
+        self.times = [c[0] for c in checkpoints]
+        self.positions = [c[1] for c in checkpoints]
+
+    def replay(self, k, until):
+
+        # drive -> sounding note from checkpoint k up to the event until
+        # returns true for
+        _, i, active = self.checkpoints[k]
+        active = dict(active)
+
+        while i < len(self.events) and not until(i):
+            msg = self.events[i].msg
+
+            if msg.type == 'note_on':
+                active[msg.channel] = self.events[i]
+            else:
+                active.pop(msg.channel, None)
+
+            i += 1
+
+        return i, active
+
+    def locate(self, t):
+
+        # position of the first event at or after t and what sounds there,
+        # so at most one checkpoint interval is replayed
+        if self.checkpoints is None:
+            self.build_index()
+
+        k = max(0, bisect.bisect_right(self.times, t) - 1)
+
+        return self.replay(k, lambda i: self.events[i].time >= t)
+
+    def active(self, position):
+
+        # what sounds right before the event at position
+        if self.checkpoints is None:
+            self.build_index()
+
+        k = max(0, bisect.bisect_right(self.positions, position) - 1)
+
+        return self.replay(k, lambda i: i >= position)[1]
+
+
+class LatencyStats:
+
+    # samples kept for percentiles, picked uniformly from all added ones
+    # (reservoir sampling), so memory and each poll stay bounded no matter
+    # how long it plays
+    RESERVOIR = 1024
+
+    def __init__(self, size=RESERVOIR):
+
+        self.size = size
+        self.random = random.Random().random
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def __str__(self):
+        return "events=%d, min=%.3fms, mean=%.3fms, p99=%.3fms, " \
+               "max=%.3fms" % (len(self), self.min * 1000,
+                               self.mean * 1000, self.p99 * 1000,
+                               self.max * 1000)
+
+    def reset(self):
+
+        self.samples = array.array('d')
+        self.count = 0
+        self.sum = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+
+        count = self.count
+
+        if not count:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+        self.count = count + 1
+        self.sum += value
+
+        if count < self.size:
+            self.samples.append(value)
+        else:
+            i = int(self.random() * (count + 1))
+
+            if i < self.size:
+                self.samples[i] = value
+
+    @property
+    def mean(self):
+
+        if not self.count:
+            return 0.0
+
+        return self.sum / self.count
+
+    def percentile(self, p):
+
+        samples = sorted(self.samples)
+
+        if not len(samples):
+            return 0.0
+
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    def as_dict(self):
+
+        return {
+            "events": len(self),
+            "min": self.min,
+            "mean": self.mean,
+            "p99": self.p99,
+            "max": self.max
+        }
+
+
+class Scheduler:
+
+    def __init__(self, spin=0.0, clock=time.monotonic):
+
+        self.spin = spin
+        self.clock = clock
+        self.start = None
+        self.stats = LatencyStats()
+        self.stopped = threading.Event()
+
+        # playback controls, applied by the running schedule when changed is
+        # set, the song time at anchor plays at the wall clock time anchored
+        self.changed = threading.Event()
+        self.tempo = 1.0
+        self.loop = None
+        self.target = None
+
+        self.anchor = 0.0
+        self.anchored = 0.0
+        self.rate = 1.0
+
+        self.lateness = metrics.histogram(
+            "moppy_schedule_lateness_seconds",
+            "Time events were handed out after they were due")
+
+    def notify(self):
+        self.changed.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.notify()
+
+    def seek(self, t):
+
+        self.target = max(0.0, t)
+        self.notify()
+
+    def set_tempo(self, tempo):
+
+        if not (tempo > 0.0 and math.isfinite(tempo)):
+            raise ValueError("Invalid tempo: %s" % tempo)
+
+        self.tempo = tempo
+        self.notify()
+
+    def set_loop(self, start=None, end=None):
+
+        # plays the section from start to end over and over, None stops
+        # looping and plays on from where it is
+        if start is None or end is None:
+            self.loop = None
+        elif 0.0 <= start < end:
+            self.loop = (start, end)
+        else:
+            raise ValueError("Invalid loop: %s - %s" % (start, end))
+
+        self.notify()
+
+    def due(self, t):
+        return self.anchored + (t - self.anchor) / self.rate
+
+    def begin(self):
+
+        self.stats.reset()
+        self.changed.clear()
+        self.target = None
+        self.loop = None
+
+        self.start = self.anchored = self.clock()
+        self.anchor = 0.0
+        self.rate = self.tempo
+
+    def update(self, schedule, i, off=None):
+
+        # re-anchor, so a new tempo applies from the current position on
+        self.changed.clear()
+
+        now = self.clock()
+
+        self.anchor = self.position
+        self.anchored = now
+        self.rate = self.tempo
+
+        target, self.target = self.target, None
+
+        if target is None:
+            return i, []
+
+        return self.jump(schedule, i, target, off)
+
+    def jump(self, schedule, i, t, off=None):
+
+        # events restoring the drives to what sounds at t: offs for drives
+        # sounding now but not there, then the notes sounding there
+        j, target = schedule.locate(t)
+        current = schedule.active(i)
+
+        restore = []
+
+        if off is not None:
+            restore += [off(current[drive]) for drive in sorted(current)
+                        if drive not in target]
+
+        restore += [event for drive, event in sorted(target.items())
+                    if current.get(drive) is not event]
+
+        self.anchor = t
+        self.anchored = self.clock()
+
+        return j, restore
+
+    def upcoming(self, schedule, i):
+
+        # (song time, event) to wait for next, the event is None at the end
+        # of the looped section, the time None at the end of the song
+        loop = self.loop
+
+        if loop is not None and (i == len(schedule.events) or
+                                 schedule.events[i].time >= loop[1]):
+            return loop[1], None
+
+        if i == len(schedule.events):
+            return None, None
+
+        return schedule.events[i].time, schedule.events[i]
+
+    def run(self, schedule, flush=None, off=None):
+
+        clock = self.clock
+        wait = self.changed.wait
+        stopped = self.stopped.is_set
+        add = self.stats.add
+        spin = self.spin
+
+        if self.lateness is not None:
+            observe = self.lateness.observe
+        else:
+            observe = None
+
+        self.begin()
+
+        i = 0
+        burst = False
+
+        # a stop() issued before the run started ends it right away
+        try:
+            while not stopped():
+
+                if self.changed.is_set():
+                    i, restore = self.update(schedule, i, off)
+
+                    for event in restore:
+                        burst = True
+                        yield event
+
+                    continue
+
+                t, event = self.upcoming(schedule, i)
+
+                if t is None:
+                    break
+
+                due = self.due(t)
+                delay = due - clock()
+
+                # everything due up to now has been handed out, so this is
+                # the end of a burst (e.g. a chord) the port may want to flush
+                if delay > 0.0 and burst and flush is not None:
+                    flush()
+                    burst = False
+                    delay = due - clock()
+
+                # sleep for the bulk of the delay, then busy-wait for the
+                # rest, late events are sent right away to catch up, a change
+                # of the controls wakes up early
+                if delay > spin:
+                    wait(delay - spin)
+                    continue
+
+                now = clock()
+
+                while now < due:
+                    now = clock()
+
+                if event is None:
+                    loop = self.loop
+
+                    # unless looping was stopped meanwhile
+                    if loop is not None:
+                        i, restore = self.jump(schedule, i, loop[0], off)
+
+                        for event in restore:
+                            burst = True
+                            yield event
+
+                    continue
+
+                add(now - due)
+
+                if observe is not None:
+                    observe(now - due)
+
+                i += 1
+                burst = True
+
+                yield event
+
+            if flush is not None:
+                flush()
+        finally:
+            self.stopped.clear()
+
+    @property
+    def elapsed(self):
+
+        if self.start is None:
+            return 0.0
+
+        return self.clock() - self.start
+
+    @property
+    def position(self):
+
+        # current time in the song
+        if self.start is None:
+            return 0.0
+
+        return self.anchor + (self.clock() - self.anchored) * self.rate
+
+
+def unsupported(port, message):
+
+    port.logger.warning("unsupported message type: %s" % message.type)
+
+    count = metrics.counter("moppy_unsupported_messages_total",
+                            "Messages a port could not encode",
+                            port=type(port).__name__)
+
+    if count is not None:
+        count.inc()
 
 
 class NullPort(mido.ports.BaseOutput):
 
+    def encode(self, message):
+        return None
+
+    def send_encoded(self, data):
+        pass
+
     def _send(self, message):
         pass
 
@@ -21,30 +468,105 @@ class NullPort(mido.ports.BaseOutput):
 
 class MoppySysfsPort(mido.ports.BaseOutput):
 
+    def __init__(self, persistent=True, batch=True,
+                 base_path="/sys/kernel/moppy/"):
+        mido.ports.BaseOutput.__init__(self)
+
+        self.logger = logging.getLogger('sysfsp')
+
+        self.base_path = base_path
+        self.batch = batch
+        self.pending = []
+
+        if persistent:
+            self.files = sysfs.SysfsFiles(base_path)
+        else:
+            self.files = None
+
+        # newer kernel modules take several updates with one write
+        self.bulk = os.access(base_path + "bulk", os.W_OK)
+
+        if not self.bulk and os.path.exists(base_path + "bulk"):
+            self.logger.info("bulk not writable, writing attributes singly")
+
+    def _close(self):
+
+        if self.files is not None:
+            self.files.close()
+
     def _write_sysfs(self, msg, target="freq"):
 
-        with open("/sys/kernel/moppy/" + target, "w") as f:
-            f.write(msg)
+        if self.files is not None:
+            self.files.write(target, msg)
+        else:
+            with open(self.base_path + target, "wb") as f:
+                f.write(msg)
+
+    def encode(self, message):
+
+        if message.type in ('note_on', 'note_off') and \
+                message.channel > sysfs.SysfsFiles.MAX_CHANNEL:
+            # no such drive, e.g. without --choptimize
+            self.logger.debug("no drive for channel %d" % message.channel)
+            return None
+
+        if self.bulk:
+            if message.type == 'note_on':
+                return "bulk", b"n %d, %d" % (message.channel, message.note)
+            elif message.type == 'note_off':
+                return "bulk", b"f %d, %d" % (message.channel, 0)
+        else:
+            if message.type == 'note_on':
+                return "note", b"%d, %d" % (message.channel, message.note)
+            elif message.type == 'note_off':
+                return "freq", b"%d, %d" % (message.channel, 0)
 
-    def _send(self, message):
+        unsupported(self, message)
 
-        if message.type == 'note_on':
+        return None
 
-            msg = "%d, %d" % (message.channel, message.note)
-            self._write_sysfs(msg, "note")
+    def send_encoded(self, data):
 
-        elif message.type == 'note_off':
-            msg = "%d, %d" % (message.channel, 0)
+        if data is None:
+            return
+
+        if self.batch:
+            self.pending.append(data)
+        else:
+            self._write_sysfs(data[1], data[0])
+
+    def flush(self):
+
+        if not self.pending:
+            return
 
-            # print(msg)
-            self._write_sysfs(msg)
+        burst = self.pending
+        self.pending = []
 
+        if self.bulk and self.files is not None:
+            self.files.write_bulk([msg for _, msg in burst])
+        elif self.bulk:
+            for i in range(0, len(burst), sysfs.SysfsFiles.MAX_BULK):
+                self._write_sysfs(b"\n".join(
+                    msg for _, msg in
+                    burst[i:i + sysfs.SysfsFiles.MAX_BULK]), "bulk")
+        elif self.files is not None:
+            self.files.write_burst(burst)
         else:
-            print("** unsupported message type: %s" % message.type)
+            for target, msg in burst:
+                self._write_sysfs(msg, target)
+
+    def _send(self, message):
+
+        data = self.encode(message)
+
+        if data is not None:
+            self._write_sysfs(data[1], data[0])
 
     def reset(self):
 
-        self._write_sysfs("reset", "ctrl")
+        self.pending = []
+        self._write_sysfs(b"reset", "ctrl")
 
 
 class SerialPort(mido.ports.BaseOutput):
@@ -65,43 +587,111 @@ class SerialPort(mido.ports.BaseOutput):
         0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
     ]
 
-    def __init__(self, port, baudrate):
+    def __init__(self, port, baudrate=9600, fine=False):
+
+        from moppy import serialout
+
         mido.ports.BaseOutput.__init__(self)
 
-        self.serial = serial.Serial(port=port, baudrate=baudrate)
+        self.logger = logging.getLogger('serialp')
 
-    def _send(self, message):
+        self.serialout = serialout
+        self.output = serialout.SerialOutput(port, baudrate, fine)
+        self.fine = self.output.fine
+
+        # with fine periods pitch bends are compiled into the schedule
+        self.bends = self.fine
+
+        # time a frame takes on the line
+        self.latency = serialout.FRAME_SIZE * 10.0 / \
+            self.output.serial.baudrate
+
+    def encode(self, message, pitch=0):
 
         if message.type == 'note_on':
 
             ch = (message.channel * 2) + 2
+
+            if self.fine:
+                return struct.pack("!BH", ch | self.serialout.FINE,
+                                   self.serialout.fine_period(message.note,
+                                                              pitch))
+
             per = self.MIDI_NOTE_PERIODS[message.note] // 80
-            msg = struct.pack("!BH", ch, per)
 
-            self.serial.write(msg)
+            return struct.pack("!BH", ch, per)
 
         elif message.type == 'note_off':
 
             ch = (message.channel * 2) + 2
-            msg = struct.pack("!BH", ch, 0)
 
-            self.serial.write(msg)
+            return struct.pack("!BH", ch, 0)
 
-        else:
-            print("** unsupported message type: %s" % message.type)
+        unsupported(self, message)
+
+        return None
+
+    def send_encoded(self, data):
+
+        if data is not None:
+            self.output.write(data)
+
+    def _send(self, message):
+
+        self.send_encoded(self.encode(message))
 
     def reset(self):
 
         msg = struct.pack("!BH", 100, 0)
 
-        self.serial.write(msg)
+        self.output.write(msg)
+        self.output.flush()
+
+    def _close(self):
+
+        self.output.close()
+
+
+class UdpPort(SerialPort):
+
+    def __init__(self, host, port, legacy=False, latency=0.0):
+
+        from moppy import proxy
+
+        mido.ports.BaseOutput.__init__(self)
+
+        self.logger = logging.getLogger('udpp')
+
+        # frames like to the Arduino, for a proxy on a remote Pi
+        self.writer = proxy.UdpWriter(host, port, legacy)
+        self.fine = False
+        self.bends = False
+        self.latency = latency
+
+    def send_encoded(self, data):
+
+        if data is not None:
+            self.writer.write_msg(data)
+
+    def flush(self):
+
+        self.writer.flush()
+
+    def reset(self):
+
+        self.writer.write_msg(struct.pack("!BH", 100, 0))
+        self.writer.flush()
+
+    def _close(self):
+
+        self.writer.socket.close()
 
 
 class Player:
 
     def __init__(self, port, filename=None, ch_max=4, ch_filter=None,
                  ch_optimize=True, ch_mirror=False, octave_optimize=True,
-                 update_hook=None):
+                 update_hook=None, spin=0.0, voices=None):
 
         self.port = port
         self.filename = filename
@@ -121,18 +711,20 @@ class Player:
         self.octave_optimize = octave_optimize
         self.ch_mirror = ch_mirror
 
+        # voice allocation policy (see VoiceAllocator), replaces the
+        # channel mapping when set
+        self.voices = voices
+
         self.update_hook = update_hook
         self.playing = False
 
-    def play(self, midi=None, info=None):
+        self.scheduler = Scheduler(spin)
 
-        self.port.reset()
+    @property
+    def stats(self):
+        return self.scheduler.stats
 
-        if midi is None:
-            midi = mido.MidiFile(self.filename)
-
-        if info is None:
-            info = self.analyze(midi)
+    def channel_map(self, info):
 
         ch_map = {}
 
@@ -157,301 +749,252 @@ class Player:
             for ch in self.ch_filter:
                 ch_map[ch] = ch
 
-        self.playing = True
+        return ch_map
 
-        for msg in midi.play():
+    def compile(self, midi=None, info=None):
 
-            if not self.playing:
-                break
+        if midi is None:
+            midi = mido.MidiFile(self.filename)
 
-            if msg.type in ['note_on', 'note_off'] and msg.channel in ch_map:
+        if info is None:
+            info = self.analyze(midi)
 
-                if self.octave_optimize:
-                    msg = self.constraint_octave(msg)
+        if self.voices is not None:
+            return self.compile_voices(midi, info)
 
-                msg.channel = ch_map[msg.channel]
+        ch_map = self.channel_map(info)
+        encode = getattr(self.port, "encode", None)
+        bends = getattr(self.port, "bends", False)
 
-                octave = msg.note // 12 - 1
+        events = []
+        now = 0.0
 
-                if self.update_hook is not None:
-                    if msg.type == 'note_on':
-                        self.update_hook(msg.channel, octave, msg.note % 12)
-                        if self.ch_mirror:
-                            self.update_hook(msg.channel + self.ch_max, octave,
-                                             msg.note % 12)
-                    else:
-                        self.update_hook(msg.channel, octave, 12)
-                        if self.ch_mirror:
-                            self.update_hook(msg.channel + self.ch_max,
-                                             octave, 12)
+        # source channel -> pitch wheel, drive -> sounding note
+        pitch = {}
+        sounding = {}
 
-                self.port.send(msg)
+        for msg in midi:
 
-                if self.ch_mirror:
-                    mirror_msg = msg.copy()
-                    mirror_msg.channel += self.ch_max
-                    self.port.send(mirror_msg)
+            now += msg.time
 
-        self.port.reset()
+            if msg.type == 'pitchwheel' and bends and msg.channel in ch_map:
+                pitch[msg.channel] = msg.pitch
+                note = sounding.get(ch_map[msg.channel])
 
-        self.playing = False
+                if note is not None:
+                    self.emit(events, now, note, encode, msg.pitch)
 
-    @staticmethod
-    def analyze(midi):
+                continue
 
-        stats = {
-            "channels": {},
-            "octaves": {},
-        }
+            if msg.type not in ['note_on', 'note_off'] or \
+                    msg.channel not in ch_map:
+                continue
+
+            if self.octave_optimize:
+                msg = self.constraint_octave(msg)
+
+            bend = pitch.get(msg.channel, 0)
+
+            msg.channel = ch_map[msg.channel]
+            msg.time = 0
+
+            if msg.type == 'note_on':
+                sounding[msg.channel] = msg
+            else:
+                sounding.pop(msg.channel, None)
+
+            self.emit(events, now, msg, encode, bend)
+
+        return Schedule(events, midi.length)
+
+    def compile_voices(self, midi, info):
+
+        allocator = voices.VoiceAllocator(self.ch_max, self.voices,
+                                          info["channels"])
+        ch_filter = set(self.ch_filter)
+        encode = getattr(self.port, "encode", None)
+        bends = getattr(self.port, "bends", False)
+
+        events = []
+        now = 0.0
+
+        # source channel -> pitch wheel, drive -> (source channel, note)
+        pitch = {}
+        sounding = {}
 
         for msg in midi:
 
-            if not msg.is_meta and msg.type == 'note_on':
+            now += msg.time
 
-                if msg.channel in stats["channels"]:
-                    stats["channels"][msg.channel] += 1
-                else:
-                    stats["channels"][msg.channel] = 1
+            if msg.type == 'pitchwheel' and bends and \
+                    msg.channel in ch_filter:
+                pitch[msg.channel] = msg.pitch
 
-                octave = int(msg.note / 12) - 1
+                for channel, note in sounding.values():
+                    if channel == msg.channel:
+                        self.emit(events, now, note, encode, msg.pitch)
 
-                if octave in stats["octaves"]:
-                    stats["octaves"][octave] += 1
-                else:
-                    stats["octaves"][octave] = 1
+                continue
 
-                    # print(msg)
+            if msg.type not in ['note_on', 'note_off'] or \
+                    msg.channel not in ch_filter:
+                continue
 
-        return stats
+            channel = msg.channel
 
-    @staticmethod
-    def constraint_octave(msg):
+            # voices are tracked by the original note, clamping may map
+            # several of them to the same one
+            if msg.type == 'note_on' and msg.velocity > 0:
+                drive = allocator.note_on(msg.channel, msg.note)
+                msg = mido.Message('note_on', channel=0, note=msg.note,
+                                   velocity=msg.velocity)
+            else:
+                drive = allocator.note_off(msg.channel, msg.note)
+                msg = mido.Message('note_off', channel=0, note=msg.note)
 
-        octave = msg.note // 12 - 1
+            if drive is None:
+                continue
 
-        if octave < 2:
-            msg.note += (2 - octave) * 12
-        elif octave > 5:
-            msg.note -= (octave - 5) * 12
+            if self.octave_optimize:
+                msg = self.constraint_octave(msg)
 
-        return msg
+            msg.channel = drive
 
-    def stop(self):
-        self.playing = False
+            if msg.type == 'note_on':
+                sounding[drive] = (channel, msg)
+            else:
+                sounding.pop(drive, None)
 
+            self.emit(events, now, msg, encode, pitch.get(channel, 0))
 
-class VisualPlayer(Player):
+        return Schedule(events, midi.length)
 
-    def __init__(self, port, filename=None, ch_max=4, ch_filter=None,
-                 ch_optimize=True, ch_mirror=False,
-                 octave_optimize=True):
+    def emit(self, events, t, msg, encode, pitch=0):
 
-        Player.__init__(self, port, filename, ch_max, ch_filter, ch_optimize,
-                        ch_mirror, octave_optimize, self.set_note)
+        events.append(self.make_event(t, msg, encode, pitch))
 
-        self.ch_last_oct = {}
-        self.info_height = 15
-        self.play_time = 0
+        if self.ch_mirror:
+            events.append(self.make_event(
+                t, msg.copy(channel=msg.channel + self.ch_max), encode,
+                pitch))
 
-        self.file_info = [
-            "",
-            (0, 0),
-            0,
-            0,
-            0,
-            "",
-            0,
-            "",
-            ""
-        ]
+    @staticmethod
+    def make_event(t, msg, encode=None, pitch=0):
 
-        self.stdscr = curses.initscr()
+        if msg.type == 'note_on':
+            note = msg.note % 12
+        else:
+            note = 12
 
-        curses.noecho()
-        curses.cbreak()
-        self.stdscr.keypad(1)
-        self.stdscr.nodelay(True)
+        if encode is None:
+            data = msg
+        elif pitch:
+            # only ports with bends set get a pitch
+            data = encode(msg, pitch)
+        else:
+            data = encode(msg)
 
-        curses.start_color()
-        curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
-        curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_GREEN)
-        curses.init_pair(3, curses.COLOR_WHITE, curses.COLOR_BLUE)
-        curses.init_pair(4, curses.COLOR_WHITE, curses.COLOR_RED)
+        return Event(t, msg, data, (msg.channel, msg.note // 12 - 1, note),
+                     pitch)
 
-        self.stdscr.bkgd(curses.color_pair(1))
-        self.show()
+    def off_event(self, sounding):
 
-    def __del__(self):
+        # silences the drive of a sounding event when seeking to where it
+        # does not play, in its octave like the off in the song would
+        msg = mido.Message('note_off', channel=sounding.msg.channel,
+                           note=sounding.msg.note)
 
-        self.hide()
+        return self.make_event(0.0, msg, getattr(self.port, "encode", None))
 
-    def hide(self):
+    def play(self, midi=None, info=None, schedule=None, reset=True):
 
-        curses.nocbreak()
-        self.stdscr.keypad(0)
-        curses.echo()
-        curses.endwin()
+        if reset:
+            self.port.reset()
 
-    def show(self):
+        if schedule is None:
+            schedule = self.compile(midi, info)
 
-        self.stdscr.refresh()
+        if hasattr(self.port, "send_encoded"):
+            send = self.port.send_encoded
+        else:
+            send = self.port.send
 
-        y, x = self.stdscr.getmaxyx()
+        flush = getattr(self.port, "flush", None)
+        update_hook = self.update_hook
 
-        self.max_x = x
-        self.max_y = y
+        # only with metrics enabled, sending is counted and timed
+        meter = metrics.SendMeter.create(type(self.port).__name__)
 
-        if self.max_x >= 95 and self.max_y >= 35:
+        self.playing = True
 
-            self.win_info = curses.newwin(self.info_height, self.max_x, 1, 0)
-            self.win_info.bkgd(curses.color_pair(1))
-            self.win_info.box()
-            self.win_info.refresh()
+        for _, msg, data, update, _ in self.scheduler.run(schedule, flush,
+                                                          self.off_event):
 
-            self.win_notes = curses.newwin(self.max_y - (self.info_height + 1),
-                                           self.max_x, (self.info_height + 1),
-                                           0)
-            self.win_notes.bkgd(curses.color_pair(1))
-            self.win_notes.box()
-            self.win_notes.refresh()
+            if not self.playing:
+                break
 
-            self.win_menu = curses.newwin(1, self.max_x, 0, 0)
-            self.win_menu.bkgd(curses.color_pair(2))
-            self.win_menu.addstr(0, 1, "MoppyPlayer %s - F10: exit" %
-                                 version.FULL)
-            self.win_menu.refresh()
+            if update_hook is not None:
+                update_hook(*update)
 
-            self.show_notes()
-            self.update_file_info()
+            if meter is None:
+                send(data)
+            else:
+                meter.send(send, data, msg.channel)
 
+        # without a reset the heads stay where they are, so the next song
+        # can follow right away
+        if reset:
+            self.port.reset()
         else:
-            self.hide()
-            print("*** window too small ***")
-            exit(1)
-
-        self.stdscr.refresh()
-
-    def show_notes(self):
-
-        self.ch_last_oct = {}
-
-        y = (self.max_y - self.info_height - 12) // 2
-        x = (self.max_x - 88) // 2
-
-        self.win_notes.addstr(y, x, "c/o    0    1    2    3    4    5" +
-                              "    6    7    8    9   10   11" +
-                              "   12   13   14   15  c/o",
-                              curses.color_pair(2))
-
-        for o in range(10):
-            self.win_notes.addstr(y + 1 + o, x, " %d " % o,
-                                  curses.color_pair(2))
-
-            for c in range(16):
-                self.win_notes.addstr(y + 1 + o, x + 5 + c * 5, "   ",
-                                      curses.color_pair(3))
-
-            self.win_notes.addstr(y + 1 + o, x + 10 + c * 5, " %d " % o,
-                                  curses.color_pair(2))
-
-        self.win_notes.addstr(y + 11, x, "c/o    0    1    2    3    4    5" +
-                              "    6    7    8    9   10   11" +
-                              "   12   13   14   15  c/o",
-                              curses.color_pair(2))
-        self.win_notes.refresh()
-
-    def set_note(self, ch, oct, note):
-
-        notes = [
-            " C ", " C#", " D ", " D#", " E ", " F ",
-            " F#", " G ", " G#", " A ", " A#", " B ",
-            " * "
-        ]
-
-        y = (self.max_y - self.info_height - 12) // 2 + 1
-        x = (self.max_x - 88) // 2 + 5
-
-        if ch in self.ch_last_oct:
-            self.win_notes.addstr(y + self.ch_last_oct[ch], x + 5 * ch, '   ',
-                                  curses.color_pair(4))
-
-        self.win_notes.addstr(y + oct, x + 5 * ch, notes[note],
-                              curses.color_pair(3))
-        self.ch_last_oct[ch] = oct
-
-        self.win_notes.refresh()
-
-        dt = int(time.time() - self.play_time)
-        self.win_info.addstr(3, 28, "%02d:%02d" % (dt // 60, dt -
-                             (dt // 60) * 60))
-        self.win_info.refresh()
-
-        self.handle_keys()
-
-    def update_file_info(self):
-
-        self.win_info.addstr(2, 3, "File           : %s" %
-                             self.file_info[0])
-        self.win_info.addstr(3, 3, "Length         : %02d:%02d / " %
-                             self.file_info[1])
-        self.win_info.addstr(4, 3, "Type           : %d" %
-                             self.file_info[2])
-        self.win_info.addstr(5, 3, "Tracks         : %d" %
-                             self.file_info[3])
-        self.win_info.addstr(6, 3, "Channels       : %d" %
-                             self.file_info[4])
-        self.win_info.addstr(7, 3, "Channels used  : %s" %
-                             self.file_info[5])
-        self.win_info.addstr(8, 3, "Octaves        : %d" %
-                             self.file_info[6])
-        self.win_info.addstr(9, 3, "Octaves used   : %s" %
-                             self.file_info[7])
-        self.win_info.addstr(10, 3, "Notes in chan. : %s" %
-                             self.file_info[8])
-        self.win_info.addstr(11, 3, "Active channels: %s" %
-                             str(self.ch_filter)[1:-1])
-        self.win_info.addstr(12, 3, "Optimizations  : channels=%s, " +
-                             "octaves=%s, nopercussion=%s, mirror=%s" %
-                             (self.ch_optimize, self.octave_optimize, 9
-                              not in self.ch_filter, self.ch_mirror))
-        self.win_info.refresh()
-
-    def handle_keys(self):
-
-        c = self.stdscr.getch()
-
-        if c == curses.KEY_RESIZE:
-            self.show()
-        elif c == curses.KEY_F10:
-            self.stop()
-
-    def play(self, midi=None, info=None):
+            self.silence()
 
-        self.port.reset()
+        self.playing = False
 
-        if midi is None:
-            midi = mido.MidiFile(self.filename)
+    def silence(self):
 
-        if info is None:
-            info = self.analyze(midi)
+        if self.ch_mirror:
+            channels = self.ch_max * 2
+        else:
+            channels = self.ch_max
+
+        for ch in range(channels):
+            self.port.send(mido.Message('note_off', channel=ch))
+
+        if hasattr(self.port, "flush"):
+            self.port.flush()
+
+    @staticmethod
+    def analyze(midi, notes=None):
 
-        self.file_info = [
-            os.path.basename(self.filename),
-            (midi.length // 60, midi.length - (midi.length // 60) * 60),
-            midi.type,
-            len(midi.tracks),
-            len(info["channels"]),
-            str([x for x in info["channels"].keys()])[1:-1],
-            len(info["octaves"]),
-            str([x for x in info["octaves"].keys()])[1:-1],
-            str(info["channels"])[1:-1]
-        ]
+        from moppy import analysis
 
-        self.update_file_info()
+        return analysis.analyze(midi, notes)
+
+    @staticmethod
+    def constraint_octave(msg):
+
+        octave = msg.note // 12 - 1
 
-        self.play_time = time.time()
+        if octave < 2:
+            msg.note += (2 - octave) * 12
+        elif octave > 5:
+            msg.note -= (octave - 5) * 12
+
+        return msg
+
+    def stop(self):
+        self.playing = False
+        self.scheduler.stop()
 
-        Player.play(self, midi, info)
+
+def __getattr__(name):
+
+    # the curses UI lives in its own module, so it is only loaded when used
+    if name == "VisualPlayer":
+        from moppy import visual
+        return visual.VisualPlayer
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def main():
@@ -463,21 +1006,60 @@ def main():
                         help="MIDI file to play")
 
     parser.add_argument("-p", "--port", default=None,
-                        help="Port to use (sysfs, serial or midiport)")
+                        help="Port to use (sysfs, serial, udp, fanout or " +
+                        "midiport)")
 
     parser.add_argument("-l", "--portlist", action="store_true", default=False,
                         help="List available MIDI ports")
 
+    parser.add_argument("--live", nargs="?", const="", default=None,
+                        help="Play live from a MIDI input port (default " +
+                        "input if no name is given)")
+
+    parser.add_argument("--inputlist", action="store_true", default=False,
+                        help="List available MIDI input ports")
+
+    parser.add_argument("--virtual", action="store_true", default=False,
+                        help="Open a virtual MIDI input port for --live " +
+                        "other programs could connect to")
+
     parser.add_argument("--serdev", default="/dev/ttyUSB0",
                         help="Serial device to use when port 'serial' " +
                         "is selected")
 
+    parser.add_argument("--baud", default=9600, type=int,
+                        help="Baud rate of the serial device, rates above " +
+                        "9600 are negotiated with the firmware")
+
+    parser.add_argument("--fine", action="store_true", default=False,
+                        help="Send full resolution periods and pitch bends " +
+                        "to the serial device (needs firmware support)")
+
+    parser.add_argument("--udphost", default="localhost",
+                        help="Host of the MoppyProxy when port 'udp' is " +
+                        "selected")
+
+    parser.add_argument("--udpport", default=12345, type=int,
+                        help="UDP port of the MoppyProxy")
+
+    parser.add_argument("--fanout", default="sysfs",
+                        help="Ports to play to in parallel when port " +
+                        "'fanout' is selected: <port>[=<drives>][@<ms>]," +
+                        "... e.g. sysfs=0-3,serial=4-7@5 (drives like " +
+                        "0-3+6, default all, ms is the latency of the port)")
+
     parser.add_argument("--chmax", default=4, type=int,
                         help="Maximum number of channels")
 
     parser.add_argument("--choptimize", action="store_true", default=False,
                         help="Try to optimize channel allocation")
 
+    parser.add_argument("--voices", default=None,
+                        choices=voices.VoiceAllocator.POLICIES,
+                        help="Allocate single notes to drives instead of " +
+                        "whole channels, stealing voices by this policy " +
+                        "(not enabled by --optimize)")
+
     parser.add_argument("--chmirror", action="store_true", default=False,
                         help="Mirror channels")
 
@@ -490,6 +1072,19 @@ def main():
     parser.add_argument("--optimize", action="store_true", default=False,
                         help="Enable all optimizations")
 
+    parser.add_argument("--spin", default=0, type=int,
+                        help="Busy-wait this many microseconds before " +
+                        "each event for tighter timing")
+
+    parser.add_argument("--stats", action="store_true", default=False,
+                        help="Print timing statistics after playback")
+
+    parser.add_argument("--headless", action="store_true", default=False,
+                        help="Play without the curses UI")
+
+    parser.add_argument("--fps", default=25, type=int,
+                        help="Maximum frame rate of the curses UI")
+
     args = parser.parse_args()
 
     if args.portlist:
@@ -500,30 +1095,99 @@ def main():
 
         exit(0)
 
+    if args.inputlist:
+        for port in mido.get_input_names():
+            print(port)
+
+        exit(0)
+
     if args.optimize:
         args.choptimize = True
         args.octoptimize = True
         args.nopercussions = True
 
-    if args.port == "sysfs":
-        port = MoppySysfsPort()
-    elif args.port == "serial":
-        port = SerialPort(args.serdev, 9600)
-    elif args.port is None:
-        port = NullPort()
+    def open_port(name):
+
+        if name == "sysfs":
+            return MoppySysfsPort()
+        elif name == "serial":
+            return SerialPort(args.serdev, args.baud, args.fine)
+        elif name == "udp":
+            return UdpPort(args.udphost, args.udpport)
+        elif name is None:
+            return NullPort()
+
+        return mido.open_output(name)
+
+    if args.port == "fanout":
+        from moppy import fanout
+
+        port = fanout.FanoutPort(fanout.parse_backends(args.fanout,
+                                                       args.chmax, open_port))
     else:
-        port = mido.open_output(args.port)
+        port = open_port(args.port)
 
-    if args.file is not None:
+    if args.nopercussions:
+        ch_filter = [0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13, 14, 15]
+    else:
+        ch_filter = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+
+    if args.live is not None:
+        from moppy import live
+
+        # a keyboard needs voices, there is no song to map channels by
+        p = live.LivePlayer(port, args.chmax, ch_filter, args.chmirror,
+                            args.octoptimize, args.voices or "oldest")
 
-        if args.nopercussions:
-            ch_filter = [0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13, 14, 15]
+        # messages are timestamped by the callback as they arrive
+        if args.virtual:
+            inport = mido.open_input(args.live or "Moppy", virtual=True,
+                                     callback=p.receive)
         else:
-            ch_filter = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+            inport = mido.open_input(args.live or None, callback=p.receive)
+
+        print("Playing live from: %s" % inport.name)
+
+        port.reset()
+
+        try:
+            p.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            inport.close()
+
+        if args.stats:
+            print("Latency: %s" % p.stats)
+
+    elif args.file is not None:
+
+        if args.headless:
+            p = Player(port, args.file, args.chmax, ch_filter,
+                       args.choptimize, args.chmirror, args.octoptimize,
+                       spin=args.spin / 1000000.0, voices=args.voices)
+
+            print("Playing: %s" % args.file)
+
+            try:
+                p.play()
+            except KeyboardInterrupt:
+                p.port.reset()
+        else:
+            from moppy import visual
+
+            p = visual.VisualPlayer(port, args.file, args.chmax, ch_filter,
+                                    args.choptimize, args.chmirror,
+                                    args.octoptimize, args.spin / 1000000.0,
+                                    args.voices, args.fps)
+            p.play()
+            p.hide()
+
+        if args.stats:
+            print("Lateness: %s" % p.stats)
 
-        vp = VisualPlayer(port, args.file, args.chmax, ch_filter,
-                          args.choptimize, args.chmirror, args.octoptimize)
-        vp.play()
+            for backend in getattr(port, "backends", []):
+                print("Lateness (%s): %s" % (backend, backend.stats))
 
 
 if __name__ == '__main__':
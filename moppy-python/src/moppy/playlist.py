@@ -0,0 +1,177 @@
+import threading
+import logging
+
+from moppy import library, metrics
+
+
+class PlayQueue:
+
+    def __init__(self, songs, port, prefetch=2, update_hook=None,
+                 on_change=None):
+
+        self.logger = logging.getLogger('playq')
+
+        self.songs = songs
+        self.port = port
+        self.prefetch = prefetch
+        self.update_hook = update_hook
+        self.on_change = on_change
+
+        # tempo every song starts with
+        self.tempo = 1.0
+
+        self.cond = threading.Condition()
+        self.stopped = False
+
+        # files waiting to be played, the first prefetch ones are compiled
+        # ahead into ready (file -> (player, schedule))
+        self.items = []
+        self.ready = {}
+        self.failed = set()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+        metrics.gauge("moppy_play_queue_length", "Songs waiting to be played",
+                      lambda: len(self.items))
+        metrics.gauge("moppy_play_queue_ready",
+                      "Queued songs compiled ahead", lambda: len(self.ready))
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def _changed(self):
+
+        # called with the lock held
+        head = self.items[:self.prefetch]
+
+        for file in list(self.ready.keys()):
+            if file not in head:
+                del self.ready[file]
+
+        self.failed.intersection_update(self.items)
+        self.cond.notify_all()
+
+    def _notify(self):
+
+        if self.on_change is not None:
+            self.on_change(self.as_list())
+
+    def add(self, file, front=False):
+
+        with self.cond:
+            if front:
+                self.items.insert(0, file)
+            else:
+                self.items.append(file)
+
+            self._changed()
+
+        self._notify()
+
+    def remove(self, idx):
+
+        with self.cond:
+            if idx < 0 or idx >= len(self.items):
+                return False
+
+            del self.items[idx]
+            self._changed()
+
+        self._notify()
+
+        return True
+
+    def clear(self):
+
+        with self.cond:
+            self.items = []
+            self._changed()
+
+        self._notify()
+
+    def __len__(self):
+        return len(self.items)
+
+    def as_list(self):
+
+        with self.cond:
+            return [{"file": file, "ready": file in self.ready}
+                    for file in self.items]
+
+    def load(self, file):
+
+        p = library.make_player(self.port, self.update_hook)
+        schedule, mirror = self.songs.load(p, file)
+
+        # ready for seeking before it plays
+        schedule.build_index()
+
+        if mirror:
+            self.logger.info("Enabled channel mirroring for %s" % file)
+
+        return p, schedule
+
+    def pop(self):
+
+        # next (file, player, schedule), compiled right here if the
+        # prefetcher did not get to it yet
+        with self.cond:
+            if not len(self.items):
+                return None
+
+            file = self.items.pop(0)
+            entry = self.ready.pop(file, None)
+
+            self._changed()
+
+        self._notify()
+
+        if entry is None:
+            self.logger.info("%s not prefetched, loading now" % file)
+            entry = self.load(file)
+
+        entry[0].scheduler.set_tempo(self.tempo)
+
+        return (file,) + entry
+
+    def _missing(self):
+
+        for file in self.items[:self.prefetch]:
+            if file not in self.ready and file not in self.failed:
+                return file
+
+        return None
+
+    def run(self):
+
+        while True:
+
+            with self.cond:
+                self.cond.wait_for(lambda: self.stopped or
+                                   self._missing() is not None)
+
+                if self.stopped:
+                    return
+
+                file = self._missing()
+
+            try:
+                entry = self.load(file)
+            except Exception as e:
+                self.logger.warning("Failed to prefetch %s: %s" % (file, e))
+                entry = None
+
+            with self.cond:
+                if entry is None:
+                    self.failed.add(file)
+                elif file in self.items[:self.prefetch]:
+                    self.ready[file] = entry
+                    self.logger.info("Prefetched: %s" % file)
+
+            self._notify()
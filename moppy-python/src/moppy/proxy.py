@@ -2,44 +2,78 @@
 
 import os
 import pty
-import serial
+import tty
 import socket
-import select
 import struct
+import selectors
+import collections
+import heapq
 import logging
 import binascii
 import argparse
 import time
 
-from moppy import version
+from moppy import version, sysfs, mtf, metrics
+
+
+FRAME_SIZE = 3
+
+
+class FrameBuffer:
+
+    def __init__(self):
+
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def feed(self, data):
+
+        self.buffer += data
+
+        n = len(self.buffer) - len(self.buffer) % FRAME_SIZE
+
+        if not n:
+            return []
+
+        frames = [bytes(self.buffer[i:i + FRAME_SIZE])
+                  for i in range(0, n, FRAME_SIZE)]
+
+        del self.buffer[:n]
+
+        return frames
+
+
+def split_frames(data):
+
+    return [data[i:i + FRAME_SIZE]
+            for i in range(0, len(data) - len(data) % FRAME_SIZE,
+                           FRAME_SIZE)]
 
 
 class SerialReader:
 
     def __init__(self, port, timeout=0.5):
 
+        import serial
+
         self.logger = logging.getLogger('serialr')
 
         self.timeout = timeout
         self.serial = serial.Serial(port=port, baudrate=9600,
                                     timeout=self.timeout)
+        self.frames = FrameBuffer()
 
         self.logger.info("created (%s)" % port)
 
-    def read_msg(self, timeout=1.0):
-
-        msg = bytearray()
+    def fileno(self):
+        return self.serial.fileno()
 
-        while len(msg) != 3:
+    def read_frames(self):
 
-            c = self.serial.read(1)
-
-            if c == '':
-                break
-            else:
-                msg += c
-
-        return msg
+        return self.frames.feed(self.serial.read(
+            max(1, self.serial.in_waiting)))
 
     def __str__(self):
         return 'serialr'
@@ -47,17 +81,25 @@ class SerialReader:
 
 class SerialWriter:
 
-    def __init__(self, port):
+    def __init__(self, port, baudrate=9600):
+
+        from moppy import serialout
 
         self.logger = logging.getLogger('serialw')
 
-        self.serial = serial.Serial(port=port, baudrate=9600)
+        # frames are coalesced per pin and written on a thread of its own,
+        # so a slow line never holds up the readers
+        self.output = serialout.SerialOutput(port, baudrate)
 
-        self.logger.info("created (%s)" % port)
+        self.logger.info("created (%s, %d baud)" % (port, baudrate))
 
     def write_msg(self, msg):
 
-        self.serial.write(msg)
+        self.output.write(msg)
+
+    def close(self):
+
+        self.output.close()
 
     def __str__(self):
         return 'serialw'
@@ -72,8 +114,12 @@ class PtyReader:
         self.file_path = file_path
         self.timeout = timeout
         self.master, self.slave = pty.openpty()
+        self.frames = FrameBuffer()
         self.created = False
 
+        # frames are binary, no line discipline please
+        tty.setraw(self.slave)
+
         if os.system('ln -s "%s" "%s"' % (self.pty_name, self.file_path)):
             self.logger.error("file exists: %s" % self.file_path)
             raise RuntimeError("Already running proxy? File exists: %s" %
@@ -84,60 +130,240 @@ class PtyReader:
 
     def __del__(self):
 
+        self.close()
+
+    def close(self):
+
         if self.created:
             os.system('rm "%s"' % self.file_path)
+            os.close(self.master)
+            os.close(self.slave)
+            self.created = False
 
     @property
     def pty_name(self):
         return os.ttyname(self.slave)
 
-    def read_msg(self):
+    def fileno(self):
+        return self.master
 
-        msg = bytearray()
+    def read_frames(self):
 
-        while len(msg) != 3:
+        return self.frames.feed(os.read(self.master, 4096))
 
-            try:
+    def __str__(self):
+        return 'ptyr'
 
-                r, _, _ = select.select([self.master], [], [], self.timeout)
 
-                if not len(r):
-                    break
-                elif self.master in r:
-                    msg += os.read(self.master, 1)
+# Batched UDP datagrams:
+#
+#   magic (b"MP"), version, frame count, sequence number, send time,
+#   followed by count frames of FRAME_SIZE bytes
+#
+# The send time is the sender's monotonic clock when the first frame of the
+# datagram was read, the proxy does not know when the player meant to play
+# it, so that is the closest to it (the player writes frames when due).
+UDP_HEADER = struct.Struct("!2sBBId")
+UDP_MAGIC = b"MP"
+UDP_VERSION = 1
+UDP_MAX_FRAMES = 255
 
-            except KeyboardInterrupt as e:
-                exit(0)
 
-        return msg
+class JitterBuffer:
 
-    def __str__(self):
-        return 'ptyr'
+    def __init__(self, delay=0.05, max_late=None, window=10.0,
+                 clock=time.monotonic):
+
+        self.delay = delay
+        self.max_late = max_late
+        self.window = window
+        self.clock = clock
+
+        # smallest (local - sender) time seen within the window, i.e. the
+        # fastest transit, it follows the clocks drifting apart
+        self.offset = None
+        self.transits = collections.deque()
+
+        self.queue = []
+        self.count = 0
+
+        self.stats = {
+            "buffered": 0,
+            "late": 0,
+            "dropped": 0,
+            "depth": 0
+        }
+
+    def __len__(self):
+        return len(self.queue)
+
+    def _transit(self, now, transit):
+
+        # minimum over the window: later transits not larger than an
+        # earlier one make that one irrelevant
+        while len(self.transits) and self.transits[-1][1] >= transit:
+            self.transits.pop()
+
+        self.transits.append((now, transit))
+
+        while self.transits[0][0] < now - self.window:
+            self.transits.popleft()
+
+        return self.transits[0][1]
+
+    def put(self, sent, frames):
+
+        now = self.clock()
+        self.offset = self._transit(now, now - sent)
+
+        # release in the sender's timing, shifted by a fixed delay
+        play = sent + self.offset + self.delay
+        lateness = now - play
+
+        if lateness > 0:
+            self.stats["late"] += len(frames)
+
+            if self.max_late is not None and lateness > self.max_late:
+                self.stats["dropped"] += len(frames)
+                return
+
+        self.stats["buffered"] += len(frames)
+        self.count += 1
+
+        heapq.heappush(self.queue, (play, self.count, frames))
+
+        self.stats["depth"] = max(self.stats["depth"], len(self.queue))
+
+    def due(self):
+
+        if not len(self.queue):
+            return None
+
+        return self.queue[0][0] - self.clock()
+
+    def pop(self):
+
+        frames = []
+        now = self.clock()
+
+        while len(self.queue) and self.queue[0][0] <= now:
+            frames += heapq.heappop(self.queue)[2]
+
+        return frames
 
 
 class UdpReader:
 
-    def __init__(self, host, port, timeout=0.5):
+    def __init__(self, host, port, timeout=0.5, jitter=None, max_late=None):
 
         self.logger = logging.getLogger('udpr')
 
         self.timeout = timeout
 
+        if jitter is not None:
+            self.buffer = JitterBuffer(jitter, max_late)
+        else:
+            self.buffer = None
+
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.bind((host, port))
+        self.socket.setblocking(False)
+
+        self.seq = None
+        self.stats = {
+            "datagrams": 0,
+            "frames": 0,
+            "lost": 0,
+            "reordered": 0,
+            "legacy": 0,
+            "invalid": 0
+        }
+
+        if self.buffer is not None:
+            self.stats["jitter"] = self.buffer.stats
+
+            metrics.gauge("moppy_jitter_buffer_depth",
+                          "Datagrams held back by the jitter buffer",
+                          lambda: len(self.buffer), reader=str(self))
 
         self.logger.info("created (%s, %d)" % (host, port))
 
-    def read_msg(self):
+    def fileno(self):
+        return self.socket.fileno()
+
+    def _track(self, seq):
+
+        if self.seq is None or seq == self.seq + 1:
+            self.seq = seq
+        elif seq > self.seq:
+            self.stats["lost"] += seq - self.seq - 1
+            self.seq = seq
+        elif self.seq - seq > 0x10000:
+            # sender was restarted
+            self.logger.info("sequence restarted at %d" % seq)
+            self.seq = seq
+        else:
+            # arrived after a later one, it was counted as lost already
+            self.stats["reordered"] += 1
+            self.stats["lost"] = max(0, self.stats["lost"] - 1)
+
+    def unpack(self, data):
+
+        self.stats["datagrams"] += 1
+
+        if len(data) < UDP_HEADER.size or \
+                data[:len(UDP_MAGIC)] != UDP_MAGIC:
+            # plain frames from an old sender
+            self.stats["legacy"] += 1
+            return split_frames(data), None
 
-        msg = bytearray()
+        _, ver, count, seq, sent = UDP_HEADER.unpack_from(data)
 
-        r, _, _ = select.select([self.socket], [], [], self.timeout)
+        if ver != UDP_VERSION or \
+                len(data) != UDP_HEADER.size + count * FRAME_SIZE:
+            self.stats["invalid"] += 1
+            return [], None
 
-        if len(r):
-            msg = self.socket.recv(1024)
+        self._track(seq)
 
-        return msg
+        return split_frames(data[UDP_HEADER.size:]), sent
+
+    def read_frames(self):
+
+        frames = []
+
+        # drain everything that is queued, one datagram holds whole frames
+        while True:
+            try:
+                data = self.socket.recv(2048)
+            except BlockingIOError:
+                break
+
+            f, sent = self.unpack(data)
+
+            self.stats["frames"] += len(f)
+
+            if self.buffer is not None and sent is not None:
+                self.buffer.put(sent, f)
+            else:
+                frames += f
+
+        if self.buffer is not None:
+            frames += self.buffer.pop()
+
+        return frames
+
+    def due(self):
+
+        if self.buffer is None:
+            return self.timeout
+
+        due = self.buffer.due()
+
+        if due is None:
+            return self.timeout
+
+        return due
 
     def __str__(self):
         return 'udpr'
@@ -145,19 +371,45 @@ class UdpReader:
 
 class UdpWriter:
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, legacy=False):
 
         self.logger = logging.getLogger('udpw')
 
         self.host = host
         self.port = port
+        self.legacy = legacy
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
+        self.seq = 0
+        self.pending = []
+        self.sent = None
+
         self.logger.info("created (%s, %d)" % (host, port))
 
     def write_msg(self, msg):
 
-        self.socket.sendto(msg, (self.host, self.port))
+        if not len(self.pending):
+            self.sent = time.monotonic()
+
+        self.pending += split_frames(msg)
+
+    def flush(self):
+
+        while len(self.pending):
+
+            frames = self.pending[:UDP_MAX_FRAMES]
+            del self.pending[:UDP_MAX_FRAMES]
+
+            if self.legacy:
+                self.socket.sendto(b"".join(frames), (self.host, self.port))
+                continue
+
+            self.socket.sendto(UDP_HEADER.pack(UDP_MAGIC, UDP_VERSION,
+                                               len(frames), self.seq,
+                                               self.sent) +
+                               b"".join(frames), (self.host, self.port))
+
+            self.seq = (self.seq + 1) & 0xffffffff
 
     def __str__(self):
         return 'udpw'
@@ -170,19 +422,40 @@ class SysfsWriter:
         self.logger = logging.getLogger('sysfsw')
 
         self.file_path = file_path
+        self.files = sysfs.SysfsFiles(file_path)
+        self.bulk = self.files.writable("bulk")
 
-        self.logger.info("created")
+        self.logger.info("created (bulk=%s)" % self.bulk)
 
     def write_msg(self, msg):
 
-        pin, value = struct.unpack("!BH", msg)
+        updates = []
 
-        if pin == 100 and (pin == 0 or pin > 4):
-            with open(self.file_path + "ctrl", "w") as f:
-                f.write("reset")
-        else:
-            with open(self.file_path + "ticks", "w") as f:
-                f.write("%d, %d" % ((pin - 2) / 2, value))
+        # a message may carry several frames (e.g. one UDP datagram)
+        for pin, value in struct.iter_unpack("!BH", msg[:len(msg) -
+                                                         len(msg) % 3]):
+
+            drive = (pin - 2) // 2
+
+            if pin == 100 and (pin == 0 or pin > 4):
+                self.write_updates(updates)
+                updates = []
+                self.files.write("ctrl", b"reset")
+            elif pin < 2 or drive > sysfs.SysfsFiles.MAX_CHANNEL:
+                # would fail the whole bulk write, skip it like the
+                # kernel module skips it for ticks
+                self.logger.debug("invalid pin %d" % pin)
+            elif self.bulk:
+                updates.append(b"t %d, %d" % (drive, value))
+            else:
+                self.files.write("ticks", b"%d, %d" % (drive, value))
+
+        self.write_updates(updates)
+
+    def write_updates(self, updates):
+
+        if len(updates):
+            self.files.write_bulk(updates)
 
     def __str__(self):
         return 'sysfsw'
@@ -190,32 +463,50 @@ class SysfsWriter:
 
 class FileWriter:
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, legacy=False):
 
         self.logger = logging.getLogger('filew')
 
         self.timstamp = None
-        self.file = open(file_path, "w")
+
+        if legacy:
+            self.file = open(file_path, "w")
+            self.recording = None
+        else:
+            self.file = None
+            self.recording = mtf.MtfWriter(file_path)
 
         self.logger.info("created (%s)" % file_path)
 
     def __del__(self):
 
+        self.close()
+
+    def close(self):
+
         if self.file is not None:
             self.file.close()
+            self.file = None
+
+        if self.recording is not None:
+            self.recording.close()
 
     def write_msg(self, msg):
 
-        pin, value = struct.unpack("!BH", msg)
+        for pin, value in struct.iter_unpack("!BH", msg):
 
-        if self.timstamp is None or pin == 100:
-            t = 0
-        else:
-            t = time.time() - self.timstamp
+            if self.recording is not None:
+                self.recording.write(pin, value)
+                continue
+
+            if self.timstamp is None or pin == 100:
+                t = 0
+            else:
+                t = time.time() - self.timstamp
 
-        self.timstamp = time.time()
+            self.timstamp = time.time()
 
-        self.file.write("%f, %d, %d\n" % (t, pin, value))
+            self.file.write("%f, %d, %d\n" % (t, pin, value))
 
     def __str__(self):
         return 'filew'
@@ -223,32 +514,94 @@ class FileWriter:
 
 class FileReader:
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, speed=1.0, seek=0.0):
 
         self.logger = logging.getLogger('filer')
-        self.file = open(file_path, "r")
 
-    def read_msg(self):
+        self.speed = speed
+        self.seek = seek
 
-        msg = bytearray()
+        if mtf.is_mtf(file_path):
+            self.recording = mtf.MtfReader(file_path)
+            self.records = self._read_records()
 
-        line = self.file.readline().replace('\n', '').split(",")
+            self.logger.info("created (%s, %d frames, %.1f sec.)" %
+                             (file_path, len(self.recording),
+                              self.recording.length))
+        else:
+            self.recording = None
+            self.file = open(file_path, "r")
+            self.records = self._read_lines()
 
-        if len(line) == 3:
+            self.logger.info("created (%s, text)" % file_path)
 
-            t = float(line[0])
-            pin = int(line[1])
-            value = int(line[2])
+        self.start = None
+        self.next_time = None
+        self.next_frame = None
+        self.eof = False
 
-            msg.append(chr(pin & 0xff))
-            msg.append(chr((value >> 8) & 0xff))
-            msg.append(chr(value & 0xff))
+    def _read_records(self):
 
-            time.sleep(t)
-        else:
+        record = self.recording.record
+
+        for n in range(self.recording.find(self.seek), len(self.recording)):
+            t, pin, value = record(n)
+            yield t, struct.pack("!BH", pin, value)
+
+    def _read_lines(self):
+
+        t = 0.0
+
+        for line in self.file:
+
+            line = line.replace('\n', '').split(",")
+
+            if len(line) != 3:
+                break
+
+            t += float(line[0])
+
+            if t >= self.seek:
+                yield t, struct.pack("!BH", int(line[1]) & 0xff,
+                                     int(line[2]) & 0xffff)
+
+    def _read(self):
+
+        try:
+            t, self.next_frame = next(self.records)
+        except StopIteration:
+            self.eof = True
+            return
+
+        if self.start is None:
+            self.start = time.monotonic()
+
+        # replay against an absolute clock, so delays while routing do
+        # not add up
+        self.next_time = self.start + (t - self.seek) / self.speed
+
+    def due(self):
+
+        if self.next_frame is None and not self.eof:
+            self._read()
+
+        if self.eof:
+            return 0.0
+
+        return self.next_time - time.monotonic()
+
+    def read_frames(self):
+
+        frames = []
+
+        while self.due() <= 0 and not self.eof:
+            frames.append(self.next_frame)
+            self.next_frame = None
+
+        if self.eof and not len(frames):
             raise RuntimeError("End of file")
 
-        return msg
+        return frames
 
     def __str__(self):
         return 'filer'
@@ -256,26 +609,147 @@ class FileReader:
 
 class Proxy:
 
-    def __init__(self, reader, writer):
+    def __init__(self, readers, writers, timeout=0.5, stats=None):
 
         self.logger = logging.getLogger('proxy')
 
-        self.reader = reader
-        self.writer = writer
+        if not isinstance(readers, (list, tuple)):
+            readers = [readers]
 
-    def run(self):
+        if not isinstance(writers, (list, tuple)):
+            writers = [writers]
 
-        while True:
+        self.readers = readers
+        self.writers = writers
+        self.timeout = timeout
+        self.running = False
+
+        # seconds between two stats log lines
+        self.stats = stats
+
+        self.read = {}
+        self.targets = []
+        self.connect()
+
+    def connect(self):
+
+        # readers and writers may be replaced before running, so metrics
+        # follow the current ones (None while metrics are disabled)
+        self.read = {reader: metrics.counter(
+            "moppy_proxy_frames_read_total", "Frames taken from a reader",
+            reader=str(reader)) for reader in self.readers}
+        self.targets = [(writer, metrics.SendMeter.create(str(writer)))
+                        for writer in self.writers]
 
-            msg = self.reader.read_msg()
+    def stop(self):
+        self.running = False
 
-            if len(msg):
+    def route(self, reader, frames):
 
+        msg = b"".join(frames)
+
+        read = self.read.get(reader)
+
+        if read is not None:
+            read.inc(len(frames))
+
+        # formatting is expensive, only when it is logged
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+
+        for writer, meter in self.targets:
+
+            if debug:
                 self.logger.debug("routing: [%s] (%s -> %s)" %
-                                  (binascii.hexlify(msg), str(self.reader),
-                                   str(self.writer)))
+                                  (binascii.hexlify(msg), str(reader),
+                                   str(writer)))
+
+            if meter is None:
+                writer.write_msg(msg)
+            else:
+                meter.send(writer.write_msg, msg, count=len(frames))
+
+    def run(self):
+
+        self.connect()
+
+        selector = selectors.DefaultSelector()
+
+        # readers which deliver frames at given times (e.g. from a file)
+        timed = []
+
+        for reader in self.readers:
+            if hasattr(reader, "fileno"):
+                selector.register(reader, selectors.EVENT_READ)
+            if hasattr(reader, "due"):
+                timed.append(reader)
+
+        # writers which collect frames of one round (e.g. into a datagram)
+        flush = [w.flush for w in self.writers if hasattr(w, "flush")]
+
+        self.running = True
+
+        if self.stats is not None:
+            next_stats = time.monotonic() + self.stats
+        else:
+            next_stats = None
+
+        try:
+            while self.running:
+
+                timeout = self.timeout
+
+                for reader in timed:
+                    timeout = min(timeout, max(0.0, reader.due()))
+
+                if next_stats is not None:
+                    timeout = min(timeout, max(0.0, next_stats -
+                                               time.monotonic()))
+
+                for key, _ in selector.select(timeout):
+
+                    frames = key.fileobj.read_frames()
+
+                    if len(frames):
+                        self.route(key.fileobj, frames)
+
+                for reader in timed:
+                    if reader.due() <= 0:
+                        frames = reader.read_frames()
+
+                        if len(frames):
+                            self.route(reader, frames)
+
+                for f in flush:
+                    f()
+
+                if next_stats is not None and \
+                        time.monotonic() >= next_stats:
+                    self.log_stats()
+                    next_stats += self.stats
+        finally:
+            selector.close()
+
+            for reader in self.readers:
+                if hasattr(reader, "stats"):
+                    self.logger.info("%s: %s" % (reader, reader.stats))
+
+    def log_stats(self):
+
+        line = [metrics.REGISTRY.summary()]
 
-                self.writer.write_msg(msg)
+        for reader in self.readers:
+            if hasattr(reader, "stats"):
+                line.append("%s=%s" % (reader, reader.stats))
+
+        self.logger.info("stats: %s" % " ".join(line))
+
+
+def ms_to_s(value):
+
+    if value is None:
+        return None
+
+    return value / 1000.0
 
 
 def main():
@@ -286,23 +760,55 @@ def main():
     parser.add_argument("--serialport", default="/dev/ttyUSB0",
                         help="Serial port")
 
+    parser.add_argument("--baud", default=9600, type=int,
+                        help="Baud rate of the serial writer, rates above " +
+                        "9600 are negotiated with the firmware")
+
     parser.add_argument("--udphost", default="localhost",
                         help="UDP host")
 
     parser.add_argument("--udpport", default=12345, type=int,
                         help="UDP port")
 
+    parser.add_argument("--jitter", default=None, type=float,
+                        help="Buffer frames received via UDP for this many " +
+                        "milliseconds and play them in the sender's timing")
+
+    parser.add_argument("--maxlate", default=None, type=float,
+                        help="Drop frames arriving more than this many " +
+                        "milliseconds after their play time (with --jitter)")
+
+    parser.add_argument("--udplegacy", action="store_true", default=False,
+                        help="Send plain frames without batching header " +
+                        "(for old proxies)")
+
     parser.add_argument("--filein", default="moppyin.mtf",
                         help="Input file")
 
     parser.add_argument("--fileout", default="moppyout.mtf",
                         help="Output file")
 
+    parser.add_argument("--filelegacy", action="store_true", default=False,
+                        help="Record to the old text format")
+
+    parser.add_argument("--speed", default=1.0, type=float,
+                        help="Replay speed factor for the file reader")
+
+    parser.add_argument("--seek", default=0.0, type=float,
+                        help="Start replay at this many seconds into " +
+                        "the file")
+
     parser.add_argument("-r", "--reader", default="pty",
-                        help="Reader to use (pty, serial, udp, file)")
+                        help="Reader(s) to use, comma separated (pty, " +
+                        "serial, udp, file)")
 
     parser.add_argument("-w", "--writer", default="sysfs",
-                        help="Writer to use (serial, udp, sysfs, file)")
+                        help="Writer(s) to use, comma separated (serial, " +
+                        "udp, sysfs, file)")
+
+    parser.add_argument("--stats", default=None, type=float,
+                        help="Log frame counts, latencies and queue depths " +
+                        "every this many seconds")
 
     parser.add_argument("--logfile", help="write log to file",
                         default=None)
@@ -323,6 +829,10 @@ def main():
 
     logging.info('ProxyServer %s' % version.FULL)
 
+    # before readers and writers are created, they register their metrics
+    if args.stats is not None:
+        metrics.enable()
+
     readers = {
         "pty": PtyReader,
         "serial": SerialReader,
@@ -330,18 +840,26 @@ def main():
         "file": FileReader
     }
 
-    if args.reader not in readers:
-        print("Invalid reader: %s" % args.reader)
-        exit(1)
+    prs = []
 
-    if args.reader == "serial":
-        pr = readers[args.reader](args.serialport)
-    elif args.reader == "udp":
-        pr = readers[args.reader](args.udphost, args.udpport)
-    elif args.reader == "file":
-        pr = readers[args.reader](args.filin)
-    else:
-        pr = readers[args.reader]()
+    for reader in args.reader.split(","):
+
+        if reader not in readers:
+            print("Invalid reader: %s" % reader)
+            exit(1)
+
+        if reader == "serial":
+            pr = readers[reader](args.serialport)
+        elif reader == "udp":
+            pr = readers[reader](args.udphost, args.udpport,
+                                 jitter=ms_to_s(args.jitter),
+                                 max_late=ms_to_s(args.maxlate))
+        elif reader == "file":
+            pr = readers[reader](args.filein, args.speed, args.seek)
+        else:
+            pr = readers[reader]()
+
+        prs.append(pr)
 
     writers = {
         "serial": SerialWriter,
@@ -350,20 +868,26 @@ def main():
         "file": FileWriter
     }
 
-    if args.writer not in writers:
-        print("Invalid writer: %s" % args.writer)
-        exit(1)
+    pws = []
 
-    if args.writer == "serial":
-        pw = writers[args.writer](args.serialport)
-    elif args.writer == "udp":
-        pw = writers[args.writer](args.udphost, args.udpport)
-    elif args.writer == "file":
-        pw = writers[args.writer](args.fileout)
-    else:
-        pw = writers[args.writer]()
+    for writer in args.writer.split(","):
+
+        if writer not in writers:
+            print("Invalid writer: %s" % writer)
+            exit(1)
+
+        if writer == "serial":
+            pw = writers[writer](args.serialport, args.baud)
+        elif writer == "udp":
+            pw = writers[writer](args.udphost, args.udpport, args.udplegacy)
+        elif writer == "file":
+            pw = writers[writer](args.fileout, args.filelegacy)
+        else:
+            pw = writers[writer]()
+
+        pws.append(pw)
 
-    p = Proxy(pr, pw)
+    p = Proxy(prs, pws, stats=args.stats)
     p.run()
 
 
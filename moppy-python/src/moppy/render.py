@@ -0,0 +1,306 @@
+import concurrent.futures
+import multiprocessing
+import collections
+import argparse
+import logging
+import time
+import mido
+import sys
+import os
+
+from moppy import version, player, voices
+
+# A single drive command of a rendered song:
+#
+#   time  - seconds from the start of the song
+#   drive - drive number, None for a reset of all drives
+#   note  - MIDI note played (after octave clamping), None for off
+#   pitch - pitch wheel value the note is bent by
+Command = collections.namedtuple('Command', ['time', 'drive', 'note',
+                                             'pitch'])
+
+FORMAT = "moppy-render 1"
+
+
+class RenderPort(mido.ports.BaseOutput):
+
+    def __init__(self, bends=False):
+        mido.ports.BaseOutput.__init__(self)
+
+        # with bends like a serial port with fine periods
+        self.bends = bends
+        self.clock = None
+        self.commands = []
+
+    def now(self):
+
+        if self.clock is None:
+            return 0.0
+
+        return self.clock()
+
+    def encode(self, message, pitch=0):
+
+        if message.type == 'note_on':
+            return message.channel, message.note, pitch
+
+        elif message.type == 'note_off':
+            return message.channel, None, 0
+
+        return None
+
+    def send_encoded(self, data):
+
+        if data is not None:
+            self.commands.append(Command(self.now(), *data))
+
+    def _send(self, message):
+
+        self.send_encoded(self.encode(message))
+
+    def reset(self):
+
+        self.commands.append(Command(self.now(), None, None, 0))
+
+
+class OfflineScheduler(player.Scheduler):
+
+    def __init__(self):
+        player.Scheduler.__init__(self, clock=lambda: self.time)
+
+        self.time = 0.0
+
+    def run(self, schedule, flush=None, off=None):
+
+        # like Scheduler.run, but jumps to the next event instead of
+        # waiting for it, always plays the whole song at its tempo
+        self.stats.reset()
+        self.start = self.time = 0.0
+
+        try:
+            for event in schedule.events:
+
+                if event.time > self.time:
+                    if flush is not None:
+                        flush()
+
+                    self.time = event.time
+
+                if self.stopped.is_set():
+                    return
+
+                yield event
+
+            if flush is not None:
+                flush()
+        finally:
+            self.stopped.clear()
+
+
+def render(p, midi=None, info=None, schedule=None):
+
+    # plays through the player as usual, so the timeline is what the drives
+    # would get, just without waiting for it
+    if not isinstance(p.port, RenderPort):
+        raise ValueError("Player must play to a RenderPort")
+
+    scheduler = p.scheduler
+    p.scheduler = OfflineScheduler()
+    p.port.clock = p.scheduler.clock
+    p.port.commands = []
+
+    try:
+        p.play(midi, info, schedule)
+    finally:
+        p.scheduler = scheduler
+        p.port.clock = None
+
+    return p.port.commands
+
+
+def format_command(command):
+
+    if command.drive is None:
+        return "%.6f R" % command.time
+
+    if command.note is None:
+        return "%.6f %d -" % (command.time, command.drive)
+
+    if command.pitch:
+        return "%.6f %d %d %d" % (command.time, command.drive, command.note,
+                                  command.pitch)
+
+    return "%.6f %d %d" % (command.time, command.drive, command.note)
+
+
+def format_timeline(commands, name="", length=0.0, drives=0):
+
+    lines = ["# %s %s drives=%d length=%.6f" % (FORMAT, name, drives,
+                                                 length)]
+    lines += [format_command(c) for c in commands]
+
+    return "\n".join(lines) + "\n"
+
+
+def make_player(options):
+
+    p = player.Player(RenderPort(options.get("bends", False)), None,
+                      options.get("ch_max", 4), options.get("ch_filter"),
+                      options.get("ch_optimize", False),
+                      options.get("ch_mirror", False),
+                      options.get("octave_optimize", False),
+                      voices=options.get("voices"))
+
+    return p
+
+
+def render_song(path, options):
+
+    try:
+        midi = mido.MidiFile(path)
+        p = make_player(options)
+        commands = render(p, midi)
+
+        if p.ch_mirror:
+            drives = p.ch_max * 2
+        else:
+            drives = p.ch_max
+
+        return format_timeline(commands, os.path.basename(path),
+                               midi.length, drives), None
+
+    except Exception as e:
+        return None, "%s: %s" % (type(e).__name__, e)
+
+
+def find_songs(paths, extension=".mid"):
+
+    songs = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            songs += sorted(os.path.join(path, name)
+                            for name in os.listdir(path)
+                            if name.lower().endswith(extension))
+        else:
+            songs.append(path)
+
+    return songs
+
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(description='MoppyRender %s' %
+                                     version.FULL)
+
+    parser.add_argument("songs", nargs="+",
+                        help="MIDI files or directories with MIDI files")
+
+    parser.add_argument("-o", "--output", default=None,
+                        help="Directory to write a <song>.txt timeline to " +
+                        "for each song (default: print to stdout)")
+
+    parser.add_argument("-j", "--workers", default=None, type=int,
+                        help="Number of processes rendering songs")
+
+    parser.add_argument("--chmax", default=4, type=int,
+                        help="Maximum number of channels")
+
+    parser.add_argument("--choptimize", action="store_true", default=False,
+                        help="Try to optimize channel allocation")
+
+    parser.add_argument("--voices", default=None,
+                        choices=voices.VoiceAllocator.POLICIES,
+                        help="Allocate single notes to drives instead of " +
+                        "whole channels, stealing voices by this policy " +
+                        "(not enabled by --optimize)")
+
+    parser.add_argument("--chmirror", action="store_true", default=False,
+                        help="Mirror channels")
+
+    parser.add_argument("--nopercussions", action="store_true", default=False,
+                        help="Remove percussions channel (#10)")
+
+    parser.add_argument("--octoptimize", action="store_true", default=False,
+                        help="Try to optimize octaves")
+
+    parser.add_argument("--optimize", action="store_true", default=False,
+                        help="Enable all optimizations")
+
+    parser.add_argument("--fine", action="store_true", default=False,
+                        help="Render pitch bends like a serial port with " +
+                        "fine periods")
+
+    return parser.parse_args(argv)
+
+
+def make_options(args):
+
+    if args.optimize:
+        args.choptimize = True
+        args.octoptimize = True
+        args.nopercussions = True
+
+    if args.nopercussions:
+        ch_filter = [0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13, 14, 15]
+    else:
+        ch_filter = None
+
+    options = {
+        "ch_max": args.chmax,
+        "ch_filter": ch_filter,
+        "ch_optimize": args.choptimize,
+        "ch_mirror": args.chmirror,
+        "octave_optimize": args.octoptimize,
+        "voices": args.voices,
+        "bends": args.fine
+    }
+
+    return options
+
+
+def main():
+
+    args = parse_args()
+    options = make_options(args)
+
+    logging.basicConfig(level="WARNING")
+
+    songs = find_songs(args.songs)
+
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+    start = time.monotonic()
+
+    if len(songs) > 1 and args.workers != 1:
+        context = multiprocessing.get_context("spawn")
+
+        with concurrent.futures.ProcessPoolExecutor(
+                args.workers, mp_context=context) as pool:
+            results = pool.map(render_song, songs,
+                               [options] * len(songs), chunksize=4)
+            results = list(results)
+    else:
+        results = [render_song(song, options) for song in songs]
+
+    failed = 0
+
+    for song, (timeline, error) in zip(songs, results):
+
+        if error is not None:
+            sys.stderr.write("%s: %s\n" % (song, error))
+            failed += 1
+        elif args.output is None:
+            sys.stdout.write(timeline)
+        else:
+            name = os.path.splitext(os.path.basename(song))[0] + ".txt"
+
+            with open(os.path.join(args.output, name), "w") as f:
+                f.write(timeline)
+
+    if args.output is not None:
+        print("Rendered %d songs (%d failed) in %.1fs" %
+              (len(songs) - failed, failed, time.monotonic() - start))
+
+    if failed:
+        exit(1)
@@ -0,0 +1,307 @@
+import threading
+import logging
+import struct
+import heapq
+import time
+
+from moppy import periods, metrics
+
+FRAME_SIZE = 3
+
+# first byte of control frames, no pin has this number
+CONTROL = 100
+
+# control frame to switch the baud rate, the third byte is an index into
+# BAUD_RATES, the firmware confirms with ACK at the new rate
+CMD_BAUD = 5
+ACK = b"\x64"
+
+# control frame asking for fine periods, firmware knowing them confirms with
+# ACK, fine frames have FINE set on the pin and carry the half period in
+# ticks as fixed point (see periods)
+CMD_FINE = 6
+FINE = 0x40
+
+# largest fine period the firmware counts without overflow
+MAX_PERIOD = 0xffff - (1 << periods.FRACTION_BITS)
+
+# control sub commands the firmware ignores, all others reset the drives
+RESERVED = (1, 2, 3, 4, CMD_BAUD, CMD_FINE)
+
+DEFAULT_BAUDRATE = 9600
+
+BAUD_RATES = [9600, 19200, 38400, 57600, 115200, 250000, 500000, 1000000]
+
+PRIORITY_CONTROL = 0
+PRIORITY_OFF = 1
+PRIORITY_ON = 2
+
+
+def frame_priority(frame):
+
+    if frame[0] == CONTROL:
+        return PRIORITY_CONTROL
+
+    if frame[1] == 0 and frame[2] == 0:
+        return PRIORITY_OFF
+
+    return PRIORITY_ON
+
+
+def is_reset(frame):
+
+    return frame[0] == CONTROL and frame[1] not in RESERVED
+
+
+def fine_period(note, pitch=0):
+
+    period = periods.NOTE_PERIODS[note]
+
+    if pitch:
+        # pitch is the MIDI pitch wheel value (-8192 to 8191)
+        steps = periods.BEND_RANGE * periods.BEND_STEPS
+        period = (period * periods.BEND_FACTORS[
+            steps + int(round(pitch * steps / 8192.0))]) >> 16
+
+    return max(1, min(period, MAX_PERIOD))
+
+
+class SerialOutput(threading.Thread):
+
+    def __init__(self, port, baudrate=DEFAULT_BAUDRATE, fine=False,
+                 maxsize=64, timeout=3.0):
+        threading.Thread.__init__(self, daemon=True)
+
+        import serial
+
+        self.logger = logging.getLogger('serialo')
+
+        self.serial = serial.Serial(port=port, baudrate=DEFAULT_BAUDRATE)
+        self.maxsize = maxsize
+
+        # key -> [priority, sequence, frame] of the frames not written yet,
+        # the key is the pin, so a new frame for a pin replaces the pending
+        # one, the heap orders them by priority and then arrival
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.heap = []
+        self.seq = 0
+        self.busy = False
+        self.closed = False
+        self.idle = 0.0
+        self.fine = False
+
+        self.queued = 0
+        self.coalesced = 0
+        self.written = 0
+
+        # read when metrics are collected, nothing to do here per frame
+        metrics.gauge("moppy_serial_queue_depth",
+                      "Frames waiting to be written",
+                      lambda: len(self.pending), port=port)
+
+        for name in ("queued", "coalesced", "written"):
+            metrics.counter("moppy_serial_frames_%s_total" % name,
+                            "Frames %s by the serial output" % name,
+                            lambda name=name: getattr(self, name), port=port)
+
+        if baudrate != DEFAULT_BAUDRATE or fine:
+            self.handshake(baudrate, fine, timeout)
+
+        self.start()
+
+    def handshake(self, baudrate, fine, timeout=3.0):
+
+        self.serial.timeout = timeout
+
+        try:
+            # opening the port resets an Arduino, it tells when it is ready
+            if self.serial.read(1) != ACK:
+                self.logger.debug("No ready message from firmware")
+
+            if baudrate != DEFAULT_BAUDRATE:
+                self.negotiate(baudrate)
+
+            if fine:
+                self.fine = self.command(CMD_FINE)
+
+                if self.fine:
+                    self.logger.info("Using fine periods")
+                else:
+                    self.logger.warning("Firmware does not know fine " +
+                                        "periods, using whole ticks")
+        finally:
+            self.serial.timeout = None
+
+    def command(self, cmd, value=0):
+
+        # send a control frame and wait for the firmware to confirm it
+        self.serial.reset_input_buffer()
+        self.serial.write(struct.pack("!BBB", CONTROL, cmd, value))
+        self.serial.flush()
+
+        return self.serial.read(1) == ACK
+
+    def negotiate(self, baudrate):
+
+        if baudrate not in BAUD_RATES:
+            raise ValueError("Unsupported baud rate: %d" % baudrate)
+
+        self.serial.reset_input_buffer()
+        self.serial.write(struct.pack("!BBB", CONTROL, CMD_BAUD,
+                                      BAUD_RATES.index(baudrate)))
+        self.serial.flush()
+
+        try:
+            self.serial.baudrate = baudrate
+            ack = self.serial.read(1)
+        except Exception as e:
+            self.logger.warning("Failed to set %d baud: %s" % (baudrate, e))
+            ack = None
+
+        if ack == ACK:
+            self.logger.info("Switched to %d baud" % baudrate)
+            return True
+
+        # old firmware takes the unknown command as a reset and stays
+        self.logger.warning("Firmware did not confirm %d baud, " % baudrate +
+                            "staying at %d baud" % DEFAULT_BAUDRATE)
+        self.serial.baudrate = DEFAULT_BAUDRATE
+
+        return False
+
+    def put(self, frame):
+
+        frame = bytes(frame)
+
+        if frame[0] == CONTROL:
+            key = (CONTROL, frame[1])
+        else:
+            key = frame[0] & ~FINE
+
+        priority = frame_priority(frame)
+
+        with self.cond:
+
+            if is_reset(frame):
+                # whatever was pending is silenced by the reset anyway
+                self.coalesced += len(self.pending)
+                self.pending.clear()
+                self.heap = []
+
+            # only new keys take space, so the writer never blocks a pin
+            # update behind frames which would be replaced anyway
+            self.cond.wait_for(lambda: key in self.pending or self.closed or
+                               len(self.pending) < self.maxsize)
+
+            if self.closed:
+                return
+
+            entry = self.pending.get(key)
+
+            if entry is not None:
+                self.coalesced += 1
+
+                if entry[0] == priority:
+                    entry[2] = frame
+                    return
+
+                # keep the place in line of the frame it replaces
+                seq = entry[1]
+            else:
+                seq = self.seq
+                self.seq += 1
+
+            self.pending[key] = [priority, seq, frame]
+            heapq.heappush(self.heap, (priority, seq, key))
+            self.queued += 1
+
+            self.cond.notify_all()
+
+    def write(self, data):
+
+        for i in range(0, len(data) - len(data) % FRAME_SIZE, FRAME_SIZE):
+            self.put(data[i:i + FRAME_SIZE])
+
+    def take(self):
+
+        frames = []
+
+        while len(self.heap):
+            priority, seq, key = heapq.heappop(self.heap)
+            entry = self.pending.get(key)
+
+            # replaced by a frame of another priority
+            if entry is None or entry[0] != priority or entry[1] != seq:
+                continue
+
+            del self.pending[key]
+            frames.append(entry[2])
+
+        return frames
+
+    def run(self):
+
+        while True:
+
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.pending) or self.closed)
+
+                if not len(self.pending):
+                    break
+
+                frames = self.take()
+                self.busy = True
+                self.cond.notify_all()
+
+            data = b"".join(frames)
+            start = time.monotonic()
+
+            try:
+                self.serial.write(data)
+
+                # wait until the frames are on the wire, so frames arriving
+                # meanwhile queue up here where they can still be coalesced
+                # and reordered, not in the buffer of the serial driver
+                self.serial.flush()
+                self.wait_line(start, len(data))
+            except Exception as e:
+                self.logger.error("Failed to write: %s" % e)
+
+            with self.cond:
+                self.written += len(frames)
+                self.busy = False
+                self.cond.notify_all()
+
+    def wait_line(self, start, size):
+
+        # USB adapters and ptys report drained as soon as they took the
+        # data, so also wait for the time the line needs (10 bit per byte)
+        self.idle = max(start, self.idle) + size * 10.0 / self.serial.baudrate
+
+        delay = self.idle - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def flush(self, timeout=None):
+
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: not len(self.pending) and not self.busy, timeout)
+
+    def close(self):
+
+        with self.cond:
+            if self.closed:
+                return
+
+            self.closed = True
+            self.cond.notify_all()
+
+        # pending frames are still written
+        self.join()
+        self.serial.close()
+
+        self.logger.debug("closed, %d queued, %d coalesced, %d written" %
+                          (self.queued, self.coalesced, self.written))
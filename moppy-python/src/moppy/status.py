@@ -0,0 +1,148 @@
+import threading
+import logging
+import json
+
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# octaves shown, as rows of the curses grid
+OCTAVES = 10
+
+
+class NoteState:
+
+    def __init__(self, drives=16):
+
+        self.drives = drives
+        self.version = 0
+        self.reset()
+
+    def reset(self):
+
+        # drive -> (octave, note) of the last event or None, note 12 means
+        # the drive was silenced in that octave
+        self.notes = [None] * self.drives
+        self.version += 1
+
+    def update(self, ch, oct, note):
+
+        # same arguments as the player's update hook
+        if ch >= self.drives:
+            return
+
+        # notes outside the octaves shown are not shown at all
+        if 0 <= oct < OCTAVES:
+            self.notes[ch] = (oct, note)
+        else:
+            self.notes[ch] = None
+
+        self.version += 1
+
+    def as_list(self, drives=None):
+
+        if drives is None:
+            drives = self.drives
+
+        return [None if n is None or n[1] == 12 else
+                "%s%d" % (NOTE_NAMES[n[1]], n[0])
+                for n in self.notes[:drives]]
+
+
+class StatusHub:
+
+    def __init__(self):
+
+        self.cond = threading.Condition()
+
+        # topic -> (version, data), only the latest data of each topic is
+        # kept, so a slow subscriber just skips the intermediate states
+        self.topics = {}
+        self.version = 0
+        self.watchers = set()
+
+    def publish(self, topic, data):
+
+        with self.cond:
+            current = self.topics.get(topic)
+
+            if current is not None and current[1] == data:
+                return
+
+            self.version += 1
+            self.topics[topic] = (self.version, data)
+            self.cond.notify_all()
+
+            watchers = list(self.watchers)
+
+        for watcher in watchers:
+            watcher()
+
+    def _pending(self, seen):
+
+        return [topic for topic, (version, _) in self.topics.items()
+                if version > seen.get(topic, 0)]
+
+    def changes(self, seen):
+
+        # seen is the subscriber's topic -> version it got last
+        changes = []
+
+        with self.cond:
+            for topic in self._pending(seen):
+                version, data = self.topics[topic]
+                seen[topic] = version
+                changes.append((topic, data))
+
+        return changes
+
+    def wait(self, seen, timeout=None):
+
+        with self.cond:
+            self.cond.wait_for(lambda: len(self._pending(seen)), timeout)
+
+        return self.changes(seen)
+
+    def watch(self, callback):
+
+        with self.cond:
+            self.watchers.add(callback)
+
+    def unwatch(self, callback):
+
+        with self.cond:
+            self.watchers.discard(callback)
+
+
+def sse_event(topic, data):
+
+    return ("event: %s\ndata: %s\n\n" % (topic, json.dumps(data))).encode()
+
+
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+
+class StatusSampler(threading.Thread):
+
+    def __init__(self, hub, sample, interval=0.1):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.logger = logging.getLogger('sampler')
+
+        self.hub = hub
+        self.sample = sample
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+
+        # the player only touches NoteState, publishing happens here at a
+        # fixed rate no matter how many notes are played or clients listen
+        while not self.stopped.wait(self.interval):
+            try:
+                for topic, data in self.sample():
+                    self.hub.publish(topic, data)
+            except Exception as e:
+                self.logger.error("Failed to sample status: %s" % e)
@@ -0,0 +1,101 @@
+import logging
+import errno
+import os
+
+
+class SysfsFiles:
+
+    ATTRIBUTES = ["note", "freq", "ticks", "ctrl"]
+
+    # max. number of updates the kernel module takes with one bulk write
+    MAX_BULK = 64
+
+    # highest channel (drive) number of the kernel module
+    MAX_CHANNEL = 7
+
+    # errors of a stale handle rather than of the data written
+    STALE = (errno.EBADF, errno.ENODEV, errno.ENXIO, errno.ENOENT)
+
+    def __init__(self, base_path="/sys/kernel/moppy/"):
+
+        self.logger = logging.getLogger('sysfs')
+
+        self.base_path = base_path
+        self.fds = {}
+
+    def __del__(self):
+
+        self.close()
+
+    def writable(self, attr):
+
+        # e.g. not when running as a user the attribute was not chowned to
+        return os.access(os.path.join(self.base_path, attr), os.W_OK)
+
+    def open(self):
+
+        for attr in self.ATTRIBUTES:
+            self._open(attr)
+
+    def close(self):
+
+        for fd in self.fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+        self.fds = {}
+
+    def _open(self, attr):
+
+        fd = os.open(os.path.join(self.base_path, attr), os.O_WRONLY)
+        self.fds[attr] = fd
+
+        return fd
+
+    def _reopen(self, attr):
+
+        fd = self.fds.pop(attr, None)
+
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+        self.logger.info("reopening %s" % attr)
+
+        return self._open(attr)
+
+    def write(self, attr, data):
+
+        try:
+            fd = self.fds.get(attr)
+
+            if fd is None:
+                fd = self._open(attr)
+
+            os.write(fd, data)
+        except OSError as e:
+            if e.errno == errno.EINVAL:
+                # rejected by the kernel module, the handle is fine
+                self.logger.warning("invalid %s write: %r" % (attr, data))
+                return
+
+            if e.errno not in self.STALE:
+                raise
+
+            # the handle goes stale (ENODEV) when the kernel module was
+            # reloaded, try once more with a fresh one
+            os.write(self._reopen(attr), data)
+
+    def write_burst(self, burst):
+
+        for attr, data in burst:
+            self.write(attr, data)
+
+    def write_bulk(self, updates):
+
+        for i in range(0, len(updates), self.MAX_BULK):
+            self.write("bulk", b"\n".join(updates[i:i + self.MAX_BULK]))
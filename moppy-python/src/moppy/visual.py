@@ -0,0 +1,363 @@
+import threading
+import curses
+import mido
+import os
+
+from moppy import version, status
+from moppy.player import Player
+
+
+NOTES = [
+    " C ", " C#", " D ", " D#", " E ", " F ",
+    " F#", " G ", " G#", " A ", " A#", " B ",
+    " * "
+]
+
+# seconds a seek key jumps, tempo steps and limits
+SEEK_STEP = 5.0
+TEMPO_STEP = 0.1
+TEMPO_MIN = 0.1
+TEMPO_MAX = 4.0
+
+
+class VisualPlayer(Player):
+
+    def __init__(self, port, filename=None, ch_max=4, ch_filter=None,
+                 ch_optimize=True, ch_mirror=False,
+                 octave_optimize=True, spin=0.0, voices=None, fps=25):
+
+        # the player only records the notes, drawing happens at most fps
+        # times per second on the render thread, so a slow terminal never
+        # delays playback
+        self.notes = status.NoteState()
+
+        Player.__init__(self, port, filename, ch_max, ch_filter, ch_optimize,
+                        ch_mirror, octave_optimize, self.notes.update, spin,
+                        voices)
+
+        self.fps = fps
+        self.drawn = [None] * self.notes.drives
+        self.drawn_version = None
+        self.drawn_time = None
+        self.drawn_transport = None
+        self.visible = False
+
+        # start of the section marked for looping
+        self.loop_start = None
+        self.info_height = 15
+
+        self.rendering = threading.Event()
+        self.render_thread = None
+
+        self.file_info = [
+            "",
+            (0, 0),
+            0,
+            0,
+            0,
+            "",
+            0,
+            "",
+            ""
+        ]
+
+        self.stdscr = curses.initscr()
+
+        curses.noecho()
+        curses.cbreak()
+        self.stdscr.keypad(1)
+        self.stdscr.nodelay(True)
+
+        curses.start_color()
+        curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
+        curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_GREEN)
+        curses.init_pair(3, curses.COLOR_WHITE, curses.COLOR_BLUE)
+        curses.init_pair(4, curses.COLOR_WHITE, curses.COLOR_RED)
+
+        self.stdscr.bkgd(curses.color_pair(1))
+        self.visible = True
+
+        if not self.show():
+            exit(1)
+
+    def __del__(self):
+
+        self.hide()
+
+    def hide(self):
+
+        if not self.visible:
+            return
+
+        self.visible = False
+
+        curses.nocbreak()
+        self.stdscr.keypad(0)
+        curses.echo()
+        curses.endwin()
+
+    def show(self):
+
+        self.stdscr.refresh()
+
+        y, x = self.stdscr.getmaxyx()
+
+        self.max_x = x
+        self.max_y = y
+
+        if self.max_x >= 95 and self.max_y >= 35:
+
+            self.win_info = curses.newwin(self.info_height, self.max_x, 1, 0)
+            self.win_info.bkgd(curses.color_pair(1))
+            self.win_info.box()
+            self.win_info.refresh()
+
+            self.win_notes = curses.newwin(self.max_y - (self.info_height + 1),
+                                           self.max_x, (self.info_height + 1),
+                                           0)
+            self.win_notes.bkgd(curses.color_pair(1))
+            self.win_notes.box()
+            self.win_notes.refresh()
+
+            self.win_menu = curses.newwin(1, self.max_x, 0, 0)
+            self.win_menu.bkgd(curses.color_pair(2))
+            self.win_menu.addstr(0, 1, "MoppyPlayer %s - F10: exit, " %
+                                 version.FULL + "left/right: seek, " +
+                                 "up/down: tempo, l: loop")
+            self.win_menu.refresh()
+
+            self.show_notes()
+            self.update_file_info()
+
+        else:
+            self.hide()
+            print("*** window too small ***")
+            return False
+
+        self.stdscr.refresh()
+
+        return True
+
+    def show_notes(self):
+
+        # everything is drawn again on the next frame
+        self.drawn = [None] * self.notes.drives
+        self.drawn_version = None
+        self.drawn_time = None
+        self.drawn_transport = None
+
+        y = (self.max_y - self.info_height - 12) // 2
+        x = (self.max_x - 88) // 2
+
+        self.win_notes.addstr(y, x, "c/o    0    1    2    3    4    5" +
+                              "    6    7    8    9   10   11" +
+                              "   12   13   14   15  c/o",
+                              curses.color_pair(2))
+
+        for o in range(status.OCTAVES):
+            self.win_notes.addstr(y + 1 + o, x, " %d " % o,
+                                  curses.color_pair(2))
+
+            for c in range(16):
+                self.win_notes.addstr(y + 1 + o, x + 5 + c * 5, "   ",
+                                      curses.color_pair(3))
+
+            self.win_notes.addstr(y + 1 + o, x + 10 + c * 5, " %d " % o,
+                                  curses.color_pair(2))
+
+        self.win_notes.addstr(y + 11, x, "c/o    0    1    2    3    4    5" +
+                              "    6    7    8    9   10   11" +
+                              "   12   13   14   15  c/o",
+                              curses.color_pair(2))
+        self.win_notes.refresh()
+
+    def draw_notes(self):
+
+        y = (self.max_y - self.info_height - 12) // 2 + 1
+        x = (self.max_x - 88) // 2 + 5
+
+        # only the cells of drives that changed since the last frame
+        for ch, state in enumerate(list(self.notes.notes)):
+
+            last = self.drawn[ch]
+
+            if state == last:
+                continue
+
+            # a note outside the grid would land on its header rows
+            if state is not None and not 0 <= state[0] < status.OCTAVES:
+                state = None
+
+            if last is not None:
+                self.win_notes.addstr(y + last[0], x + 5 * ch, '   ',
+                                      curses.color_pair(4))
+
+            if state is not None:
+                self.win_notes.addstr(y + state[0], x + 5 * ch,
+                                      NOTES[state[1]], curses.color_pair(3))
+
+            self.drawn[ch] = state
+
+        self.win_notes.refresh()
+
+    def draw_time(self):
+
+        dt = int(self.scheduler.position)
+
+        if dt == self.drawn_time:
+            return
+
+        self.win_info.addstr(3, 28, "%02d:%02d" % (dt // 60, dt -
+                             (dt // 60) * 60))
+        self.win_info.refresh()
+
+        self.drawn_time = dt
+
+    def draw_transport(self):
+
+        loop = self.scheduler.loop
+
+        if loop is not None:
+            section = "%d - %ds" % loop
+        elif self.loop_start is not None:
+            section = "from %ds" % self.loop_start
+        else:
+            section = "off"
+
+        transport = "Tempo / loop   : %d%% / %s" % (
+            round(self.scheduler.tempo * 100), section)
+
+        if transport == self.drawn_transport:
+            return
+
+        self.win_info.addstr(13, 3, transport.ljust(40))
+        self.win_info.refresh()
+
+        self.drawn_transport = transport
+
+    def render(self):
+
+        while not self.rendering.wait(1.0 / self.fps):
+
+            if not self.handle_keys():
+                break
+
+            version = self.notes.version
+
+            if version != self.drawn_version:
+                self.drawn_version = version
+                self.draw_notes()
+
+            # refresh() releases the GIL while writing to the terminal, so
+            # a stalled terminal only blocks this thread
+            self.draw_time()
+            self.draw_transport()
+
+    def update_file_info(self):
+
+        self.win_info.addstr(2, 3, "File           : %s" %
+                             self.file_info[0])
+        self.win_info.addstr(3, 3, "Length         : %02d:%02d / " %
+                             self.file_info[1])
+        self.win_info.addstr(4, 3, "Type           : %d" %
+                             self.file_info[2])
+        self.win_info.addstr(5, 3, "Tracks         : %d" %
+                             self.file_info[3])
+        self.win_info.addstr(6, 3, "Channels       : %d" %
+                             self.file_info[4])
+        self.win_info.addstr(7, 3, "Channels used  : %s" %
+                             self.file_info[5])
+        self.win_info.addstr(8, 3, "Octaves        : %d" %
+                             self.file_info[6])
+        self.win_info.addstr(9, 3, "Octaves used   : %s" %
+                             self.file_info[7])
+        self.win_info.addstr(10, 3, "Notes in chan. : %s" %
+                             self.file_info[8])
+        self.win_info.addstr(11, 3, "Active channels: %s" %
+                             str(self.ch_filter)[1:-1])
+        self.win_info.addstr(12, 3, ("Optimizations  : channels=%s, " +
+                                     "octaves=%s, nopercussion=%s, " +
+                                     "mirror=%s, voices=%s") %
+                             (self.ch_optimize, self.octave_optimize, 9
+                              not in self.ch_filter, self.ch_mirror,
+                              self.voices))
+        self.win_info.refresh()
+
+    def handle_keys(self):
+
+        c = self.stdscr.getch()
+
+        if c == curses.KEY_RESIZE:
+            if not self.show():
+                self.stop()
+                return False
+        elif c == curses.KEY_F10:
+            self.stop()
+        elif c == curses.KEY_LEFT:
+            self.scheduler.seek(self.scheduler.position - SEEK_STEP)
+        elif c == curses.KEY_RIGHT:
+            self.scheduler.seek(self.scheduler.position + SEEK_STEP)
+        elif c == curses.KEY_HOME:
+            self.scheduler.seek(0.0)
+        elif c == curses.KEY_UP:
+            self.scheduler.set_tempo(min(TEMPO_MAX, round(
+                self.scheduler.tempo + TEMPO_STEP, 2)))
+        elif c == curses.KEY_DOWN:
+            self.scheduler.set_tempo(max(TEMPO_MIN, round(
+                self.scheduler.tempo - TEMPO_STEP, 2)))
+        elif c == ord('l'):
+            self.mark_loop()
+
+        return True
+
+    def mark_loop(self):
+
+        # the first press marks the start of the section, the second the
+        # end, the third stops looping
+        position = self.scheduler.position
+
+        if self.scheduler.loop is not None:
+            self.scheduler.set_loop()
+        elif self.loop_start is None:
+            self.loop_start = position
+            return
+        elif position > self.loop_start:
+            self.scheduler.set_loop(self.loop_start, position)
+
+        self.loop_start = None
+
+    def play(self, midi=None, info=None):
+
+        self.port.reset()
+
+        if midi is None:
+            midi = mido.MidiFile(self.filename)
+
+        if info is None:
+            info = self.analyze(midi)
+
+        self.file_info = [
+            os.path.basename(self.filename),
+            (midi.length // 60, midi.length - (midi.length // 60) * 60),
+            midi.type,
+            len(midi.tracks),
+            len(info["channels"]),
+            str([x for x in info["channels"].keys()])[1:-1],
+            len(info["octaves"]),
+            str([x for x in info["octaves"].keys()])[1:-1],
+            str(info["channels"])[1:-1]
+        ]
+
+        self.update_file_info()
+
+        self.notes.reset()
+        self.rendering.clear()
+        self.render_thread = threading.Thread(target=self.render,
+                                              daemon=True)
+        self.render_thread.start()
+
+        try:
+            Player.play(self, midi, info)
+        finally:
+            self.rendering.set()
+            self.render_thread.join()
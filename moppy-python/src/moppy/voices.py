@@ -0,0 +1,173 @@
+import heapq
+
+
+class VoiceAllocator:
+
+    POLICIES = ["oldest", "priority", "affinity"]
+
+    def __init__(self, drives, policy="oldest", priorities=None):
+
+        if policy not in self.POLICIES:
+            raise ValueError("Invalid voice policy: %s" % policy)
+
+        self.drives = drives
+        self.policy = policy
+
+        # higher value means more important, e.g. note count per channel
+        if priorities is None:
+            self.priorities = {}
+        else:
+            self.priorities = priorities
+
+        self.reset()
+
+    def reset(self):
+
+        self.serial = 0
+
+        # drive -> (channel, note, serial) or None
+        self.voices = [None] * self.drives
+
+        # (channel, note) -> drive
+        self.playing = {}
+
+        # free drives (lazily cleaned up, self.voices is the truth), drives
+        # reused by affinity stay in there until compacted
+        self.free = list(range(self.drives))
+
+        # sounding voices, (key, serial, drive), lazily cleaned up too, the
+        # heaps are compacted when they get much larger than the drives
+        self.active = []
+        self.channel_active = {}
+
+        # channel -> drive last used
+        self.last_drive = {}
+
+    def _valid(self, serial, drive):
+
+        voice = self.voices[drive]
+
+        return voice is not None and voice[2] == serial
+
+    def _take_free(self, channel):
+
+        if self.policy == "affinity":
+            drive = self.last_drive.get(channel)
+
+            if drive is not None and self.voices[drive] is None:
+                return drive
+
+        while len(self.free):
+            drive = heapq.heappop(self.free)
+
+            if self.voices[drive] is None:
+                return drive
+
+        return None
+
+    def _push_active(self, heap, entry):
+
+        heapq.heappush(heap, entry)
+
+        if len(heap) > 2 * self.drives:
+            heap[:] = [e for e in heap if self._valid(e[1], e[2])]
+            heapq.heapify(heap)
+
+    def _pop_active(self, heap):
+
+        while len(heap):
+            key, serial, drive = heap[0]
+
+            if self._valid(serial, drive):
+                return key, drive
+
+            heapq.heappop(heap)
+
+        return None, None
+
+    def _steal(self, channel):
+
+        if self.policy == "affinity":
+            heap = self.channel_active.get(channel)
+
+            if heap is not None:
+                _, drive = self._pop_active(heap)
+
+                if drive is not None:
+                    return drive
+
+        key, drive = self._pop_active(self.active)
+
+        if drive is None:
+            return None
+
+        # never steal from a more important channel
+        if self.policy == "priority" and key[0] > self._key(channel)[0]:
+            return None
+
+        return drive
+
+    def _key(self, channel):
+
+        if self.policy == "priority":
+            return self.priorities.get(channel, 0), self.serial
+
+        return self.serial,
+
+    def _release(self, drive):
+
+        channel, note, _ = self.voices[drive]
+
+        del self.playing[(channel, note)]
+        self.voices[drive] = None
+
+    def note_on(self, channel, note):
+
+        drive = self.playing.get((channel, note))
+
+        # retrigger of a note still sounding
+        if drive is not None:
+            return drive
+
+        drive = self._take_free(channel)
+
+        if drive is None:
+            drive = self._steal(channel)
+
+            if drive is None:
+                return None
+
+            self._release(drive)
+
+        self.serial += 1
+
+        key = self._key(channel)
+
+        self.voices[drive] = (channel, note, self.serial)
+        self.playing[(channel, note)] = drive
+        self.last_drive[channel] = drive
+
+        self._push_active(self.active, (key, self.serial, drive))
+
+        if self.policy == "affinity":
+            self._push_active(self.channel_active.setdefault(channel, []),
+                              (key, self.serial, drive))
+
+        return drive
+
+    def note_off(self, channel, note):
+
+        drive = self.playing.get((channel, note))
+
+        if drive is None:
+            return None
+
+        self._release(drive)
+        heapq.heappush(self.free, drive)
+
+        if len(self.free) > 2 * self.drives:
+            # a sorted list is a heap
+            self.free = sorted(set(d for d in self.free
+                                   if self.voices[d] is None))
+
+        return drive
@@ -0,0 +1,427 @@
+import threading
+import logging
+import os
+
+from moppy import library, status, playlist, metrics
+from flask import Flask, render_template, jsonify, Response
+from flask import redirect, url_for, request, flash
+from werkzeug.utils import secure_filename
+
+
+class QueueThread(threading.Thread):
+
+    def __init__(self, play_queue, notes=None):
+        threading.Thread.__init__(self)
+
+        self.logger = logging.getLogger('queuet')
+
+        self.queue = play_queue
+        self.notes = notes
+        self.lock = threading.Lock()
+
+        self.stopped = False
+        self.finished = False
+
+        self.player = None
+        self.midi_file = None
+        self.length = 0.0
+
+    def run(self):
+
+        try:
+            self.queue.port.reset()
+            self.play()
+            self.queue.port.reset()
+        except Exception as e:
+            self.logger.error("Queue stopped: %s" % e)
+        finally:
+            # also when dying, so the next song starts a new thread
+            with self.lock:
+                self.finished = True
+                self.player = None
+
+    def play(self):
+
+        while True:
+
+            try:
+                entry = self.queue.pop()
+            except Exception as e:
+                self.logger.error("Failed to load song: %s" % e)
+                continue
+
+            with self.lock:
+                # checked under the lock, so a song added right now either
+                # is seen here or finds this thread finished
+                if entry is None and not len(self.queue):
+                    self.finished = True
+
+                if self.stopped or self.finished:
+                    break
+
+                if entry is None:
+                    continue
+
+                self.midi_file, self.player, schedule = entry
+                self.length = schedule.length
+
+            if self.notes is not None:
+                self.notes.reset()
+
+            self.logger.info('Now playing: %s' % self.midi_file)
+
+            # songs follow each other with all notes off in between only
+            try:
+                self.player.play(schedule=schedule, reset=False)
+            except Exception as e:
+                self.logger.error("Failed to play %s: %s" %
+                                  (self.midi_file, e))
+
+    def skip(self):
+
+        with self.lock:
+            if self.player is not None:
+                self.player.stop()
+
+    def stop(self):
+
+        with self.lock:
+            self.stopped = True
+
+            if self.player is not None:
+                self.player.stop()
+
+    @property
+    def running(self):
+
+        with self.lock:
+            return not (self.stopped or self.finished) and self.is_alive()
+
+
+class FlaskApp:
+
+    def __init__(self, home_dir=None, port=8088, prefetch=2, output=None,
+                 voices=None):
+
+        self.logger = logging.getLogger('webapp')
+
+        self.port = port
+        self.queue_thread = None
+
+        self.songs = library.SongLibrary(home_dir, voices)
+
+        if output is None:
+            output = library.make_port(self.logger)
+
+        self.hub = status.StatusHub()
+        self.notes = status.NoteState()
+        self.sampler = status.StatusSampler(self.hub, self.sample)
+
+        self.queue = playlist.PlayQueue(
+            self.songs, output, prefetch, self.notes.update,
+            lambda items: self.hub.publish("queue", items))
+
+        self.app = Flask(__name__)
+        self.app.secret_key = '09d8sfoiP(7spfd8uj3%23'
+
+        self.app.add_url_rule("/", view_func=self.root,
+                              methods=['GET', 'POST'])
+        self.app.add_url_rule("/play/<file>", view_func=self.play)
+        self.app.add_url_rule("/delete/<file>", view_func=self.delete)
+        self.app.add_url_rule("/stop", view_func=self.stop)
+        self.app.add_url_rule("/status", view_func=self.status)
+        self.app.add_url_rule("/events", view_func=self.events)
+        self.app.add_url_rule("/songs.json", view_func=self.song_list)
+        self.app.add_url_rule("/queue", view_func=self.queue_list)
+        self.app.add_url_rule("/queue/add/<file>", view_func=self.queue_add)
+        self.app.add_url_rule("/queue/remove/<int:idx>",
+                              view_func=self.queue_remove)
+        self.app.add_url_rule("/queue/clear", view_func=self.queue_clear)
+        self.app.add_url_rule("/skip", view_func=self.skip)
+        self.app.add_url_rule("/seek/<pos>", view_func=self.seek)
+        self.app.add_url_rule("/tempo/<tempo>", view_func=self.tempo)
+        self.app.add_url_rule("/loop/<start>/<end>", view_func=self.loop)
+        self.app.add_url_rule("/loop/clear", view_func=self.loop_clear)
+        self.app.add_url_rule("/metrics", view_func=self.metrics)
+
+    def start(self):
+
+        threading.Thread(target=self.songs.update_index, daemon=True).start()
+
+        # the current list for clients connecting to /events
+        self.hub.publish("songs", self.songs.names())
+
+        self.sampler.start()
+        self.queue.start()
+
+    def shutdown(self):
+
+        queue_thread = self.queue_thread
+
+        if queue_thread is not None:
+            queue_thread.stop()
+            queue_thread.join()
+
+        self.sampler.stop()
+        self.queue.stop()
+
+    def run(self):
+
+        self.start()
+
+        self.app.run(host='0.0.0.0', port=self.port, threaded=True,
+                     debug=False)
+
+    def root(self):
+
+        if request.method == 'POST':
+
+            if 'file' not in request.files:
+                flash('No file was submitted')
+                self.logger.warning('No file was submitted')
+            else:
+                file = request.files['file']
+
+                if file.filename == '':
+                    flash('No file was selected')
+                    self.logger.warning('No file was selected')
+                elif file:
+                    if library.allowed_file(file.filename):
+                        filename = secure_filename(file.filename)
+                        self.songs.add(filename, file)
+                        self.hub.publish("songs", self.songs.names())
+                    else:
+                        flash('Invalid file type')
+                        self.logger.warning('Invalid file type: %s' %
+                                            file.filename)
+
+        return render_template('root.html', midi_files=self.songs.names())
+
+    def song_list(self):
+
+        return jsonify(self.songs.index.songs(request.args.get("details") ==
+                                              "1"))
+
+    def start_queue(self):
+
+        if self.queue_thread is None or not self.queue_thread.running:
+            self.queue_thread = QueueThread(self.queue, self.notes)
+            self.queue_thread.start()
+            return True
+
+        return False
+
+    def play(self, file):
+
+        # play right now, the queue continues afterwards
+        self.queue.add(file, front=True)
+
+        if not self.start_queue():
+            self.queue_thread.skip()
+
+        s = "Player started: %s" % file
+
+        self.logger.info('Play next: %s' % file)
+
+        return s
+
+    def queue_list(self):
+
+        current = None
+
+        if self.queue_thread is not None and self.queue_thread.running:
+            current = self.queue_thread.midi_file
+
+        return jsonify({"current": current, "items": self.queue.as_list()})
+
+    def queue_add(self, file):
+
+        if not os.path.isfile(self.songs.path(file)):
+            return "No such song: %s" % file, 404
+
+        self.queue.add(file)
+        self.start_queue()
+
+        return "Queued: %s" % file
+
+    def queue_remove(self, idx):
+
+        if not self.queue.remove(idx):
+            return "No such queue entry: %d" % idx, 404
+
+        return "Removed from queue: %d" % idx
+
+    def queue_clear(self):
+
+        self.queue.clear()
+
+        return "Queue cleared"
+
+    def skip(self):
+
+        if self.queue_thread is None or not self.queue_thread.running:
+            return "Player already stopped"
+
+        self.queue_thread.skip()
+        self.logger.info('Skipped song')
+
+        return "Skipped"
+
+    def seek(self, pos):
+
+        p = self.current_player()
+
+        if p is None or not p.playing:
+            return "Player stopped"
+
+        try:
+            p.scheduler.seek(library.parse_time(pos))
+        except ValueError:
+            return "Invalid position: %s" % pos, 400
+
+        self.logger.info('Seek to: %s' % pos)
+
+        return "Seek to: %s" % pos
+
+    def tempo(self, tempo):
+
+        # the current song changes right away, the next ones start with it
+        try:
+            value = library.parse_tempo(tempo)
+            p = self.current_player()
+
+            if p is not None:
+                p.scheduler.set_tempo(value)
+
+            self.queue.tempo = value
+        except ValueError:
+            return "Invalid tempo: %s" % tempo, 400
+
+        self.logger.info('Tempo: %s' % tempo)
+
+        return "Tempo: %s" % tempo
+
+    def loop(self, start, end):
+
+        p = self.current_player()
+
+        if p is None or not p.playing:
+            return "Player stopped"
+
+        try:
+            p.scheduler.set_loop(library.parse_time(start),
+                                 library.parse_time(end))
+        except ValueError:
+            return "Invalid loop: %s - %s" % (start, end), 400
+
+        self.logger.info('Loop: %s - %s' % (start, end))
+
+        return "Loop: %s - %s" % (start, end)
+
+    def loop_clear(self):
+
+        p = self.current_player()
+
+        if p is not None:
+            p.scheduler.set_loop()
+
+        return "Loop cleared"
+
+    def delete(self, file):
+
+        self.songs.delete(file)
+        self.hub.publish("songs", self.songs.names())
+
+        return redirect(url_for('root'))
+
+    def stop(self):
+        if self.queue_thread is None or not self.queue_thread.running:
+            s = "Player already stopped"
+        else:
+            self.queue_thread.stop()
+            s = "Player stopped"
+            self.logger.info('Stopped playing')
+
+        return s
+
+    def state(self):
+
+        s = {
+            "file": None,
+            "playing": False,
+            "length": 0,
+            "time": 0,
+            "mirror": False,
+            "tempo": self.queue.tempo,
+            "loop": None
+        }
+
+        p = self.current_player()
+
+        if p is not None and p.playing:
+            s["playing"] = True
+            s["file"] = self.queue_thread.midi_file
+            s["time"] = int(p.scheduler.position)
+            s["length"] = int(self.queue_thread.length)
+            s["mirror"] = p.ch_mirror
+            s["tempo"] = p.scheduler.tempo
+            s["loop"] = p.scheduler.loop
+
+        return s
+
+    def current_player(self):
+
+        if self.queue_thread is None:
+            return None
+
+        return self.queue_thread.player
+
+    def sample(self):
+
+        p = self.current_player()
+
+        if p is None:
+            drives = 0
+        else:
+            drives = library.drives(p)
+
+        return [("status", self.state()),
+                ("notes", self.notes.as_list(drives))]
+
+    def status(self):
+
+        s = self.state()
+        s["lateness"] = None
+
+        p = self.current_player()
+
+        if s["playing"] and p is not None:
+            s["lateness"] = p.stats.as_dict()
+
+        return jsonify(s)
+
+    def metrics(self):
+
+        if not metrics.enabled():
+            return "Metrics disabled (start with --metrics)", 404
+
+        return Response(metrics.REGISTRY.expose(),
+                        mimetype="text/plain; version=0.0.4")
+
+    def events(self):
+
+        def stream():
+
+            seen = {}
+
+            while True:
+                changes = self.hub.wait(seen, 15)
+
+                if not len(changes):
+                    yield status.SSE_KEEPALIVE
+
+                for topic, data in changes:
+                    yield status.sse_event(topic, data)
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
@@ -11,9 +11,10 @@ setup(
     url='https://www.kaltpost.de/',
     requires=[
       "Flask (>=0.12)",
-      "pyserial (>=3.0.0)", 'flask', 'mido'
+      "pyserial (>=3.0.0)", 'flask', 'mido', 'numpy'
     ],
     packages=['moppy'],
     package_data={'moppy': ['templates/*']},
-    scripts=['moppy-player', 'moppy-server', 'moppy-proxy']
+    scripts=['moppy-player', 'moppy-server', 'moppy-proxy',
+             'moppy-render']
 )
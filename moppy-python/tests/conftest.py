@@ -0,0 +1,31 @@
+import shutil
+import glob
+import sys
+import os
+
+import pytest
+
+# the tests run against the sources, like the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+SAMPLE_SONGS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "moppy-desk", "samplesongs")
+
+
+@pytest.fixture
+def sample_songs():
+    return sorted(glob.glob(os.path.join(SAMPLE_SONGS, "*.mid")))
+
+
+@pytest.fixture
+def home(tmp_path, sample_songs):
+
+    # a home dir with the sample songs in the server's library
+    songs = tmp_path / ".moppy" / "songs"
+    songs.mkdir(parents=True)
+
+    for path in sample_songs:
+        shutil.copy(path, str(songs))
+
+    return str(tmp_path)
@@ -0,0 +1,57 @@
+import mido
+
+from moppy import analysis
+
+
+def counts(midi):
+
+    # how Player.analyze always counted
+    stats = {"channels": {}, "octaves": {}}
+
+    for msg in midi:
+        if not msg.is_meta and msg.type == 'note_on':
+            stats["channels"][msg.channel] = \
+                stats["channels"].get(msg.channel, 0) + 1
+
+            octave = msg.note // 12 - 1
+            stats["octaves"][octave] = stats["octaves"].get(octave, 0) + 1
+
+    return stats
+
+
+def song():
+
+    midi = mido.MidiFile()
+
+    # notes of both tracks on the same ticks, velocity 0 note_ons as offs
+    midi.tracks.append(mido.MidiTrack([
+        mido.Message('note_on', channel=5, note=40, velocity=0, time=0),
+        mido.Message('note_on', channel=5, note=40, velocity=64, time=10),
+        mido.Message('note_off', channel=5, note=40, time=10),
+        mido.Message('note_on', channel=2, note=90, velocity=0, time=0)]))
+    midi.tracks.append(mido.MidiTrack([
+        mido.Message('note_on', channel=3, note=60, velocity=64, time=0),
+        mido.Message('note_on', channel=3, note=60, velocity=0, time=10),
+        mido.Message('note_on', channel=2, note=62, velocity=64, time=0)]))
+
+    return midi
+
+
+def test_counts_as_player(sample_songs):
+
+    for midi in [song()] + [mido.MidiFile(s) for s in sample_songs]:
+        stats = analysis.analyze(midi)
+        expected = counts(midi)
+
+        for key in ("channels", "octaves"):
+            assert list(stats[key].items()) == \
+                list(expected[key].items())
+
+
+def test_sounding_counts():
+
+    stats = analysis.analyze(song())
+
+    assert stats["sounding_channels"] == {3: 1, 5: 1, 2: 1}
+    assert stats["sounding_octaves"] == {4: 2, 2: 1}
+    assert stats["notes"] == 3
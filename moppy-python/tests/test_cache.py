@@ -0,0 +1,97 @@
+import shutil
+import os
+
+import mido
+
+import pytest
+
+from moppy import cache, player, render, library
+
+
+def fields(events):
+
+    return [(e.time, e.msg.type, e.msg.channel, e.msg.note, e.msg.velocity,
+             e.data, e.update, e.pitch) for e in events]
+
+
+@pytest.mark.parametrize("port", [player.NullPort, render.RenderPort])
+def test_load_as_compiled(tmp_path, sample_songs, port):
+
+    songs = cache.SongCache(str(tmp_path))
+
+    for song in sample_songs:
+        p = player.Player(port(), ch_max=4)
+
+        compiled = songs.schedule(song, p)
+        loaded = songs.schedule(song, p)
+
+        assert loaded is not compiled
+        assert loaded.length == compiled.length
+        assert fields(loaded.events) == fields(compiled.events)
+
+
+def test_plain_ports_get_mido_messages(tmp_path, sample_songs):
+
+    songs = cache.SongCache(str(tmp_path))
+    p = player.Player(mido.ports.BaseOutput(), ch_max=4)
+
+    songs.schedule(sample_songs[0], p)
+    loaded = songs.schedule(sample_songs[0], p)
+
+    assert all(isinstance(e.data, mido.Message) for e in loaded.events)
+
+
+def test_library_uses_index_analysis(home, monkeypatch):
+
+    songs = library.SongLibrary(home)
+    songs.update_index(1)
+
+    def analyze(*args):
+        raise AssertionError("analysed again")
+
+    monkeypatch.setattr(player.Player, "analyze", analyze)
+
+    p = library.make_player(player.NullPort())
+    schedule, _ = songs.load(p, "Tetris.mid")
+
+    assert len(schedule.events)
+
+
+@pytest.mark.parametrize("voices", [None, "affinity"])
+def test_library_voices_opt_in(home, voices):
+
+    # KirbysTheme has chords within a channel, but few enough channels to
+    # be mirrored over the drives unless voices are asked for
+    songs = library.SongLibrary(home, voices)
+
+    p = library.make_player(player.NullPort())
+    _, mirror = songs.load(p, "KirbysTheme.mid")
+
+    assert p.voices == voices
+    assert mirror == (voices is None)
+
+
+class Upload:
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, dst):
+        shutil.copy(self.path, dst)
+
+
+def test_library_upload_over_song(home, sample_songs):
+
+    songs = library.SongLibrary(home)
+
+    songs.add("Song.mid", Upload(sample_songs[0]))
+    entries = set(os.listdir(songs.cache.cache_dir))
+
+    assert len(entries)
+
+    # the entries of the song replaced are gone, only the new ones remain
+    songs.add("Song.mid", Upload(sample_songs[1]))
+    replaced = set(os.listdir(songs.cache.cache_dir))
+
+    assert len(replaced) == len(entries)
+    assert not entries & replaced
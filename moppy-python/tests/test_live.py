@@ -0,0 +1,57 @@
+import threading
+import time
+
+import mido
+
+from moppy import live, render
+
+
+class SlowPort(render.RenderPort):
+
+    def send_encoded(self, data):
+
+        time.sleep(0.005)
+        render.RenderPort.send_encoded(self, data)
+
+
+def play(port, messages):
+
+    p = live.LivePlayer(port, ch_max=4)
+    runner = threading.Thread(target=p.run)
+    runner.start()
+
+    for msg in messages:
+        p.receive(msg)
+
+    time.sleep(0.2)
+    p.stop()
+    runner.join(2.0)
+
+    assert not runner.is_alive()
+
+    return p
+
+
+def test_notes_go_to_drives():
+
+    port = render.RenderPort()
+    p = play(port, [mido.Message('note_on', channel=0, note=60),
+                    mido.Message('note_on', channel=0, note=64),
+                    mido.Message('note_off', channel=0, note=60)])
+
+    played = [(c.drive, c.note) for c in port.commands]
+
+    assert played[:3] == [(0, 60), (1, 64), (0, None)]
+    assert len(p.latency) == 3
+
+
+def test_latency_includes_waiting():
+
+    # ten messages arriving at once, the last one waits for the others
+    port = SlowPort()
+    p = play(port, [mido.Message('note_on', channel=0, note=60 + i)
+                    for i in range(10)])
+
+    assert len(p.latency) == 10
+    assert p.latency.max >= 0.045
+    assert p.latency.min < p.latency.max
@@ -0,0 +1,50 @@
+from moppy import proxy
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_jitter_buffer_timing():
+
+    clock = Clock()
+    buffer = proxy.JitterBuffer(delay=0.05, clock=clock)
+
+    # the second datagram took 20ms longer, it is held back less
+    buffer.put(0.0, [b"a"])
+    clock.now += 0.03
+    buffer.put(0.01, [b"b"])
+
+    assert buffer.offset == 100.0
+    assert buffer.pop() == []
+
+    clock.now = 100.05
+    assert buffer.pop() == [b"a"]
+
+    clock.now = 100.06
+    assert buffer.pop() == [b"b"]
+
+
+def test_jitter_buffer_drift():
+
+    clock = Clock()
+    buffer = proxy.JitterBuffer(delay=0.05, window=1.0, clock=clock)
+
+    # the receiver's clock runs 1% faster than the sender's, without
+    # following it frames would be late after 5 seconds
+    for i in range(1000):
+        sent = i * 0.01
+        clock.now = 100.0 + sent * 1.01
+        buffer.put(sent, [b"x"])
+        buffer.pop()
+
+    # held back by the delay, less the drift within the window
+    hold = sent + buffer.offset + buffer.delay - clock.now
+
+    assert 0.05 - 0.011 < hold <= 0.05
+    assert buffer.stats["late"] == 0
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from moppy import render, player
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# golden directory -> moppy-render options the timelines were rendered with,
+# after a change altering them on purpose they are written again with e.g.
+#
+#   moppy-render --optimize --fine -o tests/golden/optimize \
+#       ../moppy-desk/samplesongs
+OPTIONS = {
+    "default": [],
+    "optimize": ["--optimize", "--fine"],
+    "mirror": ["--chmirror", "--chmax", "2"]
+}
+
+
+@pytest.mark.parametrize("golden", sorted(OPTIONS))
+def test_golden(golden, sample_songs):
+
+    assert len(sample_songs)
+
+    options = render.make_options(render.parse_args(OPTIONS[golden] +
+                                                    sample_songs))
+
+    for song in sample_songs:
+        timeline, error = render.render_song(song, options)
+
+        assert error is None
+
+        name = os.path.splitext(os.path.basename(song))[0] + ".txt"
+
+        with open(os.path.join(GOLDEN, golden, name)) as f:
+            assert timeline == f.read(), "%s differs" % name
+
+
+def test_render_port_only():
+
+    p = player.Player(player.NullPort())
+
+    with pytest.raises(ValueError):
+        render.render(p)
@@ -0,0 +1,236 @@
+import threading
+import struct
+import time
+import tty
+import pty
+import os
+
+import pytest
+
+from moppy import serialout
+
+
+class Firmware(threading.Thread):
+
+    def __init__(self, commands=()):
+        threading.Thread.__init__(self, daemon=True)
+
+        # the output writes to the slave end like to an Arduino, control
+        # frames of the commands given are confirmed like by the firmware
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+
+        self.commands = commands
+        self.data = bytearray()
+        self.cond = threading.Condition()
+
+        self.start()
+
+    @property
+    def name(self):
+        return os.ttyname(self.slave)
+
+    def ready(self, delay=0.05):
+
+        # like after the reset caused by opening the port
+        threading.Timer(delay, os.write, (self.master,
+                                          serialout.ACK)).start()
+
+    def run(self):
+
+        checked = 0
+
+        while True:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+
+            with self.cond:
+                self.data += data
+                self.cond.notify_all()
+
+            while checked + serialout.FRAME_SIZE <= len(self.data):
+                frame = self.data[checked:checked + serialout.FRAME_SIZE]
+                checked += serialout.FRAME_SIZE
+
+                if frame[0] == serialout.CONTROL and \
+                        frame[1] in self.commands:
+                    os.write(self.master, serialout.ACK)
+
+    def frames(self, count, timeout=2.0):
+
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.data) >=
+                               count * serialout.FRAME_SIZE, timeout)
+
+            return [bytes(self.data[i:i + serialout.FRAME_SIZE])
+                    for i in range(0, len(self.data), serialout.FRAME_SIZE)]
+
+    def close(self):
+
+        os.close(self.master)
+        os.close(self.slave)
+        self.join()
+
+
+@pytest.fixture
+def firmware():
+
+    f = Firmware()
+
+    yield f
+
+    f.close()
+
+
+def on(pin, period):
+    return struct.pack("!BH", pin, period)
+
+
+def off(pin):
+    return struct.pack("!BH", pin, 0)
+
+
+RESET = bytes([serialout.CONTROL, 0, 0])
+
+
+def test_coalescing(firmware):
+
+    out = serialout.SerialOutput(firmware.name)
+
+    # holding the lock keeps the writer from taking frames meanwhile
+    with out.cond:
+        out.write(on(2, 100) + on(4, 300))
+        out.write(on(2, 200))
+        out.write(on(2, 250))
+
+    assert out.flush(2.0)
+    out.close()
+
+    assert firmware.frames(2) == [on(2, 250), on(4, 300)]
+    assert (out.queued, out.coalesced, out.written) == (2, 2, 2)
+
+
+def test_priority_order(firmware):
+
+    out = serialout.SerialOutput(firmware.name)
+
+    # offs go out before ons, each in the order they came
+    with out.cond:
+        out.write(on(2, 100) + off(4) + on(6, 300) + off(8))
+
+        # an off replacing an on keeps the place in line of the on
+        out.write(off(6))
+
+    out.close()
+
+    assert firmware.frames(4) == [off(4), off(6), off(8), on(2, 100)]
+
+
+def test_reset_drops_pending(firmware):
+
+    out = serialout.SerialOutput(firmware.name)
+
+    with out.cond:
+        out.write(on(2, 100) + on(4, 200))
+        out.write(RESET)
+        out.write(on(6, 300))
+
+    out.close()
+
+    assert firmware.frames(2) == [RESET, on(6, 300)]
+    assert out.coalesced == 2
+
+
+def test_full_queue_blocks_new_pins_only(firmware):
+
+    out = serialout.SerialOutput(firmware.name, maxsize=2)
+    blocked = threading.Event()
+
+    with out.cond:
+        out.write(on(2, 100) + on(4, 200))
+
+        # a pin already pending is replaced even with the queue full
+        out.write(on(2, 150))
+
+        def put():
+            out.write(on(6, 300))
+            blocked.set()
+
+        threading.Thread(target=put, daemon=True).start()
+
+        # the writer is held here, so the new pin has to wait
+        assert not blocked.wait(0.1)
+
+    assert blocked.wait(2.0)
+    out.close()
+
+    assert firmware.frames(3) == [on(2, 150), on(4, 200), on(6, 300)]
+
+
+def test_baud_switch():
+
+    firmware = Firmware(commands=(serialout.CMD_BAUD,))
+    firmware.ready()
+
+    try:
+        out = serialout.SerialOutput(firmware.name, baudrate=115200,
+                                     timeout=1.0)
+        out.write(on(2, 100))
+        out.close()
+
+        assert out.serial.baudrate == 115200
+        assert firmware.frames(2) == [
+            bytes([serialout.CONTROL, serialout.CMD_BAUD,
+                   serialout.BAUD_RATES.index(115200)]), on(2, 100)]
+    finally:
+        firmware.close()
+
+
+def test_baud_fallback(firmware):
+
+    # old firmware does not confirm and stays at the default rate
+    firmware.ready()
+
+    start = time.monotonic()
+    out = serialout.SerialOutput(firmware.name, baudrate=115200,
+                                 timeout=0.3)
+
+    assert time.monotonic() - start < 1.0
+    assert out.serial.baudrate == serialout.DEFAULT_BAUDRATE
+
+    out.write(on(2, 100))
+    out.close()
+
+    assert firmware.frames(2)[-1] == on(2, 100)
+
+
+def test_unsupported_baud(firmware):
+
+    with pytest.raises(ValueError):
+        serialout.SerialOutput(firmware.name, baudrate=12345, timeout=0.1)
+
+
+def test_fine():
+
+    firmware = Firmware(commands=(serialout.CMD_FINE,))
+    firmware.ready()
+
+    try:
+        out = serialout.SerialOutput(firmware.name, fine=True, timeout=1.0)
+        out.close()
+
+        assert out.fine
+    finally:
+        firmware.close()
+
+
+def test_fine_fallback(firmware):
+
+    firmware.ready()
+
+    out = serialout.SerialOutput(firmware.name, fine=True, timeout=0.3)
+    out.close()
+
+    assert not out.fine
@@ -0,0 +1,263 @@
+import threading
+import asyncio
+import json
+import time
+
+import pytest
+
+from moppy import aserver, webapp, player
+
+
+class AsgiClient:
+
+    def __init__(self, home):
+
+        self.app = aserver.AsgiApp(home_dir=home, output=player.NullPort())
+
+        # the app lives on its own event loop, like under an ASGI server
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+
+        self.call(self.lifespan("lifespan.startup"))
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(10)
+
+    async def lifespan(self, message):
+
+        if message == "lifespan.startup":
+            self.inbox = asyncio.Queue()
+            self.outbox = asyncio.Queue()
+            self.task = asyncio.ensure_future(self.app(
+                {"type": "lifespan"}, self.inbox.get, self.outbox.put))
+
+        await self.inbox.put({"type": message})
+
+        return (await self.outbox.get())["type"]
+
+    async def request(self, path):
+
+        sent = []
+        path, _, query = path.partition("?")
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app({"type": "http", "method": "GET", "path": path,
+                        "query_string": query.encode(), "headers": []},
+                       receive, send)
+
+        return sent[0]["status"], b"".join(m.get("body", b"")
+                                          for m in sent[1:])
+
+    def get(self, path):
+        return self.call(self.request(path))
+
+    def close(self):
+
+        self.call(self.lifespan("lifespan.shutdown"))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class FlaskClient:
+
+    def __init__(self, home):
+
+        self.app = webapp.FlaskApp(home_dir=home, output=player.NullPort())
+        self.app.start()
+        self.client = self.app.app.test_client()
+
+    def get(self, path):
+
+        response = self.client.get(path)
+
+        return response.status_code, response.data
+
+    def close(self):
+        self.app.shutdown()
+
+
+@pytest.fixture(params=[AsgiClient, FlaskClient], ids=["asgi", "flask"])
+def client(request, home):
+
+    c = request.param(home)
+
+    yield c
+
+    c.close()
+
+
+def status(client):
+
+    code, body = client.get("/status")
+    assert code == 200
+
+    return json.loads(body)
+
+
+def wait_for(predicate, timeout=10.0):
+
+    end = time.monotonic() + timeout
+
+    while time.monotonic() < end:
+        if predicate():
+            return True
+
+        time.sleep(0.001)
+
+    return False
+
+
+def test_status_stopped(client):
+
+    s = status(client)
+
+    assert not s["playing"]
+    assert s["file"] is None
+    assert s["lateness"] is None
+
+
+def test_play(client):
+
+    code, body = client.get("/play/Tetris.mid")
+
+    assert code == 200
+    assert body == b"Player started: Tetris.mid"
+    assert wait_for(lambda: status(client)["playing"])
+
+    s = status(client)
+
+    assert s["file"] == "Tetris.mid"
+    assert s["length"] > 0
+    assert s["tempo"] == 1.0
+    assert "p99" in s["lateness"]
+
+
+def test_stop(client):
+
+    client.get("/play/Tetris.mid")
+    assert wait_for(lambda: status(client)["playing"])
+
+    start = time.monotonic()
+    code, body = client.get("/stop")
+
+    assert code == 200
+    assert body == b"Player stopped"
+
+    # the scheduler wakes up right away, not with the next event
+    assert wait_for(lambda: not status(client)["playing"], 1.0)
+    assert time.monotonic() - start < 0.1
+
+    assert client.get("/stop")[1] == b"Player already stopped"
+
+
+def test_skip(client):
+
+    assert client.get("/skip")[1] == b"Player already stopped"
+
+    client.get("/queue/add/KirbysTheme.mid")
+    client.get("/queue/add/Tetris.mid")
+
+    assert wait_for(lambda: status(client)["file"] == "KirbysTheme.mid")
+
+    code, body = client.get("/skip")
+
+    assert code == 200
+    assert body == b"Skipped"
+    assert wait_for(lambda: status(client)["file"] == "Tetris.mid", 1.0)
+
+    code, body = client.get("/queue")
+
+    assert json.loads(body) == {"current": "Tetris.mid", "items": []}
+
+
+def test_not_found(client):
+
+    assert client.get("/queue/add/Missing.mid")[0] == 404
+    assert client.get("/tempo/fast")[0] == 400
+
+
+def test_events(home):
+
+    c = AsgiClient(home)
+    sent = []
+
+    async def events():
+
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+            if message.get("body"):
+                disconnected.set()
+
+        await c.app({"type": "http", "method": "GET", "path": "/events",
+                     "query_string": b"", "headers": []}, receive, send)
+
+    try:
+        c.call(events())
+    finally:
+        c.close()
+
+    assert sent[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream") in sent[0]["headers"]
+    assert sent[1]["body"].startswith(b"event: ")
+
+
+class FailingPort(player.NullPort):
+
+    def __init__(self):
+        player.NullPort.__init__(self)
+
+        self.failed = False
+
+    def send_encoded(self, data):
+
+        # like a serial device unplugged while playing the first song
+        if not self.failed:
+            self.failed = True
+            raise OSError("device disconnected")
+
+
+def test_play_after_port_error(home):
+
+    app = webapp.FlaskApp(home_dir=home, output=FailingPort())
+    app.start()
+    client = app.app.test_client()
+
+    try:
+        client.get("/play/Tetris.mid")
+        assert wait_for(lambda: app.queue.port.failed)
+        assert wait_for(lambda: not app.queue_thread.running)
+
+        # the failed song is logged and a new one plays
+        client.get("/play/Tetris.mid")
+        assert wait_for(lambda: json.loads(
+            client.get("/status").data)["playing"])
+    finally:
+        app.shutdown()
+
+
+def test_events_start_with_songs(home):
+
+    c = FlaskClient(home)
+
+    try:
+        # a client connecting gets the list to compare later changes with
+        changes = dict(c.app.hub.changes({}))
+
+        assert "Tetris.mid" in changes["songs"]
+        assert b"var songs = JSON.stringify([" in c.get("/")[1]
+    finally:
+        c.close()
@@ -0,0 +1,70 @@
+import struct
+import errno
+import os
+
+import mido
+import pytest
+
+from moppy import sysfs, player, proxy
+
+
+@pytest.fixture
+def base_path(tmp_path):
+
+    # plain files in place of the entries of the kernel module
+    for attr in sysfs.SysfsFiles.ATTRIBUTES + ["bulk"]:
+        (tmp_path / attr).write_bytes(b"")
+
+    return str(tmp_path) + os.sep
+
+
+def read(base_path, attr):
+
+    with open(base_path + attr, "rb") as f:
+        return f.read()
+
+
+def test_port_drops_missing_drives(base_path):
+
+    port = player.MoppySysfsPort(base_path=base_path)
+
+    port.send_encoded(port.encode(mido.Message("note_on", channel=1,
+                                               note=69)))
+    port.send_encoded(port.encode(mido.Message("note_on", channel=9,
+                                               note=72)))
+    port.send_encoded(port.encode(mido.Message("note_off", channel=12,
+                                               note=72)))
+    port.flush()
+    port.close()
+
+    assert read(base_path, "bulk") == b"n 1, 69"
+
+
+def test_writer_skips_invalid_pins(base_path):
+
+    writer = proxy.SysfsWriter(base_path)
+    writer.write_msg(b"".join(struct.pack("!BH", pin, 28)
+                              for pin in (0, 1, 2, 16, 18, 255)))
+    writer.files.close()
+
+    assert read(base_path, "bulk") == b"t 0, 28\nt 7, 28"
+
+
+def test_write_invalid_keeps_handle(base_path, monkeypatch):
+
+    files = sysfs.SysfsFiles(base_path)
+    files.open()
+    fd = files.fds["bulk"] = os.open(base_path + "bulk", os.O_WRONLY)
+
+    def write(fd, data):
+        raise OSError(errno.EINVAL, "Invalid argument")
+
+    monkeypatch.setattr(sysfs.os, "write", write)
+
+    # rejected data is dropped, only a stale handle is reopened
+    files.write("bulk", b"x")
+
+    assert files.fds["bulk"] == fd
+
+    monkeypatch.undo()
+    files.close()